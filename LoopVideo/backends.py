@@ -0,0 +1,288 @@
+"""Các backend giải mã video (OpenCV, ffmpeg, moviepy), chỉ import khi dùng lần đầu.
+
+Mỗi backend mở video thành một reader cùng giao diện kiểu cv2.VideoCapture:
+
+    reader = open_video(path)      # backend mặc định: VIDEOLOOP_BACKEND hoặc cái đầu tiên có sẵn
+    reader.seek(frame); reader.grab(); ok, frame_bgr = reader.read(); reader.release()
+
+Kiểm tra backend có sẵn chỉ dùng importlib.util.find_spec, không import thư
+viện, nên app khởi động không phải nạp cv2/numpy/moviepy.
+
+resize_area, bgr_to_rgb và bgr_to_gray xử lý frame bằng OpenCV nếu có, không
+thì bằng numpy, để preview và tìm điểm loop chạy được với mọi backend.
+"""
+import abc
+import importlib
+import importlib.util
+import os
+import shutil
+import subprocess
+import threading
+
+from ffmpeg_utils import FFMPEG
+
+DEFAULT_ORDER = tuple(
+    name.strip()
+    for name in os.environ.get("VIDEOLOOP_BACKEND", "opencv,ffmpeg,moviepy").split(",")
+    if name.strip()
+)
+
+
+class BackendError(Exception):
+    pass
+
+
+class Backend(abc.ABC):
+    """Một backend: danh sách module cần có và cách mở reader"""
+
+    name = None
+    modules = ()
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._loaded = None
+
+    def available(self):
+        return all(importlib.util.find_spec(name) is not None for name in self.modules)
+
+    def load(self):
+        """Import các module của backend (một lần), trả về dict tên → module"""
+        if self._loaded is None:
+            with self._lock:
+                if self._loaded is None:
+                    self._loaded = {name: importlib.import_module(name) for name in self.modules}
+        return self._loaded
+
+    @abc.abstractmethod
+    def open(self, path, fps=None):
+        """Mở video, trả về reader có seek/grab/read/release và thuộc tính fps"""
+
+
+class OpenCVReader:
+    def __init__(self, cv2, path, fps=None):
+        self._cv2 = cv2
+        self._cap = cv2.VideoCapture(path)
+        if not self._cap.isOpened():
+            raise IOError(f"Không mở được video: {path}")
+        self.fps = fps or self._cap.get(cv2.CAP_PROP_FPS) or 30
+
+    def seek(self, frame):
+        self._cap.set(self._cv2.CAP_PROP_POS_FRAMES, frame)
+
+    def grab(self):
+        return self._cap.grab()
+
+    def read(self):
+        return self._cap.read()
+
+    def release(self):
+        self._cap.release()
+
+
+class OpenCVBackend(Backend):
+    name = "opencv"
+    modules = ("cv2",)
+
+    def open(self, path, fps=None):
+        return OpenCVReader(self.load()["cv2"], path, fps)
+
+
+class FFmpegReader:
+    """Đọc frame BGR thô từ tiến trình ffmpeg qua pipe; seek = chạy lại với -ss chính xác"""
+
+    def __init__(self, np, path, fps=None):
+        from media_index import load_index
+
+        index = load_index(path)
+        self._np = np
+        self._path = path
+        self._process = None
+        self.fps = fps or index.fps
+        self.width = index.width
+        self.height = index.height
+        self._frame_bytes = self.width * self.height * 3
+        if self._frame_bytes <= 0:
+            raise IOError(f"Không mở được video: {path}")
+        self.seek(0)
+
+    def seek(self, frame):
+        self.release()
+        args = [FFMPEG, "-v", "error", "-nostdin"]
+        if frame > 0:
+            args += ["-ss", f"{frame / self.fps:.6f}"]
+        args += ["-i", self._path, "-map", "0:v:0", "-vf", f"fps={self.fps}",
+                 "-f", "rawvideo", "-pix_fmt", "bgr24", "pipe:1"]
+        self._process = subprocess.Popen(
+            args, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL,
+            bufsize=self._frame_bytes
+        )
+
+    def _read_bytes(self):
+        if self._process is None:
+            return None
+        data = self._process.stdout.read(self._frame_bytes)
+        return data if len(data) == self._frame_bytes else None
+
+    def grab(self):
+        return self._read_bytes() is not None
+
+    def read(self):
+        data = self._read_bytes()
+        if data is None:
+            return False, None
+        frame = self._np.frombuffer(data, dtype=self._np.uint8)
+        return True, frame.reshape(self.height, self.width, 3)
+
+    def release(self):
+        if self._process is not None:
+            self._process.kill()
+            self._process.stdout.close()
+            self._process.wait()
+            self._process = None
+
+
+class FFmpegBackend(Backend):
+    name = "ffmpeg"
+    modules = ("numpy",)
+
+    def available(self):
+        return super().available() and (os.path.isfile(FFMPEG) or shutil.which(FFMPEG) is not None)
+
+    def open(self, path, fps=None):
+        return FFmpegReader(self.load()["numpy"], path, fps)
+
+
+class MoviepyReader:
+    """Đọc frame bằng moviepy (dự phòng khi không có OpenCV và ffmpeg trên PATH)"""
+
+    def __init__(self, editor, path, fps=None):
+        self._clip = editor.VideoFileClip(path, audio=False)
+        self.fps = fps or self._clip.fps or 30
+        self._pos = 0
+
+    def seek(self, frame):
+        self._pos = max(0, int(frame))
+
+    def grab(self):
+        # moviepy đọc theo thời gian, bỏ frame chỉ cần tăng vị trí
+        self._pos += 1
+        return self._pos / self.fps < self._clip.duration
+
+    def read(self):
+        t = self._pos / self.fps
+        if t >= self._clip.duration:
+            return False, None
+        frame = self._clip.get_frame(t)
+        self._pos += 1
+        # moviepy trả RGB, các nơi dùng reader đều mong BGR như OpenCV
+        return True, frame[:, :, ::-1].copy()
+
+    def release(self):
+        self._clip.close()
+
+
+class MoviepyBackend(Backend):
+    name = "moviepy"
+    modules = ("moviepy.editor",)
+
+    def available(self):
+        # moviepy >= 2 không còn moviepy.editor; find_spec module con phải import gói cha trước
+        try:
+            return (importlib.util.find_spec("moviepy") is not None
+                    and importlib.util.find_spec("moviepy.editor") is not None)
+        except ImportError:
+            return False
+
+    def open(self, path, fps=None):
+        return MoviepyReader(self.load()["moviepy.editor"], path, fps)
+
+
+BACKENDS = {backend.name: backend for backend in (OpenCVBackend(), FFmpegBackend(), MoviepyBackend())}
+
+
+def register_backend(backend):
+    BACKENDS[backend.name] = backend
+
+
+def get_backend(name=None):
+    """Backend theo tên, hoặc backend đầu tiên có sẵn theo DEFAULT_ORDER"""
+    if name is not None:
+        if name not in BACKENDS:
+            raise BackendError(f"Không có backend: {name}")
+        return BACKENDS[name]
+    for candidate in DEFAULT_ORDER:
+        backend = BACKENDS.get(candidate)
+        if backend is not None and backend.available():
+            return backend
+    raise BackendError("Không có backend giải mã video nào (cần OpenCV, ffmpeg hoặc moviepy).")
+
+
+def open_video(path, backend=None, fps=None):
+    backend = get_backend(backend)
+    try:
+        return backend.open(path, fps)
+    except ImportError as e:
+        # Thư viện có mặt nhưng không import được (sai phiên bản, thiếu thư viện hệ thống...)
+        raise BackendError(f"Không nạp được backend {backend.name}: {e}")
+
+
+_cv2_module = None
+
+
+def _cv2():
+    """Module cv2 nếu cài được (import một lần), False nếu không có"""
+    global _cv2_module
+    if _cv2_module is None:
+        backend = BACKENDS.get("opencv")
+        try:
+            _cv2_module = backend.load()["cv2"] if backend and backend.available() else False
+        except ImportError:
+            _cv2_module = False
+    return _cv2_module
+
+
+def _area_bins(src, dst):
+    # Mốc bắt đầu và số pixel nguồn của từng pixel đích (thu nhỏ kiểu INTER_AREA)
+    import numpy as np
+
+    starts = (np.arange(dst) * src) // dst
+    counts = np.diff(np.append(starts, src))
+    return starts, np.maximum(counts, 1)
+
+
+def resize_area(frame, size):
+    """Đổi kích thước frame H x W (x C) uint8 về size=(rộng, cao), trung bình theo vùng"""
+    cv2 = _cv2()
+    if cv2:
+        return cv2.resize(frame, size, interpolation=cv2.INTER_AREA)
+    import numpy as np
+
+    width, height = size
+    rows, row_counts = _area_bins(frame.shape[0], height)
+    cols, col_counts = _area_bins(frame.shape[1], width)
+    summed = np.add.reduceat(frame.astype(np.float32), rows, axis=0)
+    summed = np.add.reduceat(summed, cols, axis=1)
+    scale = np.outer(row_counts, col_counts).reshape((height, width) + (1,) * (frame.ndim - 2))
+    return np.rint(summed / scale).astype(np.uint8)
+
+
+def bgr_to_rgb(frame, out=None):
+    """Đảo thứ tự kênh màu; ghi vào out nếu có"""
+    cv2 = _cv2()
+    if cv2:
+        return cv2.cvtColor(frame, cv2.COLOR_BGR2RGB, dst=out)
+    if out is None:
+        return frame[:, :, ::-1].copy()
+    out[...] = frame[:, :, ::-1]
+    return out
+
+
+def bgr_to_gray(frame):
+    """Ảnh xám uint8 theo cùng hệ số với cv2.COLOR_BGR2GRAY"""
+    cv2 = _cv2()
+    if cv2:
+        return cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
+    import numpy as np
+
+    gray = frame[:, :, 0] * 0.114 + frame[:, :, 1] * 0.587 + frame[:, :, 2] * 0.299
+    return np.rint(gray).astype(np.uint8)
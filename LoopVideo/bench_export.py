@@ -0,0 +1,128 @@
+"""So sánh thời gian export giữa chế độ stream_loop và concat trên thời lượng dài.
+
+    python bench_export.py --clip-seconds 3 --targets 10 60 600
+    python bench_export.py --reencode 1280x720 --clip-seconds 20 --targets 10 60
+
+Với --reencode, so sánh mã hóa lại song song theo chunk (kể cả cache đơn vị)
+với một lần mã hóa lại toàn bộ đầu ra bằng một tiến trình ffmpeg.
+"""
+import argparse
+import json
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+from ffmpeg_utils import probe_duration
+from loop_engine import EXPORT_MODES, export_loop, export_stream_loop
+from reencode import EncodeProfile, build_reencoded_unit, export_naive_reencode
+from synthetic import make_test_clip
+
+
+def bench_mode(clip, clip_duration, mode, target_minutes, work_dir):
+    target_seconds = target_minutes * 60
+    output = os.path.join(work_dir, f"out_{mode}_{target_minutes:g}.mp4")
+    start = time.perf_counter()
+    export_loop(clip, target_seconds, output, mode=mode, source_duration=clip_duration)
+    elapsed = time.perf_counter() - start
+    actual = probe_duration(output)
+    result = {
+        "mode": mode,
+        "target_minutes": target_minutes,
+        "loops": target_seconds / clip_duration,
+        "wall_seconds": elapsed,
+        "realtime_factor": target_seconds / max(elapsed, 1e-9),
+        "output_seconds": actual,
+        "duration_error": actual - target_seconds,
+        "output_bytes": os.path.getsize(output),
+    }
+    os.remove(output)
+    return result
+
+
+def bench_reencode(clip, profile, target_minutes, work_dir, workers=None):
+    target_seconds = target_minutes * 60
+    cache_dir = os.path.join(work_dir, "unit_cache")
+    results = []
+
+    output = os.path.join(work_dir, f"out_naive_{target_minutes:g}.mp4")
+    start = time.perf_counter()
+    export_naive_reencode(clip, target_seconds, output, profile)
+    naive = time.perf_counter() - start
+    os.remove(output)
+    results.append({"mode": "naive_reencode", "target_minutes": target_minutes, "wall_seconds": naive})
+
+    for label in ("reencode", "reencode_cached"):
+        output = os.path.join(work_dir, f"out_{label}_{target_minutes:g}.mp4")
+        start = time.perf_counter()
+        stats = build_reencoded_unit(clip, None, profile, workers=workers, cache_dir=cache_dir)
+        export_stream_loop(stats.unit_path, target_seconds, output)
+        elapsed = time.perf_counter() - start
+        os.remove(output)
+        results.append({
+            "mode": label,
+            "target_minutes": target_minutes,
+            "wall_seconds": elapsed,
+            "encode_seconds": stats.encode_seconds,
+            "chunks": stats.chunks,
+            "speedup_vs_naive": naive / max(elapsed, 1e-9),
+        })
+    shutil.rmtree(cache_dir, ignore_errors=True)
+    return results
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark các chế độ export loop")
+    parser.add_argument("--clip-seconds", type=float, default=3.0)
+    parser.add_argument("--size", default="640x360")
+    parser.add_argument("--fps", type=int, default=30)
+    parser.add_argument("--targets", type=float, nargs="+", default=[10, 60, 600],
+                        help="Các thời lượng đích (phút)")
+    parser.add_argument("--modes", nargs="+", choices=EXPORT_MODES, default=["stream_loop", "concat"])
+    parser.add_argument("--reencode", metavar="WxH",
+                        help="So sánh chế độ reencode với mã hóa lại một lượt ở độ phân giải này")
+    parser.add_argument("--encode-workers", type=int, default=None)
+    parser.add_argument("--json", help="Ghi kết quả ra file JSON")
+    args = parser.parse_args(argv)
+
+    work_dir = tempfile.mkdtemp(prefix="videoloop_bench_")
+    try:
+        clip = make_test_clip(
+            os.path.join(work_dir, "clip.mp4"),
+            duration=args.clip_seconds, size=args.size, fps=args.fps
+        )
+        clip_duration = probe_duration(clip)
+        results = []
+        if args.reencode:
+            width, height = EncodeProfile.parse_size(args.reencode)
+            profile = EncodeProfile(width=width, height=height)
+            print(f"{'mode':<16} {'phút':>8} {'wall(s)':>9} {'nhanh hơn':>10}")
+            for target in args.targets:
+                for r in bench_reencode(clip, profile, target, work_dir, args.encode_workers):
+                    results.append(r)
+                    speedup = r.get("speedup_vs_naive")
+                    print(
+                        f"{r['mode']:<16} {r['target_minutes']:>8g} {r['wall_seconds']:>9.2f} "
+                        f"{(f'{speedup:.1f}x' if speedup else '-'):>10}"
+                    )
+        else:
+            print(f"{'mode':<12} {'phút':>8} {'lần lặp':>9} {'wall(s)':>9} {'x realtime':>11} {'lệch(s)':>9}")
+            for target in args.targets:
+                for mode in args.modes:
+                    r = bench_mode(clip, clip_duration, mode, target, work_dir)
+                    results.append(r)
+                    print(
+                        f"{r['mode']:<12} {r['target_minutes']:>8g} {r['loops']:>9.0f} "
+                        f"{r['wall_seconds']:>9.2f} {r['realtime_factor']:>11.0f} {r['duration_error']:>9.3f}"
+                    )
+        if args.json:
+            with open(args.json, "w", encoding="utf-8") as f:
+                json.dump({"clip_seconds": clip_duration, "results": results}, f, indent=2)
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,156 @@
+"""Đo thời gian khởi động app: thời gian import và thời gian tới khi cửa sổ đầu tiên hiện ra.
+
+    python bench_startup.py --runs 5
+    python bench_startup.py --runs 10 --budget-ms 800 --import-budget-ms 300 --json startup.json
+
+Mỗi lần đo chạy một trình thông dịch Python mới nên giống một lần mở app.
+Thời gian import được trừ đi thời gian khởi động Python trống. Trả mã lỗi 1
+khi trung vị vượt ngân sách, hoặc khi một backend nặng (cv2, numpy, PIL,
+moviepy...) bị nạp trước khi cửa sổ hiện ra. Trả mã 2 khi có --budget-ms mà
+không đo được thời gian tới cửa sổ (ví dụ không có DISPLAY), để ngân sách
+không bị coi là đạt khi chưa được kiểm tra.
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+
+# Các module không được nạp trước khi cửa sổ đầu tiên hiện ra
+HEAVY_MODULES = ("cv2", "numpy", "PIL", "moviepy", "imageio", "imageio_ffmpeg", "proglog", "tqdm")
+
+_IMPORT_SNIPPET = "import videoLoop"
+
+_WINDOW_SNIPPET = f"""
+import sys, tkinter as tk
+import videoLoop
+root = tk.Tk()
+app = videoLoop.VideoLooperApp(root)
+root.update()
+heavy = sorted(m for m in {HEAVY_MODULES!r} if m in sys.modules)
+print("READY " + ",".join(heavy), flush=True)
+root.destroy()
+"""
+
+
+def _run_python(code, extra_args=()):
+    """Chạy code trong trình thông dịch mới, trả về (giây, stdout, stderr)"""
+    start = time.perf_counter()
+    process = subprocess.run(
+        [sys.executable] + list(extra_args) + ["-c", code],
+        cwd=HERE, stdout=subprocess.PIPE, stderr=subprocess.PIPE
+    )
+    elapsed = time.perf_counter() - start
+    if process.returncode != 0:
+        raise RuntimeError(process.stderr.decode("utf-8", errors="replace").strip()[-2000:])
+    return elapsed, process.stdout.decode("utf-8", errors="replace"), process.stderr.decode(
+        "utf-8", errors="replace")
+
+
+def top_imports(limit=10):
+    """Các module videoLoop import trực tiếp, chậm nhất trước (thời gian tích lũy, ms)"""
+    _, _, stderr = _run_python(_IMPORT_SNIPPET, ["-X", "importtime"])
+    entries = []
+    for line in stderr.splitlines():
+        parts = line[len("import time:"):].split("|") if line.startswith("import time:") else []
+        if len(parts) != 3 or not parts[1].strip().isdigit():
+            continue
+        name = parts[2].rstrip()
+        # Mỗi cấp lồng nhau thụt thêm 2 dấu cách
+        depth = (len(name) - len(name.lstrip()) - 1) // 2
+        entries.append((depth, int(parts[1]) / 1000.0, name.strip()))
+    # Module con được in trước module cha: lấy các dòng cấp 1 ngay trước dòng videoLoop
+    rows = []
+    for depth, ms, name in reversed(entries[:next(
+            (i for i, e in enumerate(entries) if e[0] == 0 and e[2] == "videoLoop"), 0)]):
+        if depth == 0:
+            break
+        if depth == 1:
+            rows.append((ms, name))
+    rows.sort(reverse=True)
+    return rows[:limit]
+
+
+def measure(runs):
+    baseline = [_run_python("pass")[0] for _ in range(runs)]
+    imports = [_run_python(_IMPORT_SNIPPET)[0] for _ in range(runs)]
+    result = {
+        "runs": runs,
+        "python_ms": statistics.median(baseline) * 1000,
+        "import_ms": max(0.0, statistics.median(imports) - statistics.median(baseline)) * 1000,
+        "window_ms": None,
+        "heavy_modules": [],
+        "window_error": None,
+    }
+    windows = []
+    try:
+        for _ in range(runs):
+            elapsed, stdout, _ = _run_python(_WINDOW_SNIPPET)
+            line = next((l for l in stdout.splitlines() if l.startswith("READY")), "READY ")
+            heavy = [m for m in line[len("READY "):].split(",") if m]
+            result["heavy_modules"] = sorted(set(result["heavy_modules"]) | set(heavy))
+            windows.append(elapsed)
+        # Tính từ lúc khởi chạy tiến trình tới khi cửa sổ đã vẽ xong (root.update())
+        result["window_ms"] = statistics.median(windows) * 1000
+    except RuntimeError as e:
+        # Thường do không có màn hình (DISPLAY); vẫn báo phần import
+        result["window_error"] = str(e).splitlines()[-1] if str(e) else "lỗi không rõ"
+    return result
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark thời gian khởi động VideoLoop")
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--budget-ms", type=float, default=None,
+                        help="Ngân sách thời gian tới cửa sổ đầu tiên (trung vị, ms)")
+    parser.add_argument("--import-budget-ms", type=float, default=None,
+                        help="Ngân sách thời gian import videoLoop (trung vị, ms)")
+    parser.add_argument("--top", type=int, default=10, help="Số module import chậm nhất cần in")
+    parser.add_argument("--json", help="Ghi kết quả ra file JSON")
+    args = parser.parse_args(argv)
+
+    result = measure(args.runs)
+    result["top_imports"] = [{"module": name, "ms": ms} for ms, name in top_imports(args.top)]
+
+    print(f"Python trống:     {result['python_ms']:8.1f} ms")
+    print(f"Import videoLoop: {result['import_ms']:8.1f} ms")
+    if result["window_ms"] is not None:
+        print(f"Cửa sổ đầu tiên:  {result['window_ms']:8.1f} ms")
+    else:
+        print(f"Cửa sổ đầu tiên:  không đo được ({result['window_error']})")
+    print("Import chậm nhất:")
+    for row in result["top_imports"]:
+        print(f"  {row['ms']:8.1f} ms  {row['module']}")
+
+    failures = []
+    if result["heavy_modules"]:
+        failures.append("backend nặng bị nạp khi khởi động: " + ", ".join(result["heavy_modules"]))
+    if args.import_budget_ms is not None and result["import_ms"] > args.import_budget_ms:
+        failures.append(f"import {result['import_ms']:.0f} ms > {args.import_budget_ms:g} ms")
+    if (args.budget_ms is not None and result["window_ms"] is not None
+            and result["window_ms"] > args.budget_ms):
+        failures.append(f"cửa sổ đầu tiên {result['window_ms']:.0f} ms > {args.budget_ms:g} ms")
+    result["failures"] = failures
+    skipped = []
+    if args.budget_ms is not None and result["window_ms"] is None:
+        skipped.append(f"không kiểm tra được ngân sách cửa sổ đầu tiên ({result['window_error']})")
+    result["skipped"] = skipped
+
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(result, f, indent=2, ensure_ascii=False)
+    for failure in failures:
+        print(f"❌ {failure}")
+    for reason in skipped:
+        print(f"⚠️ Bỏ qua: {reason}")
+    if failures:
+        return 1
+    return 2 if skipped else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
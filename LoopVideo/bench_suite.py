@@ -0,0 +1,379 @@
+"""Bộ benchmark/hồi quy với video tổng hợp: preview fps, tốc độ export, bộ nhớ và đĩa tạm.
+
+    python bench_suite.py --preset quick --json results.json
+    python bench_suite.py --preset full --json new.json --compare results.json
+    python bench_suite.py --clip 1920x1080:60:libx265:10 --modes stream_loop reencode
+
+Clip được tạo bằng ffmpeg (testsrc + sine), mỗi phép đo chạy trong một tiến
+trình Python riêng để peak RSS (của Python và các tiến trình ffmpeg con) không
+lẫn giữa các lần đo. Preview chạy không cần màn hình: PreviewPipeline được lập
+lịch bằng một vòng lặp sự kiện giả thay cho root.after, phần hiển thị là hàm
+rỗng (noop) hoặc chỉ đổi sang ảnh PIL (pil).
+
+Với --compare, các chỉ số được so với file kết quả cũ; chậm hơn quá
+--threshold phần trăm thì trả mã lỗi 1.
+"""
+import argparse
+import heapq
+import json
+import os
+import platform
+import shutil
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+from ffmpeg_utils import FFMPEG
+from instrument import Instrument
+from loop_engine import EXPORT_MODES, LoopJob, run_job
+from reencode import EncodeProfile
+from synthetic import make_test_clip
+
+PRESETS = {
+    "quick": [
+        {"size": "640x360", "fps": 30, "vcodec": "libx264", "seconds": 5},
+    ],
+    "full": [
+        {"size": "640x360", "fps": 30, "vcodec": "libx264", "seconds": 5},
+        {"size": "1280x720", "fps": 30, "vcodec": "libx264", "seconds": 10},
+        {"size": "1920x1080", "fps": 60, "vcodec": "libx264", "seconds": 10},
+        {"size": "1920x1080", "fps": 30, "vcodec": "libx265", "seconds": 10},
+        {"size": "1280x720", "fps": 24, "vcodec": "mpeg4", "seconds": 20},
+    ],
+}
+
+# Chỉ số càng lớn càng tốt, các chỉ số còn lại càng nhỏ càng tốt
+HIGHER_IS_BETTER = ("achieved_fps", "realtime_factor")
+COMPARED_METRICS = ("achieved_fps", "dropped", "wall_seconds", "realtime_factor",
+                    "peak_rss_mb", "temp_peak_mb")
+
+
+def parse_clip(value):
+    """"WxH:fps:codec:giây" → spec của clip"""
+    size, fps, vcodec, seconds = value.split(":")
+    return {"size": size, "fps": int(fps), "vcodec": vcodec, "seconds": float(seconds)}
+
+
+def clip_id(spec):
+    return f"{spec['size']}_{spec['fps']}fps_{spec['vcodec']}_{spec['seconds']:g}s"
+
+
+def generate_clip(spec, clips_dir):
+    ext = ".mkv" if spec["vcodec"] not in ("libx264", "libx265") else ".mp4"
+    path = os.path.join(clips_dir, clip_id(spec) + ext)
+    # GOP 1 giây như video quay thường gặp, để chế độ copy/crossfade có keyframe để bám
+    return make_test_clip(path, duration=spec["seconds"], size=spec["size"],
+                          fps=spec["fps"], vcodec=spec["vcodec"], gop=spec["fps"])
+
+
+# --- Đo trong tiến trình worker ---
+
+class HeadlessLoop:
+    """Vòng lặp sự kiện thay cho Tk: after(ms, fn) giống root.after, chạy trên luồng gọi run()"""
+
+    def __init__(self, clock=time.monotonic):
+        self.clock = clock
+        self._events = []
+        self._counter = 0
+
+    def after(self, ms, fn):
+        self._counter += 1
+        heapq.heappush(self._events, (self.clock() + ms / 1000.0, self._counter, fn))
+
+    def run(self, seconds):
+        end = self.clock() + seconds
+        while self._events:
+            now = self.clock()
+            if now >= end:
+                break
+            due, _, fn = self._events[0]
+            if due > now:
+                time.sleep(min(due, end) - now)
+                continue
+            heapq.heappop(self._events)
+            fn()
+
+
+def _renderer(kind):
+    if kind == "pil":
+        from PIL import Image
+
+        return lambda frame: Image.fromarray(frame)
+    return lambda frame: None
+
+
+def _peak_rss_mb():
+    """Peak RSS (MB) lớn nhất giữa tiến trình này và các tiến trình con đã kết thúc"""
+    try:
+        import resource
+    except ImportError:
+        return None
+    own = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    children = resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss
+    # Linux tính bằng KB, macOS tính bằng byte
+    scale = 1 if sys.platform == "darwin" else 1024
+    return max(own, children) * scale / (1024 * 1024)
+
+
+def _dir_bytes(path):
+    total = 0
+    for root, _, files in os.walk(path):
+        for name in files:
+            try:
+                total += os.path.getsize(os.path.join(root, name))
+            except OSError:
+                pass
+    return total
+
+
+class DiskSampler:
+    """Lấy mẫu dung lượng thư mục định kỳ trên luồng phụ, giữ giá trị lớn nhất"""
+
+    def __init__(self, path, interval=0.05):
+        self.path = path
+        self.interval = interval
+        self.peak = 0
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+
+    def _run(self):
+        while True:
+            self.peak = max(self.peak, _dir_bytes(self.path))
+            if self._stop.wait(self.interval):
+                break
+
+    def __enter__(self):
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self._stop.set()
+        self._thread.join()
+        self.peak = max(self.peak, _dir_bytes(self.path))
+
+
+def measure_preview(task):
+    from preview import FrameCache, PreviewPipeline
+    from media_index import load_index
+
+    index = load_index(task["clip"])
+    stats = Instrument(enabled=True)
+    loop = HeadlessLoop()
+    pipeline = PreviewPipeline(
+        task["clip"], 0, index.frame_count - 1, index.fps,
+        display=_renderer(task["renderer"]),
+        schedule=loop.after,
+        cache=FrameCache(),
+        width=task["width"],
+        on_error=lambda message: None,
+        stats=stats,
+    )
+    start = time.monotonic()
+    pipeline.start()
+    try:
+        loop.run(task["seconds"])
+    finally:
+        pipeline.stop()
+    elapsed = time.monotonic() - start
+    return {
+        "kind": "preview",
+        "target_fps": index.fps,
+        "achieved_fps": pipeline.shown / max(elapsed, 1e-9),
+        "shown": pipeline.shown,
+        "dropped": pipeline.dropped,
+        "skipped": pipeline.skipped,
+        "seconds": elapsed,
+        "error": pipeline.error,
+        "peak_rss_mb": _peak_rss_mb(),
+        "stages": stats.snapshot()["stages"],
+    }
+
+
+def measure_export(task):
+    scratch = task["scratch"]
+    out_dir = os.path.join(scratch, "out")
+    os.makedirs(out_dir, exist_ok=True)
+    output = os.path.join(out_dir, f"out_{task['mode']}.mp4")
+    profile = None
+    if task["mode"] == "reencode":
+        width, height = EncodeProfile.parse_size(task["size"])
+        profile = EncodeProfile(width=width, height=height, preset="veryfast")
+    job = LoopJob(task["clip"], task["minutes"], output, mode=task["mode"], profile=profile)
+    with DiskSampler(scratch) as disk:
+        result = run_job(job)
+    output_bytes = os.path.getsize(output) if os.path.exists(output) else 0
+    return {
+        "kind": "export",
+        "ok": result.ok,
+        "error": result.error,
+        "wall_seconds": result.elapsed,
+        "realtime_factor": result.output_seconds / max(result.elapsed, 1e-9) if result.ok else 0.0,
+        "output_mb": output_bytes / (1024 * 1024),
+        # Dung lượng tạm lớn nhất ngoài chính file đầu ra
+        "temp_peak_mb": max(0, disk.peak - output_bytes) / (1024 * 1024),
+        "peak_rss_mb": _peak_rss_mb(),
+        "detail": result.detail,
+    }
+
+
+def worker_main(task_json):
+    task = json.loads(task_json)
+    # Thư mục tạm, cache đơn vị và cache chỉ mục đều nằm trong scratch: đo trạng thái nguội
+    scratch = task["scratch"]
+    tempfile.tempdir = os.path.join(scratch, "tmp")
+    os.makedirs(tempfile.tempdir, exist_ok=True)
+    try:
+        if task["kind"] == "preview":
+            result = measure_preview(task)
+        else:
+            result = measure_export(task)
+    except Exception as e:
+        result = {"kind": task["kind"], "ok": False, "error": f"{type(e).__name__}: {e}"}
+    print("RESULT " + json.dumps(result), flush=True)
+    return 0
+
+
+def run_worker(task):
+    """Chạy một phép đo trong tiến trình Python mới, trả về dict kết quả"""
+    env = dict(os.environ)
+    env["VIDEOLOOP_UNIT_CACHE"] = os.path.join(task["scratch"], "units")
+    env["VIDEOLOOP_INDEX_CACHE"] = os.path.join(task["scratch"], "index")
+    process = subprocess.run(
+        [sys.executable, os.path.abspath(__file__), "--worker", json.dumps(task)],
+        stdout=subprocess.PIPE, stderr=subprocess.PIPE, env=env
+    )
+    for line in process.stdout.decode("utf-8", errors="replace").splitlines():
+        if line.startswith("RESULT "):
+            return json.loads(line[len("RESULT "):])
+    tail = process.stderr.decode("utf-8", errors="replace").strip().splitlines()[-5:]
+    return {"kind": task["kind"], "ok": False, "error": "\n".join(tail) or "worker không trả kết quả"}
+
+
+# --- So sánh ---
+
+def result_key(result):
+    return (result["clip"], result["kind"], result.get("mode"), result.get("renderer"))
+
+
+def compare(old, new, threshold):
+    """In chênh lệch từng chỉ số, trả về danh sách hồi quy vượt threshold (%)"""
+    old_by_key = {result_key(r): r for r in old.get("results", [])}
+    regressions = []
+    for r in new["results"]:
+        before = old_by_key.get(result_key(r))
+        if before is None:
+            continue
+        label = " ".join(str(part) for part in result_key(r) if part)
+        for metric in COMPARED_METRICS:
+            a, b = before.get(metric), r.get(metric)
+            if not isinstance(a, (int, float)) or not isinstance(b, (int, float)) or a == 0:
+                continue
+            change = (b - a) / abs(a) * 100
+            worse = -change if metric in HIGHER_IS_BETTER else change
+            mark = "❌" if worse > threshold else "  "
+            print(f"{mark} {label:<48} {metric:<16} {a:>10.2f} → {b:>10.2f} ({change:+.1f}%)")
+            if worse > threshold:
+                regressions.append((label, metric, a, b))
+    return regressions
+
+
+def _ffmpeg_version():
+    try:
+        out = subprocess.run([FFMPEG, "-version"], stdout=subprocess.PIPE, stderr=subprocess.DEVNULL)
+        return out.stdout.decode("utf-8", errors="replace").splitlines()[0]
+    except (OSError, IndexError):
+        return None
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark preview/export với video tổng hợp")
+    parser.add_argument("--preset", choices=sorted(PRESETS), default="quick")
+    parser.add_argument("--clip", action="append", type=parse_clip, metavar="WxH:FPS:CODEC:GIÂY",
+                        help="Thêm clip tự chọn thay cho preset (lặp lại được)")
+    parser.add_argument("--modes", nargs="+", choices=EXPORT_MODES, default=list(EXPORT_MODES))
+    parser.add_argument("--minutes", type=float, default=1.0, help="Thời lượng đầu ra mỗi lần export (phút)")
+    parser.add_argument("--preview-seconds", type=float, default=5.0)
+    parser.add_argument("--renderer", choices=("noop", "pil"), default="noop")
+    parser.add_argument("--preview-width", type=int, default=400)
+    parser.add_argument("--no-preview", action="store_true")
+    parser.add_argument("--no-export", action="store_true")
+    parser.add_argument("--clips-dir", help="Giữ clip tổng hợp ở đây để dùng lại giữa các lần chạy")
+    parser.add_argument("--json", help="Ghi kết quả ra file JSON")
+    parser.add_argument("--compare", help="File JSON kết quả cũ để so sánh")
+    parser.add_argument("--threshold", type=float, default=10.0, help="Ngưỡng hồi quy (%%)")
+    parser.add_argument("--worker", help=argparse.SUPPRESS)
+    args = parser.parse_args(argv)
+
+    if args.worker:
+        return worker_main(args.worker)
+
+    specs = args.clip or PRESETS[args.preset]
+    work_dir = tempfile.mkdtemp(prefix="videoloop_suite_")
+    clips_dir = args.clips_dir or os.path.join(work_dir, "clips")
+    os.makedirs(clips_dir, exist_ok=True)
+    results = []
+    try:
+        for spec in specs:
+            cid = clip_id(spec)
+            clip = generate_clip(spec, clips_dir)
+            tasks = []
+            if not args.no_preview:
+                tasks.append({"kind": "preview", "renderer": args.renderer,
+                              "seconds": args.preview_seconds, "width": args.preview_width})
+            if not args.no_export:
+                tasks += [{"kind": "export", "mode": mode, "minutes": args.minutes,
+                           "size": spec["size"]} for mode in args.modes]
+            for task in tasks:
+                scratch = tempfile.mkdtemp(prefix="task_", dir=work_dir)
+                task.update({"clip": clip, "scratch": scratch})
+                result = run_worker(task)
+                shutil.rmtree(scratch, ignore_errors=True)
+                result.update({"clip": cid, "mode": task.get("mode"),
+                               "renderer": task.get("renderer")})
+                results.append(result)
+                _print_result(result)
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+    report = {
+        "meta": {
+            "time": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "cpus": os.cpu_count(),
+            "ffmpeg": _ffmpeg_version(),
+            "minutes": args.minutes,
+            "preview_seconds": args.preview_seconds,
+        },
+        "results": results,
+    }
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2, ensure_ascii=False)
+
+    if args.compare:
+        with open(args.compare, encoding="utf-8") as f:
+            old = json.load(f)
+        regressions = compare(old, report, args.threshold)
+        if regressions:
+            print(f"❌ {len(regressions)} chỉ số chậm hơn quá {args.threshold:g}%")
+            return 1
+    return 0 if all(r.get("ok", True) and not r.get("error") for r in results) else 1
+
+
+def _print_result(r):
+    rss = f"{r['peak_rss_mb']:.0f} MB" if r.get("peak_rss_mb") is not None else "-"
+    if r.get("error"):
+        print(f"❌ {r['clip']} {r['kind']} {r.get('mode') or ''}: {r['error']}")
+    elif r["kind"] == "preview":
+        print(f"✅ {r['clip']} preview ({r['renderer']}): {r['achieved_fps']:.1f}/{r['target_fps']:g} fps, "
+              f"bỏ {r['dropped']} frame, RSS {rss}")
+    else:
+        print(f"✅ {r['clip']} {r['mode']}: {r['wall_seconds']:.2f}s, {r['realtime_factor']:.0f}x realtime, "
+              f"tạm {r['temp_peak_mb']:.1f} MB, RSS {rss}")
+
+
+if __name__ == "__main__":
+    sys.exit(main())
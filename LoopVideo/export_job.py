@@ -0,0 +1,288 @@
+"""Export theo job: chia thành chunk cố định, lưu trạng thái để hủy và tiếp tục được.
+
+Thư mục job (mặc định <output>.loopjob/) chứa manifest.json, đơn vị lặp đã
+chuẩn bị và các chunk. Mỗi bước chỉ được đánh dấu xong sau khi file của nó đã
+được ghi hoàn chỉnh (ghi ra file tạm rồi os.replace), nên khi app bị tắt hay
+crash, lần chạy sau bỏ qua các bước đã xong thay vì làm lại từ đầu.
+
+Các chunk đầy đủ gồm đúng một số nguyên lần lặp của đơn vị nên giống hệt nhau
+từng byte: chỉ cần ghi một lần rồi tham chiếu nhiều lần khi ghép. Bước cuối
+ghép các chunk bằng concat -c copy ra file tạm cạnh output rồi đổi tên.
+"""
+import hashlib
+import json
+import os
+import shutil
+import time
+
+from ffmpeg_utils import FFmpegCancelled, FFmpegError, FFmpegProgress, probe_duration, run_ffmpeg
+from instrument import DISABLED
+from loop_engine import DEFAULT_FADE_SECONDS, LoopExportError, prepare_unit
+from media_index import source_key
+
+MANIFEST_NAME = "manifest.json"
+MANIFEST_VERSION = 1
+DEFAULT_CHUNK_SECONDS = 600
+# Phần thanh tiến trình dành cho bước chuẩn bị khi đơn vị phải mã hóa (crossfade/reencode);
+# phần còn lại chia cho các chunk và bước ghép theo số giây phải copy
+PREPARE_SHARE = 20.0
+
+
+def _write_json_atomic(path, data):
+    tmp = path + ".tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(data, f, indent=2, ensure_ascii=False)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp, path)
+
+
+def _part_path(path):
+    # Giữ phần mở rộng để ffmpeg nhận đúng định dạng
+    root, ext = os.path.splitext(path)
+    return f"{root}.part{ext}"
+
+
+class JobProgress(FFmpegProgress):
+    """Tiến trình của cả job: out_time là phần trăm trên toàn bộ các bước, kèm tên bước"""
+
+    def __init__(self, phase, percent, speed=None, elapsed=0.0, done=False):
+        super().__init__(out_time=percent, duration=100.0, speed=speed, elapsed=elapsed, done=done)
+        self.phase = phase
+
+    @property
+    def eta(self):
+        # speed là của bước hiện tại nên ước lượng theo thời gian đã chạy của cả job
+        if self.done:
+            return 0.0
+        if self.out_time <= 0:
+            return None
+        return (100.0 - self.out_time) * self.elapsed / self.out_time
+
+    def describe(self):
+        return f"{self.phase} • {super().describe()}"
+
+
+class ExportJob:
+    def __init__(self, video_path, target_seconds, save_path, mode="stream_loop",
+                 chunk_seconds=DEFAULT_CHUNK_SECONDS, job_dir=None, loop_range=None,
+                 keyframes=None, fade_seconds=DEFAULT_FADE_SECONDS, profile=None,
+                 encode_workers=None):
+        self.video_path = video_path
+        self.target_seconds = target_seconds
+        self.save_path = save_path
+        # concat chỉ khác ở cách ghép, với job thì các chunk đã thay vai trò đó
+        self.mode = "stream_loop" if mode == "concat" else mode
+        self.chunk_seconds = chunk_seconds
+        self.job_dir = job_dir or save_path + ".loopjob"
+        self.loop_range = loop_range
+        self.keyframes = keyframes
+        self.fade_seconds = fade_seconds
+        self.profile = profile
+        self.encode_workers = encode_workers
+        self.manifest = None
+        self.stats = None
+
+    @property
+    def manifest_path(self):
+        return os.path.join(self.job_dir, MANIFEST_NAME)
+
+    def fingerprint(self):
+        parts = [
+            source_key(self.video_path),
+            f"{self.target_seconds:.6f}",
+            self.mode,
+            repr(self.loop_range),
+            f"{self.fade_seconds}" if self.mode == "crossfade" else "",
+            self.profile.key() if self.profile is not None and self.mode == "reencode" else "",
+            f"{self.chunk_seconds}",
+        ]
+        return hashlib.sha1("|".join(parts).encode("utf-8")).hexdigest()
+
+    def _load_or_create_manifest(self):
+        fingerprint = self.fingerprint()
+        if os.path.exists(self.manifest_path):
+            try:
+                with open(self.manifest_path, encoding="utf-8") as f:
+                    manifest = json.load(f)
+                if (manifest.get("version") == MANIFEST_VERSION
+                        and manifest.get("fingerprint") == fingerprint):
+                    return manifest
+            except (OSError, ValueError):
+                pass
+            # Job cũ với thông số khác: bắt đầu lại
+            shutil.rmtree(self.job_dir, ignore_errors=True)
+        os.makedirs(self.job_dir, exist_ok=True)
+        manifest = {
+            "version": MANIFEST_VERSION,
+            "fingerprint": fingerprint,
+            "source": os.path.abspath(self.video_path),
+            "save_path": os.path.abspath(self.save_path),
+            "target_seconds": self.target_seconds,
+            "mode": self.mode,
+            "unit": None,
+            "chunks": [],
+            "state": "preparing",
+        }
+        _write_json_atomic(self.manifest_path, manifest)
+        return manifest
+
+    def _save(self):
+        _write_json_atomic(self.manifest_path, self.manifest)
+
+    @property
+    def resumable(self):
+        """Có job dở dang khớp thông số để tiếp tục không"""
+        if not os.path.exists(self.manifest_path):
+            return False
+        try:
+            with open(self.manifest_path, encoding="utf-8") as f:
+                return json.load(f).get("fingerprint") == self.fingerprint()
+        except (OSError, ValueError):
+            return False
+
+    def _unit_ready(self):
+        unit = self.manifest["unit"]
+        return bool(unit) and os.path.exists(unit["path"])
+
+    def _prepare_unit(self, cancel, on_progress=None):
+        if self._unit_ready():
+            return self.manifest["unit"]
+        work_dir = os.path.join(self.job_dir, "work")
+        shutil.rmtree(work_dir, ignore_errors=True)
+        os.makedirs(work_dir)
+        unit_path, unit_seconds, self.stats = prepare_unit(
+            self.video_path, self.mode, work_dir, self.loop_range, self.keyframes,
+            self.fade_seconds, self.profile, self.encode_workers, cancel, on_progress
+        )
+        if os.path.dirname(os.path.abspath(unit_path)) == os.path.abspath(work_dir):
+            # Đơn vị tạo trong job: chuyển ra ngoài thư mục work để giữ lại khi resume
+            kept = os.path.join(self.job_dir, "unit" + os.path.splitext(unit_path)[1])
+            os.replace(unit_path, kept)
+            unit_path = kept
+        shutil.rmtree(work_dir, ignore_errors=True)
+        if unit_seconds is None:
+            unit_seconds = probe_duration(unit_path)
+        unit = {"path": os.path.abspath(unit_path), "seconds": unit_seconds}
+        self.manifest["unit"] = unit
+        self.manifest["chunks"] = self._plan_chunks(unit)
+        self.manifest["state"] = "chunking"
+        self._save()
+        return unit
+
+    def _plan_chunks(self, unit):
+        unit_seconds = unit["seconds"]
+        if unit_seconds <= 0:
+            raise LoopExportError("Đơn vị lặp không hợp lệ.")
+        ext = os.path.splitext(unit["path"])[1] or ".mkv"
+        # Chunk đầy đủ là bội số nguyên của đơn vị để cắt không lệch
+        loops_per_chunk = max(1, int(round(self.chunk_seconds / unit_seconds)))
+        chunk_len = loops_per_chunk * unit_seconds
+        full_count = int(self.target_seconds // chunk_len)
+        remainder = self.target_seconds - full_count * chunk_len
+        chunks = []
+        if full_count:
+            chunks.append({
+                "name": "chunk_full" + ext, "loops": loops_per_chunk,
+                "seconds": chunk_len, "repeat": full_count, "done": False,
+            })
+        if remainder > 1e-3:
+            chunks.append({
+                "name": "chunk_tail" + ext, "loops": None,
+                "seconds": remainder, "repeat": 1, "done": False,
+            })
+        return chunks
+
+    def _write_chunk(self, unit, chunk, cancel, on_progress=None):
+        final = os.path.join(self.job_dir, chunk["name"])
+        partial = _part_path(final)
+        if chunk["loops"]:
+            args = ["-stream_loop", str(chunk["loops"] - 1), "-i", unit["path"]]
+        else:
+            args = ["-stream_loop", "-1", "-i", unit["path"], "-t", f"{chunk['seconds']:.6f}"]
+        try:
+            run_ffmpeg(args + ["-map", "0:v:0", "-map", "0:a?", "-c", "copy", partial],
+                       duration=chunk["seconds"], on_progress=on_progress, cancel=cancel)
+        except FFmpegError:
+            if os.path.exists(partial):
+                os.remove(partial)
+            raise
+        os.replace(partial, final)
+        chunk["done"] = True
+        self._save()
+
+    def _assemble(self, on_progress, cancel):
+        list_path = os.path.join(self.job_dir, "chunks.txt")
+        with open(list_path, "w") as f:
+            for chunk in self.manifest["chunks"]:
+                path = os.path.join(self.job_dir, chunk["name"])
+                for _ in range(chunk["repeat"]):
+                    f.write(f"file '{path}'\n")
+        partial = _part_path(self.save_path)
+        try:
+            run_ffmpeg([
+                "-f", "concat", "-safe", "0", "-i", list_path,
+                "-map", "0:v:0", "-map", "0:a?", "-c", "copy", partial
+            ], duration=self.target_seconds, on_progress=on_progress, cancel=cancel)
+        except FFmpegError:
+            if os.path.exists(partial):
+                os.remove(partial)
+            raise
+        os.replace(partial, self.save_path)
+
+    def run(self, on_progress=None, cancel=None, stats=DISABLED):
+        """Chạy (hoặc tiếp tục) job. Ném FFmpegCancelled nếu bị hủy, thư mục job được giữ lại.
+
+        stats (instrument.Instrument) nhận thời gian từng bước và tốc độ ffmpeg.
+        """
+        start = time.monotonic()
+
+        def phase(name, low, high):
+            # Đổi tiến trình của một bước thành tiến trình [low, high] % của cả job
+            def forward(info):
+                if info.speed:
+                    stats.gauge("ffmpeg.speed", info.speed)
+                if on_progress:
+                    on_progress(JobProgress(
+                        name, low + (high - low) * info.percent / 100.0, info.speed,
+                        time.monotonic() - start, done=info.done and high >= 100.0
+                    ))
+            return forward
+
+        self.manifest = self._load_or_create_manifest()
+        share = 0.0
+        if not self._unit_ready() and self.mode in ("crossfade", "reencode"):
+            share = PREPARE_SHARE
+        prepare_progress = phase("chuẩn bị đơn vị lặp", 0.0, share)
+        # Báo ngay trạng thái chuẩn bị, trước khi ffmpeg gửi cập nhật đầu tiên
+        prepare_progress(FFmpegProgress())
+        with stats.stage("export.prepare_unit"):
+            unit = self._prepare_unit(cancel, prepare_progress)
+
+        pending = []
+        for chunk in self.manifest["chunks"]:
+            if chunk["done"] and os.path.exists(os.path.join(self.job_dir, chunk["name"])):
+                stats.count("export.chunks_resumed")
+            else:
+                pending.append(chunk)
+        copy_seconds = sum(chunk["seconds"] for chunk in pending) + self.target_seconds
+        position = share
+        for i, chunk in enumerate(pending, 1):
+            if cancel is not None and cancel.is_set():
+                raise FFmpegCancelled("Đã hủy.")
+            span = (100.0 - share) * chunk["seconds"] / copy_seconds
+            with stats.stage("export.chunk"):
+                self._write_chunk(unit, chunk, cancel,
+                                  phase(f"chunk {i}/{len(pending)}", position, position + span))
+            position += span
+        self.manifest["state"] = "assembling"
+        self._save()
+        with stats.stage("export.assemble"):
+            self._assemble(phase("ghép", position, 100.0), cancel)
+        self.discard()
+        return self.stats
+
+    def discard(self):
+        """Xóa thư mục job (sau khi xong, hoặc khi người dùng bỏ job dở dang)"""
+        shutil.rmtree(self.job_dir, ignore_errors=True)
+
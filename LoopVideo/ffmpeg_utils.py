@@ -0,0 +1,274 @@
+import os
+import json
+import signal
+import subprocess
+import threading
+import time
+from collections import deque
+
+# Cho phép trỏ tới bản ffmpeg/ffprobe khác qua biến môi trường
+FFMPEG = os.environ.get("VIDEOLOOP_FFMPEG", "ffmpeg")
+FFPROBE = os.environ.get("VIDEOLOOP_FFPROBE", "ffprobe")
+
+
+class FFmpegError(Exception):
+    pass
+
+
+class FFmpegCancelled(FFmpegError):
+    pass
+
+
+def _stderr_tail(data, lines=15):
+    text = data.decode("utf-8", errors="replace") if data else ""
+    return "\n".join(text.strip().splitlines()[-lines:])
+
+
+class FFmpegProgress:
+    """Một bản cập nhật tiến trình đọc từ luồng -progress của ffmpeg"""
+
+    def __init__(self, out_time=0.0, total_size=0, speed=None, duration=None,
+                 elapsed=0.0, done=False):
+        self.out_time = out_time
+        self.total_size = total_size
+        self.speed = speed
+        self.duration = duration
+        self.elapsed = elapsed
+        self.done = done
+
+    @property
+    def percent(self):
+        if self.done:
+            return 100.0
+        if not self.duration:
+            return 0.0
+        return max(0.0, min(100.0, self.out_time / self.duration * 100))
+
+    @property
+    def eta(self):
+        """Số giây còn lại, None nếu chưa ước lượng được"""
+        if self.done:
+            return 0.0
+        if not self.duration or self.out_time <= 0:
+            return None
+        remaining = max(0.0, self.duration - self.out_time)
+        if self.speed:
+            return remaining / self.speed
+        return remaining * self.elapsed / self.out_time
+
+    def describe(self):
+        text = f"{self.percent:.0f}%"
+        if self.speed:
+            text += f" • {self.speed:.1f}x"
+        eta = self.eta
+        if eta is not None and not self.done:
+            text += f" • còn {format_seconds(eta)}"
+        return text
+
+
+def format_seconds(seconds):
+    seconds = int(round(seconds))
+    return f"{seconds // 3600:02d}:{seconds // 60 % 60:02d}:{seconds % 60:02d}"
+
+
+def parse_ffmpeg_time(value):
+    """Đổi "HH:MM:SS.micro" sang giây, None nếu không hợp lệ (vd: N/A)"""
+    try:
+        hours, minutes, seconds = value.strip().split(":")
+        return int(hours) * 3600 + int(minutes) * 60 + float(seconds)
+    except ValueError:
+        return None
+
+
+def _parse_speed(value):
+    value = value.strip().rstrip("x")
+    try:
+        speed = float(value)
+    except ValueError:
+        return None
+    return speed if speed > 0 else None
+
+
+def _read_progress(stream, duration, on_progress, start):
+    fields = {}
+    for raw in stream:
+        line = raw.decode("utf-8", errors="replace").strip()
+        if "=" not in line:
+            continue
+        key, value = line.split("=", 1)
+        fields[key] = value
+        if key != "progress":
+            continue
+
+        # out_time_us là micro giây; out_time_ms của ffmpeg thực ra cũng là micro giây
+        out_time = None
+        for us_key in ("out_time_us", "out_time_ms"):
+            if fields.get(us_key, "N/A").lstrip("-").isdigit():
+                out_time = max(0, int(fields[us_key])) / 1_000_000
+                break
+        if out_time is None:
+            out_time = parse_ffmpeg_time(fields.get("out_time", "")) or 0.0
+        try:
+            total_size = int(fields.get("total_size", "0"))
+        except ValueError:
+            total_size = 0
+
+        on_progress(FFmpegProgress(
+            out_time=out_time,
+            total_size=total_size,
+            speed=_parse_speed(fields.get("speed", "")),
+            duration=duration,
+            elapsed=time.monotonic() - start,
+            done=value == "end"
+        ))
+        fields = {}
+
+
+def _popen_group_kwargs():
+    # Mỗi ffmpeg chạy trong nhóm tiến trình riêng để hủy được cả nhóm
+    if os.name == "nt":
+        return {"creationflags": subprocess.CREATE_NEW_PROCESS_GROUP}
+    return {"start_new_session": True}
+
+
+def terminate_process(process, timeout=5.0):
+    """Dừng tiến trình (và nhóm của nó): gửi tín hiệu dừng trước, kill nếu không thoát"""
+    if process.poll() is not None:
+        return
+    try:
+        if os.name == "nt":
+            process.terminate()
+        else:
+            os.killpg(process.pid, signal.SIGTERM)
+        process.wait(timeout=timeout)
+    except (subprocess.TimeoutExpired, ProcessLookupError, PermissionError):
+        pass
+    if process.poll() is None:
+        try:
+            if os.name == "nt":
+                process.kill()
+            else:
+                os.killpg(process.pid, signal.SIGKILL)
+        except ProcessLookupError:
+            pass
+        process.wait()
+
+
+def _watch_cancel(process, cancel):
+    while process.poll() is None:
+        if cancel.wait(0.2):
+            terminate_process(process)
+            return
+
+
+def run_ffmpeg(args, duration=None, on_progress=None, cancel=None, stdout=None):
+    """Chạy ffmpeg với danh sách tham số, báo lỗi kèm phần cuối stderr.
+
+    Nếu có on_progress, ffmpeg ghi tiến trình dạng key=value ra stdout
+    (-progress pipe:1) và callback nhận FFmpegProgress tính theo duration.
+    cancel là threading.Event: khi được set, nhóm tiến trình ffmpeg bị
+    dừng và FFmpegCancelled được ném ra.
+
+    stdout (file hoặc fd) nhận đầu ra media khi đích của ffmpeg là pipe:1;
+    khi đó tiến trình đi qua một pipe riêng (chỉ có trên POSIX, Windows bỏ qua on_progress).
+    """
+    if cancel is not None and cancel.is_set():
+        raise FFmpegCancelled("Đã hủy.")
+    cmd = [FFMPEG, "-hide_banner", "-y"]
+    progress_r = progress_w = None
+    if on_progress and stdout is not None:
+        if os.name == "nt":
+            on_progress = None
+        else:
+            progress_r, progress_w = os.pipe()
+    if on_progress:
+        progress_target = f"pipe:{progress_w}" if progress_w is not None else "pipe:1"
+        cmd += ["-progress", progress_target, "-nostats"]
+    cmd += list(args)
+    kwargs = _popen_group_kwargs()
+    if progress_w is not None:
+        kwargs["pass_fds"] = (progress_w,)
+    if stdout is None:
+        stdout = subprocess.PIPE if on_progress else subprocess.DEVNULL
+    try:
+        process = subprocess.Popen(
+            cmd,
+            stdin=subprocess.DEVNULL,
+            stdout=stdout,
+            stderr=subprocess.PIPE,
+            **kwargs
+        )
+    except OSError:
+        if progress_r is not None:
+            os.close(progress_r)
+        raise
+    finally:
+        if progress_w is not None:
+            os.close(progress_w)
+    progress_stream = process.stdout
+    if progress_r is not None:
+        progress_stream = os.fdopen(progress_r, "rb")
+
+    # Đọc stderr ở luồng riêng để ffmpeg không bị chặn khi pipe đầy
+    err_tail = deque(maxlen=200)
+    err_thread = threading.Thread(target=lambda: err_tail.extend(process.stderr), daemon=True)
+    err_thread.start()
+    if cancel is not None:
+        threading.Thread(target=_watch_cancel, args=(process, cancel), daemon=True).start()
+
+    try:
+        if on_progress:
+            _read_progress(progress_stream, duration, on_progress, time.monotonic())
+        process.wait()
+    finally:
+        # Kể cả khi bị ngắt (Ctrl+C), không để lại ffmpeg chạy mồ côi
+        terminate_process(process)
+        err_thread.join(timeout=1.0)
+        if progress_r is not None:
+            progress_stream.close()
+
+    if cancel is not None and cancel.is_set():
+        raise FFmpegCancelled("Đã hủy.")
+    if process.returncode != 0:
+        raise FFmpegError(f"ffmpeg lỗi (mã {process.returncode}):\n{_stderr_tail(b''.join(err_tail))}")
+
+
+def run_ffprobe(args):
+    cmd = [FFPROBE, "-v", "error", "-of", "json"] + list(args)
+    process = subprocess.run(cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+    if process.returncode != 0:
+        raise FFmpegError(f"ffprobe lỗi (mã {process.returncode}):\n{_stderr_tail(process.stderr)}")
+    return json.loads(process.stdout.decode("utf-8", errors="replace") or "{}")
+
+
+def probe_duration(path):
+    """Thời lượng (giây) của file media theo container"""
+    data = run_ffprobe(["-show_entries", "format=duration", path])
+    try:
+        return float(data["format"]["duration"])
+    except (KeyError, TypeError, ValueError):
+        raise FFmpegError(f"Không đọc được thời lượng: {path}")
+
+
+def probe_streams(path):
+    """Thông tin luồng video/audio đầu tiên: {"video": dict|None, "audio": dict|None, "duration": float}"""
+    data = run_ffprobe(["-show_streams", "-show_format", path])
+    info = {"video": None, "audio": None, "duration": None}
+    for stream in data.get("streams", []):
+        kind = stream.get("codec_type")
+        if kind in ("video", "audio") and info[kind] is None:
+            info[kind] = stream
+    try:
+        info["duration"] = float(data["format"]["duration"])
+    except (KeyError, TypeError, ValueError):
+        pass
+    return info
+
+
+def parse_rate(value):
+    """Đổi "30000/1001" sang số thực, 0 nếu không hợp lệ"""
+    try:
+        num, _, den = str(value).partition("/")
+        return float(num) / float(den or 1)
+    except (ValueError, ZeroDivisionError):
+        return 0.0
@@ -0,0 +1,265 @@
+"""Đo đạc nhẹ cho preview và export: độ trễ từng giai đoạn, bộ đếm, gauge, fps và trace.
+
+    stats = Instrument(enabled=True, trace=True)
+    with stats.stage("preview.read"):
+        ret, frame = cap.read()
+    stats.export("stats.json")     # tóm tắt + traceEvents (mở được bằng Perfetto/chrome://tracing)
+
+Khi tắt, stage() trả về một context manager rỗng dùng chung và các hàm ghi
+khác trả về ngay, nên chi phí chỉ là một lần gọi hàm. Có thể bật/tắt giữa
+chừng bằng thuộc tính enabled; mặc định theo biến môi trường VIDEOLOOP_STATS.
+"""
+import json
+import os
+import threading
+import time
+from collections import deque
+
+# Biên trên (ms) của các bucket histogram, bucket cuối không giới hạn
+BUCKETS_MS = (0.1, 0.25, 0.5, 1, 2, 4, 8, 16, 33, 66, 133, 266, 533, 1066)
+DEFAULT_TRACE_LIMIT = 200000
+
+
+def enabled_by_env():
+    return os.environ.get("VIDEOLOOP_STATS", "") not in ("", "0")
+
+
+class Histogram:
+    """Histogram độ trễ theo bucket cố định, kèm min/max/tổng; an toàn khi ghi từ nhiều luồng"""
+
+    def __init__(self):
+        self.counts = [0] * (len(BUCKETS_MS) + 1)
+        self.count = 0
+        self.total = 0.0
+        self.min = None
+        self.max = None
+        self._lock = threading.Lock()
+
+    def add(self, ms):
+        i = 0
+        while i < len(BUCKETS_MS) and ms > BUCKETS_MS[i]:
+            i += 1
+        with self._lock:
+            self.counts[i] += 1
+            self.count += 1
+            self.total += ms
+            self.min = ms if self.min is None else min(self.min, ms)
+            self.max = ms if self.max is None else max(self.max, ms)
+
+    def percentile(self, p):
+        """Xấp xỉ bằng biên trên của bucket chứa phân vị p (0-100)"""
+        if not self.count:
+            return None
+        rank = self.count * p / 100.0
+        seen = 0
+        for i, n in enumerate(self.counts):
+            seen += n
+            if seen >= rank and n:
+                return min(BUCKETS_MS[i], self.max) if i < len(BUCKETS_MS) else self.max
+        return self.max
+
+    def summary(self):
+        if not self.count:
+            return {"count": 0}
+        return {
+            "count": self.count,
+            "mean_ms": self.total / self.count,
+            "min_ms": self.min,
+            "max_ms": self.max,
+            "p50_ms": self.percentile(50),
+            "p95_ms": self.percentile(95),
+            "p99_ms": self.percentile(99),
+            "buckets": dict(zip([f"<={b}" for b in BUCKETS_MS] + ["inf"], self.counts)),
+        }
+
+
+class Gauge:
+    def __init__(self):
+        self.value = None
+        self.min = None
+        self.max = None
+        self.total = 0.0
+        self.samples = 0
+
+    def set(self, value):
+        self.value = value
+        self.min = value if self.min is None else min(self.min, value)
+        self.max = value if self.max is None else max(self.max, value)
+        self.total += value
+        self.samples += 1
+
+    def summary(self):
+        if not self.samples:
+            return {"samples": 0}
+        return {"value": self.value, "min": self.min, "max": self.max,
+                "mean": self.total / self.samples, "samples": self.samples}
+
+
+class RateMeter:
+    """Số sự kiện mỗi giây trong cửa sổ trượt `window` giây"""
+
+    def __init__(self, window=1.0):
+        self.window = window
+        self.times = deque()
+        self.total = 0
+
+    def tick(self, now):
+        self.times.append(now)
+        self.total += 1
+        while self.times and now - self.times[0] > self.window:
+            self.times.popleft()
+
+    def rate(self, now):
+        while self.times and now - self.times[0] > self.window:
+            self.times.popleft()
+        return len(self.times) / self.window
+
+
+class _NullStage:
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+
+_NULL_STAGE = _NullStage()
+
+
+class _Stage:
+    __slots__ = ("stats", "name", "start")
+
+    def __init__(self, stats, name):
+        self.stats = stats
+        self.name = name
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        end = time.perf_counter()
+        self.stats.record(self.name, (end - self.start) * 1000.0, self.start)
+        return False
+
+
+class Instrument:
+    def __init__(self, enabled=None, trace=False, trace_limit=DEFAULT_TRACE_LIMIT):
+        self.enabled = enabled_by_env() if enabled is None else enabled
+        self.trace = trace
+        self.trace_limit = trace_limit
+        self.reset()
+
+    def reset(self):
+        self.origin = time.perf_counter()
+        self.stages = {}
+        self.counters = {}
+        self.gauges = {}
+        self.rates = {}
+        self.events = deque(maxlen=self.trace_limit)
+        self._lock = threading.Lock()
+
+    def _histogram(self, name):
+        hist = self.stages.get(name)
+        if hist is None:
+            with self._lock:
+                hist = self.stages.setdefault(name, Histogram())
+        return hist
+
+    # --- Ghi ---
+
+    def stage(self, name):
+        """Context manager đo thời gian một giai đoạn"""
+        if not self.enabled:
+            return _NULL_STAGE
+        return _Stage(self, name)
+
+    def record(self, name, ms, start=None):
+        """Ghi một độ trễ (ms); start là perf_counter lúc bắt đầu, dùng cho trace"""
+        if not self.enabled:
+            return
+        self._histogram(name).add(ms)
+        if self.trace:
+            if start is None:
+                start = time.perf_counter() - ms / 1000.0
+            self.events.append({
+                "name": name, "ph": "X", "pid": os.getpid(), "tid": threading.get_ident(),
+                "ts": (start - self.origin) * 1e6, "dur": ms * 1000.0,
+            })
+
+    def count(self, name, n=1):
+        if not self.enabled:
+            return
+        with self._lock:
+            self.counters[name] = self.counters.get(name, 0) + n
+
+    def gauge(self, name, value):
+        if not self.enabled:
+            return
+        gauge = self.gauges.get(name)
+        if gauge is None:
+            with self._lock:
+                gauge = self.gauges.setdefault(name, Gauge())
+        gauge.set(value)
+        if self.trace:
+            self.events.append({
+                "name": name, "ph": "C", "pid": os.getpid(),
+                "ts": (time.perf_counter() - self.origin) * 1e6, "args": {"value": value},
+            })
+
+    def tick(self, name, now=None):
+        """Đánh dấu một sự kiện để tính tần suất (vd. frame đã hiển thị → fps thực tế)"""
+        if not self.enabled:
+            return
+        meter = self.rates.get(name)
+        if meter is None:
+            with self._lock:
+                meter = self.rates.setdefault(name, RateMeter())
+        meter.tick(time.monotonic() if now is None else now)
+
+    # --- Đọc ---
+
+    def rate(self, name):
+        meter = self.rates.get(name)
+        return meter.rate(time.monotonic()) if meter is not None else 0.0
+
+    def snapshot(self):
+        return {
+            "stages": {name: h.summary() for name, h in sorted(self.stages.items())},
+            "counters": dict(sorted(self.counters.items())),
+            "gauges": {name: g.summary() for name, g in sorted(self.gauges.items())},
+            "rates": {name: {"per_second": self.rate(name), "total": m.total}
+                      for name, m in sorted(self.rates.items())},
+        }
+
+    def describe(self):
+        """Vài dòng ngắn cho overlay"""
+        lines = []
+        for name in sorted(self.rates):
+            target = self.gauges.get(name.replace(".fps", ".target_fps"))
+            text = f"{name}: {self.rate(name):.1f}"
+            if target is not None and target.value:
+                text += f"/{target.value:g}"
+            lines.append(text + " fps")
+        if self.counters:
+            lines.append(" • ".join(f"{k} {v}" for k, v in sorted(self.counters.items())))
+        for name, gauge in sorted(self.gauges.items()):
+            if gauge.value is not None and not name.endswith(".target_fps"):
+                lines.append(f"{name}: {gauge.value:g} (max {gauge.max:g})")
+        for name, hist in sorted(self.stages.items()):
+            if hist.count:
+                lines.append(f"{name}: {hist.total / hist.count:.2f} ms, p95 {hist.percentile(95):.2f} ms")
+        return "\n".join(lines)
+
+    def export(self, path):
+        """Ghi tóm tắt và trace (định dạng Chrome trace, khóa traceEvents) ra file JSON"""
+        data = self.snapshot()
+        data["traceEvents"] = list(self.events)
+        data["displayTimeUnit"] = "ms"
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump(data, f, ensure_ascii=False)
+        return path
+
+
+# Dùng khi không truyền Instrument: luôn tắt
+DISABLED = Instrument(enabled=False)
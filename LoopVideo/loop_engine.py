@@ -0,0 +1,498 @@
+"""Engine export video loop, không phụ thuộc Tk.
+
+GUI (videoLoop.py) chỉ là một client; có thể chạy hàng loạt từ dòng lệnh:
+
+    python loop_engine.py --job a.mp4 60 a_loop.mp4 --job b.mp4 30 b_loop.mp4 --workers 4
+    python loop_engine.py --jobs-file jobs.csv --workers 8
+
+File jobs.csv gồm các dòng: input,phút,output
+"""
+import argparse
+import csv
+import math
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+from ffmpeg_utils import FFmpegError, run_ffmpeg, probe_duration
+from instrument import DISABLED, Instrument
+from media_index import load_index, snap_to_keyframe
+from reencode import EncodeProfile, build_reencoded_unit
+from smart_render import build_crossfade_unit, verify_output
+
+EXPORT_MODES = ("stream_loop", "concat", "crossfade", "reencode")
+DEFAULT_FADE_SECONDS = 1.0
+
+
+class LoopExportError(Exception):
+    pass
+
+
+class LoopJob:
+    def __init__(self, input_path, loop_minutes, output_path, mode="stream_loop",
+                 log_progress=False, find_loop=False, fade_seconds=DEFAULT_FADE_SECONDS,
+                 verify=False, profile=None, encode_workers=None, chunk_seconds=None,
+                 stats_path=None, min_loop=1.0, max_loop=None):
+        self.input_path = input_path
+        self.loop_minutes = float(loop_minutes)
+        self.output_path = output_path
+        self.mode = mode
+        self.log_progress = log_progress
+        self.find_loop = find_loop
+        self.fade_seconds = fade_seconds
+        self.verify = verify
+        self.profile = profile
+        self.encode_workers = encode_workers
+        self.chunk_seconds = chunk_seconds
+        self.stats_path = stats_path
+        # Khoảng độ dài (giây) cho đoạn loop khi find_loop
+        self.min_loop = min_loop
+        self.max_loop = max_loop
+
+    @property
+    def target_seconds(self):
+        return self.loop_minutes * 60
+
+    def __repr__(self):
+        return f"LoopJob({self.input_path!r}, {self.loop_minutes}, {self.output_path!r})"
+
+
+class JobResult:
+    def __init__(self, job, ok, elapsed, loops=0.0, output_seconds=0.0, output_size=0, error=None,
+                 detail=None):
+        self.job = job
+        self.ok = ok
+        self.elapsed = elapsed
+        self.loops = loops
+        self.output_seconds = output_seconds
+        self.output_size = output_size
+        self.error = error
+        self.detail = detail
+
+
+class BatchReport:
+    def __init__(self, results, wall_time, workers):
+        self.results = results
+        self.wall_time = wall_time
+        self.workers = workers
+
+    @property
+    def succeeded(self):
+        return [r for r in self.results if r.ok]
+
+    @property
+    def failed(self):
+        return [r for r in self.results if not r.ok]
+
+    @property
+    def output_seconds(self):
+        return sum(r.output_seconds for r in self.succeeded)
+
+    @property
+    def output_bytes(self):
+        return sum(r.output_size for r in self.succeeded)
+
+    def summary(self):
+        wall = max(self.wall_time, 1e-9)
+        return (
+            f"{len(self.succeeded)}/{len(self.results)} job thành công, "
+            f"{self.workers} worker, {self.wall_time:.1f}s\n"
+            f"Thông lượng: {len(self.succeeded) / wall * 60:.1f} job/phút, "
+            f"{self.output_seconds / wall:.1f}x realtime, "
+            f"{self.output_bytes / wall / (1024 * 1024):.1f} MB/s"
+        )
+
+
+def plan_target(source_duration, loop_minutes):
+    """Trả về (thời lượng đích tính bằng giây, số lần lặp dạng số thực)"""
+    if source_duration <= 0:
+        raise LoopExportError("Video không hợp lệ hoặc không chứa frame.")
+    target_seconds = loop_minutes * 60
+    loops = target_seconds / source_duration
+    if loops < 1:
+        raise LoopExportError("Thời gian quá ngắn để lặp.")
+    return target_seconds, loops
+
+
+def extract_segment(video_path, start, end, out_path, cancel=None, on_progress=None):
+    """Cắt [start, end) bằng -c copy; điểm vào phải là keyframe để không lệch"""
+    try:
+        run_ffmpeg([
+            "-ss", f"{start:.6f}", "-i", video_path,
+            "-t", f"{end - start:.6f}",
+            "-map", "0:v:0", "-map", "0:a?",
+            "-c", "copy", "-avoid_negative_ts", "make_zero",
+            out_path
+        ], duration=end - start, on_progress=on_progress, cancel=cancel)
+    except FFmpegError:
+        _remove_partial(out_path)
+        raise
+
+
+def prepare_loop_unit(video_path, loop_range, temp_dir, keyframes=None, cancel=None,
+                      on_progress=None):
+    """Cắt đoạn loop_range=(start, end) giây thành file riêng, trả về (đường dẫn, thời lượng)"""
+    start, end = loop_range
+    if keyframes is None:
+        keyframes = load_index(video_path).keyframes
+    start = snap_to_keyframe(start, keyframes)
+    if end <= start:
+        raise LoopExportError("Đoạn loop không hợp lệ.")
+    unit_path = os.path.join(temp_dir, "loop_unit.mkv")
+    extract_segment(video_path, start, end, unit_path, cancel, on_progress)
+    return unit_path, probe_duration(unit_path)
+
+
+def _remove_partial(path):
+    if os.path.exists(path):
+        os.remove(path)
+
+
+def export_stream_loop(video_path, target_seconds, save_path, on_progress=None, cancel=None):
+    """Lặp một input bằng -stream_loop và cắt đúng target_seconds.
+
+    Chỉ mở demuxer một lần, không cần file danh sách nên thời gian
+    chuẩn bị và bộ nhớ không phụ thuộc số lần lặp.
+    """
+    try:
+        run_ffmpeg([
+            "-stream_loop", "-1", "-i", video_path,
+            "-t", f"{target_seconds:.6f}",
+            "-c", "copy", save_path
+        ], duration=target_seconds, on_progress=on_progress, cancel=cancel)
+    except FFmpegError:
+        _remove_partial(save_path)
+        raise
+
+
+def export_concat(video_path, target_seconds, save_path, source_duration, temp_dir=None,
+                  on_progress=None, cancel=None):
+    """Nối video bằng concat demuxer (-c copy), mỗi lần lặp là một dòng trong danh sách"""
+    total_loops = math.ceil(target_seconds / source_duration)
+    own_temp = temp_dir is None
+    if own_temp:
+        temp_dir = tempfile.mkdtemp()
+    try:
+        temp_list_file = os.path.join(temp_dir, "file_list.txt")
+        with open(temp_list_file, "w") as f:
+            for i in range(total_loops):
+                f.write(f"file '{video_path}'\n")
+
+        try:
+            run_ffmpeg([
+                "-f", "concat", "-safe", "0",
+                "-i", temp_list_file,
+                "-t", f"{target_seconds:.6f}",
+                "-c", "copy", save_path
+            ], duration=target_seconds, on_progress=on_progress, cancel=cancel)
+        except FFmpegError:
+            _remove_partial(save_path)
+            raise
+    finally:
+        if own_temp:
+            shutil.rmtree(temp_dir, ignore_errors=True)
+
+
+def prepare_crossfade_unit(video_path, loop_range, fade_seconds, temp_dir, keyframes=None,
+                           cancel=None, on_progress=None):
+    """Đơn vị lặp có mối nối crossfade (xem smart_render), trả về (đường dẫn, thời lượng)"""
+    index = load_index(video_path)
+    if loop_range is None:
+        loop_range = (0.0, index.duration)
+    if keyframes is None:
+        keyframes = index.keyframes
+    try:
+        return build_crossfade_unit(video_path, loop_range, fade_seconds, temp_dir, keyframes,
+                                    streams=index.streams, cancel=cancel, on_progress=on_progress)
+    except ValueError as e:
+        raise LoopExportError(str(e))
+
+
+def prepare_unit(video_path, mode, temp_dir, loop_range=None, keyframes=None,
+                 fade_seconds=DEFAULT_FADE_SECONDS, profile=None, encode_workers=None,
+                 cancel=None, on_progress=None):
+    """Chuẩn bị đơn vị lặp cho mode, trả về (đường dẫn, thời lượng hoặc None, ReencodeStats|None).
+
+    stream_loop/concat không có loop_range thì lặp thẳng file nguồn. cancel dừng
+    được mọi bước ffmpeg; on_progress nhận tiến trình của bước mã hóa (reencode,
+    mối nối crossfade) hoặc bước cắt đoạn loop.
+    """
+    if mode not in EXPORT_MODES:
+        raise LoopExportError(f"Chế độ export không hỗ trợ: {mode}")
+    if mode == "reencode":
+        # Chỉ mã hóa một lượt (song song theo chunk, có cache), phần lặp chạy -c copy
+        index = load_index(video_path)
+        try:
+            stats = build_reencoded_unit(
+                video_path, loop_range, profile or EncodeProfile(),
+                keyframes=index.keyframes if keyframes is None else keyframes,
+                workers=encode_workers, streams=index.streams, cancel=cancel,
+                on_progress=on_progress
+            )
+        except ValueError as e:
+            raise LoopExportError(str(e))
+        return stats.unit_path, stats.unit_seconds, stats
+    if mode == "crossfade":
+        # Mối nối được mã hóa một lần, phần lặp lại chạy như stream_loop
+        unit_path, unit_seconds = prepare_crossfade_unit(
+            video_path, loop_range, fade_seconds, temp_dir, keyframes, cancel, on_progress
+        )
+        return unit_path, unit_seconds, None
+    if loop_range is not None:
+        unit_path, unit_seconds = prepare_loop_unit(
+            video_path, loop_range, temp_dir, keyframes, cancel, on_progress
+        )
+        return unit_path, unit_seconds, None
+    return video_path, None, None
+
+
+def export_loop(video_path, target_seconds, save_path, mode="stream_loop",
+                source_duration=None, temp_dir=None, on_progress=None,
+                loop_range=None, keyframes=None, fade_seconds=DEFAULT_FADE_SECONDS,
+                profile=None, encode_workers=None, cancel=None):
+    """Export loop theo mode; loop_range=(start, end) giây để chỉ lặp một đoạn của video.
+
+    Với mode "reencode" trả về ReencodeStats, các mode khác trả về None.
+    """
+    own_temp = temp_dir is None
+    if own_temp:
+        temp_dir = tempfile.mkdtemp()
+    try:
+        unit_path, unit_seconds, stats = prepare_unit(
+            video_path, mode, temp_dir, loop_range, keyframes,
+            fade_seconds, profile, encode_workers, cancel
+        )
+        if mode == "concat":
+            if unit_seconds is None:
+                unit_seconds = source_duration or probe_duration(unit_path)
+            export_concat(unit_path, target_seconds, save_path, unit_seconds, temp_dir,
+                          on_progress, cancel)
+        else:
+            export_stream_loop(unit_path, target_seconds, save_path, on_progress, cancel)
+    finally:
+        if own_temp:
+            shutil.rmtree(temp_dir, ignore_errors=True)
+    return stats
+
+
+def find_loop_range(video_path, keyframes=None, min_length=1.0, max_length=None):
+    """Chạy bộ tìm điểm loop (cần numpy), trả về (start, end) giây của ứng viên tốt nhất.
+
+    Chỉ xét các đoạn dài từ min_length tới max_length giây (None: không giới hạn).
+    """
+    from backends import BackendError
+
+    try:
+        from loop_finder import analyze
+    except ImportError as e:
+        raise LoopExportError(f"Tìm điểm loop cần numpy: {e}")
+    index = load_index(video_path)
+    if keyframes is None:
+        keyframes = index.keyframes
+    try:
+        best, _, _ = analyze(video_path, keyframes, min_length=min_length,
+                             max_length=max_length, fps=index.fps)
+    except BackendError as e:
+        raise LoopExportError(f"Không giải mã được video để tìm điểm loop: {e}")
+    if best is None:
+        raise LoopExportError(f"Không tìm được điểm loop: {video_path}")
+    return best.start_seconds, best.end_seconds
+
+
+def progress_logger(label, step=10):
+    """Callback in tiến trình ra stdout mỗi khi qua thêm `step` phần trăm"""
+    state = {"next": step}
+
+    def log(info):
+        if info.percent >= state["next"] or (info.done and state["next"] <= 100):
+            state["next"] = (int(info.percent) // step + 1) * step
+            print(f"… {os.path.basename(label)}: {info.describe()}", flush=True)
+
+    return log
+
+
+def run_job(job, on_progress=None, cancel=None):
+    # Hàm ở cấp module để chạy được trong process pool; service gọi trực tiếp kèm on_progress/cancel
+    start = time.perf_counter()
+    stats = Instrument(enabled=True, trace=True) if job.stats_path else DISABLED
+    try:
+        if not os.path.isfile(job.input_path):
+            raise LoopExportError(f"File không tồn tại: {job.input_path}")
+        # Chỉ mục có cache: số frame/thời lượng chính xác và keyframe, không probe lại
+        with stats.stage("export.index"):
+            index = load_index(job.input_path)
+        keyframes = index.keyframes
+        loop_range = None
+        if job.find_loop:
+            with stats.stage("export.find_loop"):
+                loop_range = find_loop_range(job.input_path, keyframes, job.min_loop, job.max_loop)
+            source_duration = loop_range[1] - loop_range[0]
+        else:
+            source_duration = index.duration
+        target_seconds, loops = plan_target(source_duration, job.loop_minutes)
+        if on_progress is None and job.log_progress:
+            on_progress = progress_logger(job.output_path)
+        if job.mode == "concat":
+            with stats.stage("export.concat"):
+                unit_stats = export_loop(
+                    job.input_path, target_seconds, job.output_path,
+                    mode=job.mode, source_duration=source_duration,
+                    on_progress=on_progress,
+                    loop_range=loop_range, keyframes=keyframes, cancel=cancel
+                )
+        else:
+            # Export theo chunk có manifest: chạy lại cùng job sẽ tiếp tục phần còn dở
+            from export_job import DEFAULT_CHUNK_SECONDS, ExportJob
+
+            unit_stats = ExportJob(
+                job.input_path, target_seconds, job.output_path,
+                mode=job.mode,
+                chunk_seconds=job.chunk_seconds or DEFAULT_CHUNK_SECONDS,
+                loop_range=loop_range, keyframes=keyframes,
+                fade_seconds=job.fade_seconds,
+                profile=job.profile, encode_workers=job.encode_workers
+            ).run(on_progress=on_progress, cancel=cancel, stats=stats)
+        if job.verify:
+            with stats.stage("export.verify"):
+                report = verify_output(job.output_path, target_seconds)
+            if not report.ok:
+                raise LoopExportError(f"Kiểm tra đầu ra thất bại: {report.describe()}")
+        return JobResult(
+            job, True, time.perf_counter() - start,
+            loops=loops,
+            output_seconds=target_seconds,
+            output_size=os.path.getsize(job.output_path),
+            detail=unit_stats.describe() if unit_stats else None
+        )
+    except (LoopExportError, FFmpegError, OSError) as e:
+        return JobResult(job, False, time.perf_counter() - start, error=str(e))
+    finally:
+        if job.stats_path:
+            stats.record("export.total", (time.perf_counter() - start) * 1000.0, start)
+            try:
+                stats.export(job.stats_path)
+            except OSError:
+                pass
+
+
+def run_batch(jobs, workers=None, on_result=None):
+    """Chạy nhiều job song song trong process pool, trả về BatchReport"""
+    # Import ở đây để GUI (chỉ dùng export đơn lẻ) không phải nạp multiprocessing
+    from concurrent.futures import ProcessPoolExecutor, as_completed
+
+    jobs = list(jobs)
+    workers = workers or min(len(jobs), os.cpu_count() or 1) or 1
+    results = []
+    start = time.perf_counter()
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        futures = [pool.submit(run_job, job) for job in jobs]
+        for future in as_completed(futures):
+            result = future.result()
+            results.append(result)
+            if on_result:
+                on_result(result)
+    return BatchReport(results, time.perf_counter() - start, workers)
+
+
+def read_jobs_file(path, mode="stream_loop"):
+    jobs = []
+    with open(path, newline="", encoding="utf-8") as f:
+        for row in csv.reader(f):
+            if not row or row[0].strip().startswith("#"):
+                continue
+            if len(row) != 3:
+                raise LoopExportError(f"Dòng job không hợp lệ trong {path}: {row}")
+            jobs.append(LoopJob(row[0].strip(), row[1].strip(), row[2].strip(), mode=mode))
+    return jobs
+
+
+def _print_result(result):
+    if result.ok:
+        line = f"✅ {result.job.output_path}: {result.loops:.1f} lần lặp, {result.elapsed:.1f}s"
+        if result.detail:
+            line += f" ({result.detail})"
+        print(line)
+    else:
+        print(f"❌ {result.job.input_path}: {result.error}")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Export video loop hàng loạt (không cần GUI)")
+    parser.add_argument(
+        "--job", nargs=3, action="append", default=[],
+        metavar=("INPUT", "PHUT", "OUTPUT"),
+        help="Một job: file nguồn, thời gian lặp (phút), file đầu ra"
+    )
+    parser.add_argument("--jobs-file", help="File CSV: input,phút,output")
+    parser.add_argument("--workers", type=int, default=None, help="Số process chạy đồng thời")
+    parser.add_argument(
+        "--mode", choices=EXPORT_MODES, default="stream_loop",
+        help="stream_loop: lặp một input, cắt đúng thời lượng; concat: danh sách N dòng; "
+             "crossfade: mối nối hòa dần, chỉ mã hóa lại đoạn quanh mối nối; "
+             "reencode: đổi độ phân giải/codec/bitrate, mã hóa song song một lượt rồi copy"
+    )
+    encode = parser.add_argument_group("chế độ reencode")
+    encode.add_argument("--scale", help="Độ phân giải đầu ra, ví dụ 1920x1080")
+    encode.add_argument("--vcodec", default="libx264", help="Encoder video (mặc định libx264)")
+    encode.add_argument("--bitrate", help="Bitrate video, ví dụ 6M")
+    encode.add_argument("--crf", type=int, help="CRF khi không đặt bitrate")
+    encode.add_argument("--preset", default="medium")
+    encode.add_argument("--fps", type=float, help="Frame rate đầu ra (mặc định giữ nguyên)")
+    encode.add_argument("--encode-workers", type=int, help="Số tiến trình ffmpeg mã hóa chunk song song")
+    parser.add_argument("--fade", type=float, default=DEFAULT_FADE_SECONDS,
+                        help="Độ dài crossfade (giây) cho chế độ crossfade")
+    parser.add_argument("--verify", action="store_true",
+                        help="Kiểm tra số frame và độ lệch A/V của file đầu ra")
+    parser.add_argument("--chunk-minutes", type=float, default=10,
+                        help="Độ dài mỗi chunk của job (phút); job dở dang được tiếp tục khi chạy lại")
+    parser.add_argument("--progress", action="store_true", help="In tiến trình (%%, tốc độ, ETA) của từng job")
+    parser.add_argument("--stats-dir",
+                        help="Ghi thời gian từng bước + trace của mỗi job ra <output>.stats.json trong thư mục này")
+    parser.add_argument(
+        "--find-loop", action="store_true",
+        help="Tự tìm điểm loop liền mạch cho từng video (cần numpy)"
+    )
+    parser.add_argument("--min-loop", type=float, default=1.0,
+                        help="Độ dài tối thiểu của đoạn loop khi --find-loop (giây)")
+    parser.add_argument("--max-loop", type=float,
+                        help="Độ dài tối đa của đoạn loop khi --find-loop (giây, mặc định không giới hạn)")
+    args = parser.parse_args(argv)
+
+    try:
+        width, height = EncodeProfile.parse_size(args.scale) if args.scale else (None, None)
+        profile = EncodeProfile(
+            width=width, height=height, vcodec=args.vcodec, bitrate=args.bitrate,
+            crf=args.crf, preset=args.preset, fps=args.fps
+        )
+        jobs = [LoopJob(*job, mode=args.mode) for job in args.job]
+        if args.jobs_file:
+            jobs.extend(read_jobs_file(args.jobs_file, mode=args.mode))
+        for job in jobs:
+            job.log_progress = args.progress
+            job.find_loop = args.find_loop
+            job.min_loop = args.min_loop
+            job.max_loop = args.max_loop
+            job.fade_seconds = args.fade
+            job.verify = args.verify
+            job.profile = profile
+            job.encode_workers = args.encode_workers
+            job.chunk_seconds = args.chunk_minutes * 60
+            if args.stats_dir:
+                os.makedirs(args.stats_dir, exist_ok=True)
+                job.stats_path = os.path.join(
+                    args.stats_dir, os.path.basename(job.output_path) + ".stats.json"
+                )
+    except (LoopExportError, ValueError, OSError) as e:
+        parser.error(str(e))
+    if not jobs:
+        parser.error("Chưa có job nào (dùng --job hoặc --jobs-file)")
+
+    report = run_batch(jobs, workers=args.workers, on_result=_print_result)
+    print(report.summary())
+    return 0 if not report.failed else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,156 @@
+"""Tìm điểm loop liền mạch: so khớp thumbnail xám của các frame bằng phép tính vector hóa.
+
+Video được giải mã một lần thành thumbnail nhỏ (mặc định 32x18). Khoảng cách
+giữa mọi cặp (vào, ra) trong khoảng độ dài cho phép được tính theo khối bằng
+phép nhân ma trận, chỉ trên dải độ dài đó chứ không phải cả ma trận n x n,
+cộng dồn trên vài frame lân cận để bắt cả hướng chuyển động.
+"""
+import numpy as np
+
+from backends import bgr_to_gray, open_video, resize_area
+
+THUMB_SIZE = (32, 18)
+
+
+class LoopCandidate:
+    """Đoạn loop [start_frame, end_frame] (gồm cả hai đầu); score càng nhỏ mối nối càng mượt"""
+
+    def __init__(self, start_frame, end_frame, score, fps):
+        self.start_frame = start_frame
+        self.end_frame = end_frame
+        self.score = score
+        self.fps = fps
+
+    @property
+    def start_seconds(self):
+        return self.start_frame / self.fps
+
+    @property
+    def end_seconds(self):
+        # Mốc kết thúc (không gồm), tức là thời điểm frame sau end_frame
+        return (self.end_frame + 1) / self.fps
+
+    @property
+    def duration(self):
+        return self.end_seconds - self.start_seconds
+
+    def __repr__(self):
+        return (f"LoopCandidate({self.start_seconds:.3f}s → {self.end_seconds:.3f}s, "
+                f"score={self.score:.4f})")
+
+
+def extract_thumbnails(video_path, size=THUMB_SIZE, fps=None, backend=None):
+    """Giải mã toàn bộ video một lần, trả về (mảng float32 N x D trong [0, 1], fps).
+
+    fps nên lấy từ chỉ mục media; CAP_PROP_FPS chỉ là ước lượng với nhiều container.
+    """
+    cap = open_video(video_path, backend, fps)
+    try:
+        fps = cap.fps
+        thumbs = []
+        while True:
+            ret, frame = cap.read()
+            if not ret:
+                break
+            thumbs.append(bgr_to_gray(resize_area(frame, size)).ravel())
+    finally:
+        cap.release()
+    if not thumbs:
+        raise IOError(f"Video không chứa frame: {video_path}")
+    return np.stack(thumbs).astype(np.float32) / 255.0, fps
+
+
+def find_loop_points(thumbs, fps, min_length=1.0, max_length=None, top_k=5,
+                     start_frames=None, radius=2, block=512):
+    """Trả về tối đa top_k LoopCandidate tốt nhất, sắp theo score tăng dần.
+
+    Mối nối của đoạn [s, e] là bước nhảy e → s, nên frame s được so với
+    frame e + 1, cộng dồn trên cửa sổ ±radius frame. start_frames (nếu có)
+    giới hạn các điểm vào được xét, ví dụ chỉ các keyframe để export
+    -c copy không bị lệch.
+    """
+    n = len(thumbs)
+    min_lag = max(1, int(round(min_length * fps)))
+    max_lag = n - 1 if max_length is None else min(n - 1, int(round(max_length * fps)))
+    if n < 2 or min_lag > max_lag:
+        return []
+
+    thumbs = np.ascontiguousarray(thumbs, dtype=np.float32)
+    sq_norms = np.einsum("ij,ij->i", thumbs, thumbs)
+    offsets = range(-radius, radius + 1)
+    dims = thumbs.shape[1] * len(offsets)
+
+    if start_frames is None:
+        rows = np.arange(n - min_lag)
+    else:
+        rows = np.array(sorted(s for s in set(start_frames) if 0 <= s < n - min_lag), dtype=np.int64)
+    if len(rows) == 0:
+        return []
+
+    best_j = np.empty(len(rows), dtype=np.int64)
+    best_d = np.empty(len(rows), dtype=np.float32)
+    lo = 0
+    while lo < len(rows):
+        # Khối gồm tối đa block điểm vào nằm trong khoảng block frame, nên chỉ cần tính
+        # các cột trong dải độ dài cho phép: block x (block + max_lag - min_lag) thay vì block x n
+        hi = min(len(rows), lo + block, int(np.searchsorted(rows, rows[lo] + block)))
+        r = rows[lo:hi]
+        cols = np.arange(r[0] + min_lag, min(n - 1, r[-1] + max_lag) + 1)
+        d2 = np.zeros((len(r), len(cols)), dtype=np.float32)
+        for t in offsets:
+            # |a - b|² = |a|² + |b|² - 2 a·b cho cả khối; biên được lặp lại
+            rt = np.clip(r + t, 0, n - 1)
+            ct = np.clip(cols + t, 0, n - 1)
+            d2 += sq_norms[rt, None] + sq_norms[None, ct] - 2.0 * (thumbs[rt] @ thumbs[ct].T)
+        lag = cols[None, :] - r[:, None]
+        d2[(lag < min_lag) | (lag > max_lag)] = np.inf
+        j = np.argmin(d2, axis=1)
+        best_j[lo:hi] = cols[j]
+        best_d[lo:hi] = d2[np.arange(len(r)), j]
+        lo = hi
+
+    valid = np.isfinite(best_d)
+    rows, best_j, best_d = rows[valid], best_j[valid], best_d[valid]
+    scores = np.sqrt(np.maximum(best_d, 0) / dims)
+
+    # Lấy top_k, bỏ các ứng viên gần như trùng nhau (điểm vào cách nhau dưới 0.5s)
+    separation = max(1, int(fps * 0.5))
+    candidates = []
+    for i in np.argsort(scores, kind="stable"):
+        s = int(rows[i])
+        if any(abs(s - c.start_frame) < separation for c in candidates):
+            continue
+        candidates.append(LoopCandidate(s, int(best_j[i]) - 1, float(scores[i]), fps))
+        if len(candidates) >= top_k:
+            break
+    return candidates
+
+
+def keyframe_indices(keyframe_times, fps, frame_count):
+    """Đổi mốc thời gian keyframe (giây) sang chỉ số frame"""
+    return sorted({min(frame_count - 1, int(round(t * fps))) for t in keyframe_times if t >= 0})
+
+
+def choose_candidate(candidates, keyframe_candidates, tolerance=1.25):
+    """Ưu tiên ứng viên bắt đầu ở keyframe nếu score không kém quá tolerance lần"""
+    best = candidates[0] if candidates else None
+    if keyframe_candidates:
+        kf = keyframe_candidates[0]
+        if best is None or kf.score <= best.score * tolerance + 1e-3:
+            return kf
+    return best
+
+
+def analyze(video_path, keyframe_times=None, min_length=1.0, max_length=None, top_k=5,
+            fps=None):
+    """Phân tích đầy đủ: trả về (ứng viên được chọn, danh sách ứng viên, fps)"""
+    thumbs, fps = extract_thumbnails(video_path, fps=fps)
+    candidates = find_loop_points(thumbs, fps, min_length, max_length, top_k)
+    keyframe_candidates = []
+    if keyframe_times:
+        starts = keyframe_indices(keyframe_times, fps, len(thumbs))
+        keyframe_candidates = find_loop_points(
+            thumbs, fps, min_length, max_length, top_k, start_frames=starts
+        )
+    return choose_candidate(candidates, keyframe_candidates), candidates, fps
+
@@ -0,0 +1,129 @@
+"""So sánh find_loop_points (vector hóa) với cách tính vét cạn trên mảng tổng hợp nhỏ.
+
+    python loop_finder_check.py
+    python loop_finder_check.py --frames 150 --dims 24 --trials 20
+
+Mỗi lượt tạo một chuỗi "thumbnail" ngẫu nhiên biến đổi chậm và cài sẵn một
+đoạn lặp lại, rồi kiểm tra với nhiều tổ hợp min/max độ dài, radius, khối nhỏ
+(để qua biên khối) và start_frames: mỗi ứng viên trả về phải có score bằng
+khoảng cách vét cạn của chính cặp đó và bằng khoảng cách nhỏ nhất của điểm
+vào đó, ứng viên đầu phải là cực tiểu toàn cục, và độ dài đoạn cài sẵn phải
+được tìm thấy.
+"""
+import argparse
+import sys
+
+import numpy as np
+
+from loop_finder import find_loop_points
+
+
+def brute_force_distances(thumbs, min_lag, max_lag, radius, rows):
+    """{điểm vào s: {điểm ra j: khoảng cách bình phương}} tính từng cặp bằng vòng lặp"""
+    n = len(thumbs)
+    result = {}
+    for s in rows:
+        per_row = {}
+        for j in range(n):
+            if not min_lag <= j - s <= max_lag:
+                continue
+            total = 0.0
+            for t in range(-radius, radius + 1):
+                a = thumbs[min(max(s + t, 0), n - 1)].astype(np.float64)
+                b = thumbs[min(max(j + t, 0), n - 1)].astype(np.float64)
+                total += float(np.sum((a - b) ** 2))
+            per_row[j] = total
+        if per_row:
+            result[s] = per_row
+    return result
+
+
+def make_thumbs(rng, frames, dims, loop_start, loop_length):
+    """Chuỗi ngẫu nhiên biến đổi chậm; frame loop_start + loop_length + k lặp lại frame loop_start + k"""
+    steps = rng.normal(0, 0.05, size=(frames, dims)).astype(np.float32)
+    thumbs = np.clip(0.5 + np.cumsum(steps, axis=0), 0, 1)
+    repeat = thumbs[loop_start:loop_start + loop_length].copy()
+    end = min(frames, loop_start + 2 * loop_length)
+    thumbs[loop_start + loop_length:end] = repeat[:end - loop_start - loop_length]
+    return thumbs
+
+
+def check_case(thumbs, fps, min_length, max_length, radius, block, start_frames, tolerance=1e-3):
+    """Trả về danh sách lỗi (rỗng nếu khớp)"""
+    n = len(thumbs)
+    dims = thumbs.shape[1] * (2 * radius + 1)
+    min_lag = max(1, int(round(min_length * fps)))
+    max_lag = n - 1 if max_length is None else min(n - 1, int(round(max_length * fps)))
+    if start_frames is None:
+        rows = range(n - min_lag)
+    else:
+        rows = sorted(s for s in set(start_frames) if 0 <= s < n - min_lag)
+    brute = brute_force_distances(thumbs, min_lag, max_lag, radius, rows)
+    candidates = find_loop_points(thumbs, fps, min_length, max_length, top_k=5,
+                                  start_frames=start_frames, radius=radius, block=block)
+
+    problems = []
+    if bool(brute) != bool(candidates):
+        return [f"vét cạn có {len(brute)} điểm vào, vector hóa trả về {len(candidates)} ứng viên"]
+    for c in candidates:
+        s, j = c.start_frame, c.end_frame + 1
+        if s not in brute or j not in brute[s]:
+            problems.append(f"ứng viên ngoài khoảng cho phép: {s} → {j}")
+            continue
+        pair = np.sqrt(brute[s][j] / dims)
+        row_best = np.sqrt(min(brute[s].values()) / dims)
+        if abs(c.score - pair) > tolerance:
+            problems.append(f"score {c.score:.5f} khác vét cạn {pair:.5f} tại {s} → {j}")
+        if abs(c.score - row_best) > tolerance:
+            problems.append(f"{s} → {j} không phải điểm ra tốt nhất ({c.score:.5f} > {row_best:.5f})")
+    if candidates:
+        overall = np.sqrt(min(min(row.values()) for row in brute.values()) / dims)
+        if abs(candidates[0].score - overall) > tolerance:
+            problems.append(f"ứng viên đầu {candidates[0].score:.5f} khác cực tiểu {overall:.5f}")
+    return problems
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Kiểm tra find_loop_points với cách tính vét cạn")
+    parser.add_argument("--frames", type=int, default=120)
+    parser.add_argument("--dims", type=int, default=16)
+    parser.add_argument("--fps", type=float, default=10.0)
+    parser.add_argument("--trials", type=int, default=10)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args(argv)
+
+    rng = np.random.default_rng(args.seed)
+    failures = 0
+    cases = 0
+    for trial in range(args.trials):
+        loop_start = int(rng.integers(5, args.frames // 3))
+        loop_length = int(rng.integers(args.frames // 5, args.frames // 3))
+        thumbs = make_thumbs(rng, args.frames, args.dims, loop_start, loop_length)
+        keyframes = sorted({0, loop_start} | set(int(k) for k in rng.integers(0, args.frames, 8)))
+        window = (loop_length - 3) / args.fps, (loop_length + 3) / args.fps
+        for min_length, max_length in ((1.0, None), window, (0.5, 2.0)):
+            for radius, block, starts in ((2, 512, None), (0, 7, None), (1, 5, keyframes)):
+                cases += 1
+                problems = check_case(thumbs, args.fps, min_length, max_length, radius, block, starts)
+                if problems:
+                    failures += 1
+                    print(f"❌ lượt {trial}, độ dài {min_length}-{max_length}, radius {radius}, "
+                          f"block {block}, start_frames {'có' if starts else 'không'}:")
+                    for problem in problems:
+                        print(f"   {problem}")
+        # Bên trong đoạn cài sẵn có các cặp cách nhau đúng loop_length và khoảng cách 0:
+        # ứng viên đầu khi giới hạn quanh độ dài đó phải là một cặp như vậy
+        found = find_loop_points(thumbs, args.fps, *window)
+        cases += 1
+        if (not found or found[0].score > 1e-3
+                or found[0].end_frame + 1 - found[0].start_frame != loop_length):
+            failures += 1
+            print(f"❌ lượt {trial}: không tìm thấy đoạn cài sẵn dài {loop_length} frame, "
+                  f"được {found[0] if found else None}")
+
+    print(f"{cases - failures}/{cases} trường hợp khớp vét cạn")
+    return 0 if not failures else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
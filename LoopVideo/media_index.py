@@ -0,0 +1,198 @@
+"""Chỉ mục media: thông tin luồng, số frame chính xác và mốc keyframe, lưu cache trên đĩa.
+
+Chỉ mục được dựng một lần từ ffprobe (đọc packet, không giải mã) và lưu
+dưới dạng JSON trong thư mục cache, khóa theo đường dẫn + kích thước + mtime
+của file. Mở lại cùng file chỉ cần đọc file JSON nhỏ; file bị sửa thì khóa
+đổi và chỉ mục được dựng lại.
+"""
+import bisect
+import hashlib
+import json
+import os
+import threading
+from collections import OrderedDict
+
+from ffmpeg_utils import parse_rate, probe_streams, run_ffprobe
+
+DEFAULT_INDEX_DIR = os.environ.get(
+    "VIDEOLOOP_INDEX_CACHE",
+    os.path.join(os.path.expanduser("~"), ".cache", "videoloop", "index")
+)
+INDEX_VERSION = 1
+
+# Số chỉ mục giữ trong bộ nhớ; GUI/service chạy lâu nên bỏ bớt chỉ mục ít dùng nhất
+MEMORY_MAX_ENTRIES = int(os.environ.get("VIDEOLOOP_INDEX_MEMORY", "256"))
+
+# Chỉ mục đã đọc trong tiến trình này (LRU), tránh đọc lại file JSON
+_memory = OrderedDict()
+_memory_lock = threading.Lock()
+
+
+def source_key(path):
+    """Khóa của file nguồn: đường dẫn + kích thước + mtime, đổi khi file bị sửa"""
+    st = os.stat(path)
+    return f"{os.path.abspath(path)}|{st.st_size}|{st.st_mtime_ns}"
+
+
+def snap_to_keyframe(seconds, keyframes, tolerance=1e-3):
+    """Keyframe gần nhất tại hoặc trước seconds (nơi -c copy và seek thực sự bắt đầu)"""
+    if not keyframes:
+        return seconds
+    i = bisect.bisect_right(keyframes, seconds + tolerance)
+    return keyframes[i - 1] if i > 0 else keyframes[0]
+
+
+class MediaIndex:
+    """Thông tin một file video; mốc thời gian tính từ đầu luồng video (giây)"""
+
+    def __init__(self, path, key, fps, frame_count, duration, keyframes,
+                 video=None, audio=None):
+        self.path = path
+        self.key = key
+        self.fps = fps
+        self.frame_count = frame_count
+        self.duration = duration
+        self.keyframes = keyframes
+        self.video = video
+        self.audio = audio
+
+    @property
+    def streams(self):
+        """Cùng dạng với ffmpeg_utils.probe_streams"""
+        return {"video": self.video, "audio": self.audio, "duration": self.duration}
+
+    @property
+    def width(self):
+        return (self.video or {}).get("width", 0)
+
+    @property
+    def height(self):
+        return (self.video or {}).get("height", 0)
+
+    @property
+    def audio_layout(self):
+        """(sample_rate, channels, channel_layout) hoặc None nếu không có audio"""
+        if self.audio is None:
+            return None
+        return (int(self.audio.get("sample_rate") or 0), self.audio.get("channels"),
+                self.audio.get("channel_layout"))
+
+    def frame_at(self, seconds):
+        return min(max(0, int(round(seconds * self.fps))), max(0, self.frame_count - 1))
+
+    def seconds_at(self, frame):
+        return frame / self.fps
+
+    def keyframe_before(self, seconds, tolerance=1e-3):
+        """Keyframe tại hoặc trước seconds; không có keyframe thì coi đầu file là keyframe"""
+        if not self.keyframes:
+            return 0.0
+        return snap_to_keyframe(seconds, self.keyframes, tolerance)
+
+    def seek_frame(self, frame):
+        """Frame keyframe gần nhất tại hoặc trước frame, để seek rồi đọc tiếp tới đúng frame"""
+        return min(frame, self.frame_at(self.keyframe_before(self.seconds_at(frame))))
+
+    def to_dict(self):
+        return {
+            "version": INDEX_VERSION,
+            "key": self.key,
+            "fps": self.fps,
+            "frame_count": self.frame_count,
+            "duration": self.duration,
+            "keyframes": self.keyframes,
+            "video": self.video,
+            "audio": self.audio,
+        }
+
+    @classmethod
+    def from_dict(cls, path, data):
+        return cls(path, data["key"], data["fps"], data["frame_count"], data["duration"],
+                   data["keyframes"], data.get("video"), data.get("audio"))
+
+
+def build_index(path, key=None):
+    """Dựng chỉ mục bằng ffprobe: thông tin luồng + toàn bộ packet của luồng video đầu tiên"""
+    key = key or source_key(path)
+    streams = probe_streams(path)
+    video = streams["video"]
+    if video is None:
+        raise ValueError(f"Không có luồng video: {path}")
+    data = run_ffprobe([
+        "-select_streams", "v:0",
+        "-show_entries", "packet=pts_time,duration_time,flags",
+        path
+    ])
+    times = []
+    keyframes = []
+    last_duration = 0.0
+    for packet in data.get("packets", []):
+        try:
+            t = float(packet["pts_time"])
+        except (KeyError, TypeError, ValueError):
+            continue
+        times.append(t)
+        if "K" in packet.get("flags", ""):
+            keyframes.append(t)
+        try:
+            last_duration = float(packet["duration_time"])
+        except (KeyError, TypeError, ValueError):
+            pass
+
+    fps = parse_rate(video.get("avg_frame_rate")) or parse_rate(video.get("r_frame_rate")) or 30.0
+    if times:
+        # Packet theo thứ tự giải mã (có B-frame), thời gian trình chiếu phải sắp lại
+        times.sort()
+        origin = times[0]
+        frame_count = len(times)
+        duration = times[-1] - origin + (last_duration or 1 / fps)
+        keyframes = sorted(t - origin for t in keyframes)
+    else:
+        origin = 0.0
+        duration = streams["duration"] or 0.0
+        frame_count = int(round(duration * fps))
+    return MediaIndex(path, key, fps, frame_count, duration, keyframes, video, streams["audio"])
+
+
+def _cache_path(key, cache_dir):
+    return os.path.join(cache_dir, hashlib.sha1(key.encode("utf-8")).hexdigest() + ".json")
+
+
+def load_index(path, cache_dir=DEFAULT_INDEX_DIR):
+    """Chỉ mục của path: lấy từ bộ nhớ, rồi cache trên đĩa, cuối cùng mới dựng mới"""
+    key = source_key(path)
+    with _memory_lock:
+        index = _memory.get(key)
+        if index is not None:
+            _memory.move_to_end(key)
+    if index is not None:
+        return index
+
+    cached = _cache_path(key, cache_dir)
+    index = None
+    try:
+        with open(cached, encoding="utf-8") as f:
+            data = json.load(f)
+        if data.get("version") == INDEX_VERSION and data.get("key") == key:
+            index = MediaIndex.from_dict(path, data)
+    except (OSError, ValueError, KeyError):
+        index = None
+
+    if index is None:
+        index = build_index(path, key)
+        try:
+            os.makedirs(cache_dir, exist_ok=True)
+            tmp = f"{cached}.{os.getpid()}.tmp"
+            with open(tmp, "w", encoding="utf-8") as f:
+                json.dump(index.to_dict(), f)
+            os.replace(tmp, cached)
+        except OSError:
+            # Không ghi được cache (ổ chỉ đọc...) thì vẫn dùng chỉ mục vừa dựng
+            pass
+
+    with _memory_lock:
+        _memory[key] = index
+        _memory.move_to_end(key)
+        while len(_memory) > MEMORY_MAX_ENTRIES:
+            _memory.popitem(last=False)
+    return index
@@ -0,0 +1,253 @@
+"""Lặp một danh sách clip (reel): chuẩn hóa từng clip một lần rồi ghép và lặp bằng -c copy.
+
+    python playlist.py --clip intro.mov --clip promo.mp4 --clip logo.mkv --minutes 60 --out reel.mp4
+    python playlist.py --list reel.txt --minutes 600 --out reel.mp4 --scale 1920x1080 --fps 30
+
+Clip khác codec/độ phân giải không ghép -c copy được, nên mỗi clip được mã hóa
+về cùng một profile (độ phân giải, fps, codec, audio 48 kHz stereo; clip không
+có tiếng được thêm luồng im lặng). Clip đã chuẩn hóa được cache theo hash nội
+dung + profile, các clip khác nhau được mã hóa song song. Sửa một clip thì chỉ
+clip đó phải mã hóa lại; reel được ghép bằng concat -c copy rồi lặp như
+stream_loop (qua ExportJob nên hủy/tiếp tục được). Cache giới hạn theo
+VIDEOLOOP_PLAYLIST_CACHE_GB (mặc định 20), mục ít dùng nhất bị xóa trước.
+"""
+import argparse
+import hashlib
+import os
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from ffmpeg_utils import FFmpegError, probe_duration, run_ffmpeg
+from instrument import DISABLED
+from loop_engine import LoopExportError, plan_target, progress_logger
+from media_index import load_index
+from reencode import EncodeProfile, prune_cache
+
+DEFAULT_PLAYLIST_CACHE = os.environ.get(
+    "VIDEOLOOP_PLAYLIST_CACHE",
+    os.path.join(os.path.expanduser("~"), ".cache", "videoloop", "normalized")
+)
+# Giới hạn dung lượng cache clip đã chuẩn hóa và reel; vượt quá thì xóa mục ít dùng nhất
+DEFAULT_PLAYLIST_CACHE_MAX_BYTES = int(
+    float(os.environ.get("VIDEOLOOP_PLAYLIST_CACHE_GB", "20")) * 1024 ** 3
+)
+# Tăng khi đổi cách chuẩn hóa để không dùng nhầm cache cũ
+NORMALIZE_VERSION = 1
+AUDIO_RATE = 48000
+AUDIO_CHANNELS = 2
+# Timescale chung để các đơn vị MP4 ghép -c copy không phải đổi timebase
+VIDEO_TIMESCALE = 90000
+
+_hash_memo = {}
+_hash_lock = threading.Lock()
+
+
+def content_hash(path, chunk_size=1 << 20):
+    """SHA-256 nội dung file, nhớ theo (đường dẫn, kích thước, mtime) trong tiến trình"""
+    st = os.stat(path)
+    key = (os.path.abspath(path), st.st_size, st.st_mtime_ns)
+    with _hash_lock:
+        if key in _hash_memo:
+            return _hash_memo[key]
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(chunk_size), b""):
+            digest.update(block)
+    value = digest.hexdigest()
+    with _hash_lock:
+        _hash_memo[key] = value
+    return value
+
+
+def profile_for(clips, crf=18):
+    """Profile chung mặc định: độ phân giải và fps của clip đầu tiên"""
+    index = load_index(clips[0])
+    # libx264 với yuv420p cần kích thước chẵn
+    width = index.width - index.width % 2
+    height = index.height - index.height % 2
+    return EncodeProfile(width=width or None, height=height or None,
+                         fps=round(index.fps, 3), crf=crf)
+
+
+def normalized_path(clip, profile, cache_dir=DEFAULT_PLAYLIST_CACHE):
+    key = f"{NORMALIZE_VERSION}|{profile.key()}|{AUDIO_RATE}|{AUDIO_CHANNELS}"
+    suffix = hashlib.sha1(key.encode("utf-8")).hexdigest()[:12]
+    return os.path.join(cache_dir, f"{content_hash(clip)}_{suffix}.mp4")
+
+
+def normalize_clip(clip, profile, out_path, threads=None, cancel=None):
+    """Mã hóa clip về profile chung; ghi ra file tạm rồi đổi tên khi xong"""
+    index = load_index(clip)
+    fps = profile.fps or index.fps
+    # Cắt đúng số frame nguyên để video và audio của đơn vị dài bằng nhau
+    seconds = max(1, int(round(index.duration * fps))) / fps
+    args = ["-i", clip]
+    if index.audio is not None:
+        audio_map = "0:a:0"
+    else:
+        args += ["-f", "lavfi", "-i",
+                 f"anullsrc=r={AUDIO_RATE}:cl={'stereo' if AUDIO_CHANNELS == 2 else 'mono'}"]
+        audio_map = "1:a:0"
+    args += ["-map", "0:v:0", "-map", audio_map, "-t", f"{seconds:.6f}"]
+    args += profile.video_args(fps, threads)
+    args += profile.audio_args() + ["-ar", str(AUDIO_RATE), "-ac", str(AUDIO_CHANNELS), "-af", "apad"]
+    partial = out_path + f".{os.getpid()}.{threading.get_ident()}.part.mp4"
+    try:
+        run_ffmpeg(args + ["-video_track_timescale", str(VIDEO_TIMESCALE),
+                           "-movflags", "+faststart", partial], cancel=cancel)
+        os.replace(partial, out_path)
+    finally:
+        if os.path.exists(partial):
+            os.remove(partial)
+    return out_path
+
+
+class ReelStats:
+    def __init__(self, clips, normalized, reused, encode_seconds, reel_seconds):
+        self.clips = clips
+        self.normalized = normalized
+        self.reused = reused
+        self.encode_seconds = encode_seconds
+        self.reel_seconds = reel_seconds
+
+    def describe(self):
+        return (f"{self.clips} clip, mã hóa {self.normalized} ({self.encode_seconds:.1f}s), "
+                f"dùng lại {self.reused}, reel {self.reel_seconds:.2f}s")
+
+
+def build_reel(clips, profile=None, workers=None, cache_dir=DEFAULT_PLAYLIST_CACHE,
+               cancel=None, stats=DISABLED):
+    """Chuẩn hóa (song song, có cache) và ghép các clip thành một lượt reel; trả về (đường dẫn, ReelStats)"""
+    if not clips:
+        raise LoopExportError("Playlist trống.")
+    for clip in clips:
+        if not os.path.isfile(clip):
+            raise LoopExportError(f"File không tồn tại: {clip}")
+    profile = profile or profile_for(clips)
+    os.makedirs(cache_dir, exist_ok=True)
+
+    with stats.stage("playlist.hash"):
+        units = [normalized_path(clip, profile, cache_dir) for clip in clips]
+    # Clip trùng nội dung chỉ mã hóa một lần
+    pending = {}
+    for clip, unit in zip(clips, units):
+        if not os.path.exists(unit):
+            pending.setdefault(unit, clip)
+        else:
+            # Đánh dấu vừa dùng để prune_cache giữ lại
+            os.utime(unit)
+
+    cpus = os.cpu_count() or 1
+    workers = max(1, min(workers or cpus, len(pending) or 1))
+    begin = time.perf_counter()
+    if pending:
+        with stats.stage("playlist.normalize"):
+            with ThreadPoolExecutor(max_workers=workers) as pool:
+                # Mỗi clip là một tiến trình ffmpeg, chia đều số luồng CPU
+                futures = [
+                    pool.submit(normalize_clip, clip, profile, unit, max(1, cpus // workers), cancel)
+                    for unit, clip in pending.items()
+                ]
+                for future in futures:
+                    future.result()
+    encode_seconds = time.perf_counter() - begin
+
+    # Reel cũng được cache theo danh sách đơn vị: cùng playlist thì không ghép lại
+    reel_key = hashlib.sha1("\n".join(units).encode("utf-8")).hexdigest()
+    reel_path = os.path.join(cache_dir, f"reel_{reel_key}.mp4")
+    if not os.path.exists(reel_path):
+        with stats.stage("playlist.assemble"):
+            fd, list_path = tempfile.mkstemp(suffix=".txt", prefix="reel_", dir=cache_dir)
+            partial = reel_path + f".{os.getpid()}.part.mp4"
+            try:
+                with os.fdopen(fd, "w") as f:
+                    for unit in units:
+                        f.write(f"file '{unit}'\n")
+                run_ffmpeg([
+                    "-f", "concat", "-safe", "0", "-i", list_path,
+                    "-map", "0", "-c", "copy", "-movflags", "+faststart", partial
+                ], cancel=cancel)
+                os.replace(partial, reel_path)
+            finally:
+                for path in (list_path, partial):
+                    if os.path.exists(path):
+                        os.remove(path)
+    else:
+        os.utime(reel_path)
+    prune_cache(cache_dir, DEFAULT_PLAYLIST_CACHE_MAX_BYTES, keep=units + [reel_path])
+    reel_seconds = probe_duration(reel_path)
+    return reel_path, ReelStats(len(clips), len(pending), len(clips) - len(pending),
+                                encode_seconds, reel_seconds)
+
+
+def export_playlist(clips, target_seconds, save_path, profile=None, workers=None,
+                    cache_dir=DEFAULT_PLAYLIST_CACHE, chunk_seconds=None,
+                    on_progress=None, cancel=None, stats=DISABLED):
+    """Chuẩn hóa + ghép reel rồi lặp tới target_seconds bằng -c copy; trả về ReelStats"""
+    from export_job import DEFAULT_CHUNK_SECONDS, ExportJob
+
+    reel_path, reel_stats = build_reel(clips, profile, workers, cache_dir, cancel, stats)
+    plan_target(reel_stats.reel_seconds, target_seconds / 60)
+    ExportJob(
+        reel_path, target_seconds, save_path, mode="stream_loop",
+        chunk_seconds=chunk_seconds or DEFAULT_CHUNK_SECONDS
+    ).run(on_progress=on_progress, cancel=cancel, stats=stats)
+    return reel_stats
+
+
+def read_playlist(path):
+    """File danh sách: mỗi dòng một đường dẫn (tương đối theo thư mục của file), # là chú thích"""
+    base = os.path.dirname(os.path.abspath(path))
+    clips = []
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            line = line.strip()
+            if line and not line.startswith("#"):
+                clips.append(os.path.join(base, line))
+    return clips
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Lặp một playlist nhiều clip (reel)")
+    parser.add_argument("--clip", action="append", default=[], help="Một clip (lặp lại theo thứ tự)")
+    parser.add_argument("--list", help="File danh sách clip, mỗi dòng một đường dẫn")
+    parser.add_argument("--minutes", type=float, required=True, help="Thời lượng đầu ra (phút)")
+    parser.add_argument("--out", required=True, help="File đầu ra")
+    parser.add_argument("--scale", help="Độ phân giải chung, ví dụ 1920x1080 (mặc định theo clip đầu)")
+    parser.add_argument("--fps", type=float, help="Frame rate chung (mặc định theo clip đầu)")
+    parser.add_argument("--vcodec", default="libx264")
+    parser.add_argument("--crf", type=int, default=18)
+    parser.add_argument("--preset", default="medium")
+    parser.add_argument("--workers", type=int, help="Số clip chuẩn hóa song song")
+    parser.add_argument("--progress", action="store_true")
+    args = parser.parse_args(argv)
+
+    clips = list(args.clip)
+    if args.list:
+        clips += read_playlist(args.list)
+    if not clips:
+        parser.error("Chưa có clip nào (dùng --clip hoặc --list)")
+
+    start = time.perf_counter()
+    try:
+        # Luôn dựng profile từ tham số dòng lệnh (kể cả --crf), mặc định theo clip đầu
+        base = profile_for(clips, args.crf)
+        width, height = EncodeProfile.parse_size(args.scale) if args.scale else (base.width, base.height)
+        profile = EncodeProfile(width=width, height=height, vcodec=args.vcodec, crf=args.crf,
+                                preset=args.preset, fps=args.fps or base.fps)
+        reel_stats = export_playlist(
+            clips, args.minutes * 60, args.out, profile=profile, workers=args.workers,
+            on_progress=progress_logger(args.out) if args.progress else None
+        )
+    except (LoopExportError, FFmpegError, OSError, ValueError) as e:
+        print(f"❌ {e}")
+        return 1
+    print(f"✅ {args.out}: {reel_stats.describe()}, {time.perf_counter() - start:.1f}s")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
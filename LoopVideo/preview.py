@@ -0,0 +1,334 @@
+"""Preview loop: pipeline giải mã nền + hiển thị theo deadline, có cache frame trong RAM.
+
+Lần lặp đầu giải mã và thu nhỏ trên các luồng phụ, các lần sau phát thẳng
+từ bộ nhớ. Phần hiển thị không phụ thuộc Tk: chỉ cần hàm schedule(ms, fn)
+kiểu root.after và hàm display(frame_rgb).
+"""
+import os
+import queue
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import Future, ThreadPoolExecutor, wait
+
+import numpy as np
+
+from backends import BackendError, bgr_to_rgb, open_video, resize_area
+from instrument import DISABLED
+
+# Ngân sách bộ nhớ mặc định cho cache preview (MB), đổi qua biến môi trường
+DEFAULT_CACHE_MB = float(os.environ.get("VIDEOLOOP_CACHE_MB", "512"))
+
+# Chiều rộng khung preview (px)
+PREVIEW_WIDTH = 400
+
+
+class FrameBuffer:
+    """Các frame hiển thị (RGB đã thu nhỏ) của một đoạn loop, nằm liền trong một mảng numpy"""
+
+    def __init__(self, key, frame_count, height, width):
+        self.key = key
+        self.frames = np.empty((frame_count, height, width, 3), dtype=np.uint8)
+        self.filled = 0
+        self.complete = False
+
+    @property
+    def nbytes(self):
+        return self.frames.nbytes
+
+    def __len__(self):
+        return self.filled
+
+    def slot(self, index):
+        """View vào vị trí index để worker ghi frame trực tiếp, None nếu vượt quá buffer"""
+        if index >= len(self.frames):
+            return None
+        return self.frames[index]
+
+    def finish(self, count):
+        # Số frame thực tế có thể ít hơn CAP_PROP_FRAME_COUNT (chỉ là ước lượng)
+        self.filled = min(count, len(self.frames))
+        if self.filled < len(self.frames):
+            self.frames = self.frames[:self.filled].copy()
+        self.complete = self.filled > 0
+
+
+class FrameCache:
+    """Cache LRU các FrameBuffer, tổng dung lượng không vượt quá budget_bytes"""
+
+    def __init__(self, budget_bytes=None):
+        if budget_bytes is None:
+            budget_bytes = int(DEFAULT_CACHE_MB * 1024 * 1024)
+        self.budget_bytes = budget_bytes
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    @property
+    def used_bytes(self):
+        with self._lock:
+            return sum(buf.nbytes for buf in self._entries.values())
+
+    def get(self, key):
+        """Trả về buffer đã đầy đủ cho key, None nếu chưa có"""
+        with self._lock:
+            buf = self._entries.get(key)
+            if buf is None or not buf.complete:
+                return None
+            self._entries.move_to_end(key)
+            return buf
+
+    def reserve(self, key, frame_count, height, width):
+        """Cấp buffer mới cho key, loại bỏ các mục cũ nhất nếu cần.
+
+        Trả về None khi đoạn loop không vừa ngân sách; khi đó preview
+        giải mã trực tiếp như bình thường.
+        """
+        needed = frame_count * height * width * 3
+        if frame_count <= 0 or needed > self.budget_bytes:
+            return None
+        with self._lock:
+            self._entries.pop(key, None)
+            used = sum(buf.nbytes for buf in self._entries.values())
+            while self._entries and used + needed > self.budget_bytes:
+                _, evicted = self._entries.popitem(last=False)
+                used -= evicted.nbytes
+            buf = FrameBuffer(key, frame_count, height, width)
+            self._entries[key] = buf
+            return buf
+
+    def discard(self, key):
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+def display_size(frame_shape, width=PREVIEW_WIDTH):
+    height = max(1, int(width * frame_shape[0] / frame_shape[1]))
+    return width, height
+
+
+def to_display(frame, size, out, stats=DISABLED):
+    """Thu nhỏ (INTER_AREA) rồi đổi BGR→RGB ghi thẳng vào out"""
+    with stats.stage("preview.resize"):
+        small = resize_area(frame, size)
+    with stats.stage("preview.color"):
+        bgr_to_rgb(small, out)
+    return out
+
+
+class PreviewPipeline:
+    """Producer giải mã/thu nhỏ trên luồng phụ, consumer hiển thị theo đồng hồ monotonic.
+
+    Consumer chạy trên luồng gọi schedule (luồng Tk khi dùng root.after).
+    Frame nào đã quá hạn khi frame sau cũng tới hạn sẽ bị bỏ qua để
+    preview luôn chạy đúng tốc độ thực.
+    """
+
+    def __init__(self, video_path, start_frame, end_frame, fps, display, schedule,
+                 cache=None, width=PREVIEW_WIDTH, queue_size=8, workers=2,
+                 clock=time.monotonic, on_error=None, seek_frame=None, backend=None,
+                 stats=DISABLED):
+        self.video_path = video_path
+        self.start_frame = start_frame
+        # Keyframe tại hoặc trước start_frame (từ chỉ mục media): seek tới đó rồi
+        # grab tiếp, tránh CAP_PROP_POS_FRAMES lệch frame ở nhiều container
+        self.seek_frame = start_frame if seek_frame is None else min(seek_frame, start_frame)
+        self.end_frame = end_frame
+        self.fps = fps if fps and fps > 0 else 30
+        self.display = display
+        self.schedule = schedule
+        self.cache = cache
+        self.width = width
+        self.clock = clock
+        self.on_error = on_error
+        self.backend = backend
+        self.stats = stats
+        self.key = (video_path, start_frame, end_frame, width)
+
+        self.shown = 0
+        self.dropped = 0
+        self.skipped = 0
+        self.error = None
+
+        self._frames = queue.Queue(maxsize=queue_size)
+        self._pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="preview-resize")
+        self._stop = threading.Event()
+        self._pending = None
+        self._producer = None
+        # Mốc thời gian của frame 0, đặt khi frame đầu tiên sẵn sàng (không tính thời gian mở video)
+        self._t0 = None
+
+    @property
+    def running(self):
+        return self._producer is not None and not self._stop.is_set()
+
+    def start(self):
+        self.stats.gauge("preview.target_fps", self.fps)
+        self._producer = threading.Thread(target=self._produce, daemon=True)
+        self._producer.start()
+        self.schedule(0, self._tick)
+
+    def stop(self):
+        self._stop.set()
+        if self._producer:
+            self._producer.join(timeout=1.0)
+        self._pool.shutdown(wait=False)
+
+    def _deadline(self, seq):
+        return self._t0 + seq / self.fps
+
+    # --- Producer (luồng phụ) ---
+
+    def _put(self, seq, payload):
+        while not self._stop.is_set():
+            try:
+                self._frames.put((seq, payload), timeout=0.1)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def _produce(self):
+        cap = None
+        seq = 0
+        try:
+            while not self._stop.is_set():
+                cached = self.cache.get(self.key) if self.cache is not None else None
+                if cached is not None:
+                    # Đã có trong RAM: phát lại không cần giải mã
+                    for frame in cached.frames:
+                        if not self._put(seq, frame):
+                            return
+                        seq += 1
+                    continue
+
+                if cap is None:
+                    try:
+                        cap = open_video(self.video_path, self.backend, self.fps)
+                    except (BackendError, IOError, OSError) as e:
+                        self.error = f"Không mở được video:\n{self.video_path}\n{e}"
+                        return
+                seq = self._produce_pass(cap, seq)
+                if seq is None:
+                    return
+        finally:
+            if cap is not None:
+                cap.release()
+
+    def _produce_pass(self, cap, seq):
+        """Giải mã một lượt start→end, trả về seq tiếp theo hoặc None nếu phải dừng"""
+        buffer = None
+        futures = []
+        size = None
+        count = 0
+        with self.stats.stage("preview.seek"):
+            cap.seek(self.seek_frame)
+            for _ in range(self.start_frame - self.seek_frame):
+                if self._stop.is_set() or not cap.grab():
+                    break
+        for i in range(self.start_frame, self.end_frame + 1):
+            if self._stop.is_set():
+                break
+            if (buffer is None and size is not None and self._t0 is not None
+                    and self._deadline(seq + 1) < self.clock()):
+                # Đã trễ hơn một frame: chỉ grab, không chuyển đổi frame sẽ bị bỏ.
+                # Khi đang ghi cache thì vẫn chuyển đổi đủ mọi frame (consumer tự bỏ frame trễ)
+                # để lượt sau phát được từ RAM dù nguồn không giải mã kịp thời gian thực
+                with self.stats.stage("preview.grab"):
+                    grabbed = cap.grab()
+                if not grabbed:
+                    break
+                self.skipped += 1
+                self.stats.count("preview.skipped")
+                seq += 1
+                count += 1
+                continue
+            with self.stats.stage("preview.read"):
+                ret, frame = cap.read()
+            if not ret:
+                break
+            if size is None:
+                size = display_size(frame.shape, self.width)
+                if self.cache is not None and i == self.start_frame:
+                    # Không vừa ngân sách thì reserve trả về None, tiếp tục giải mã trực tiếp
+                    buffer = self.cache.reserve(
+                        self.key, self.end_frame - self.start_frame + 1, size[1], size[0]
+                    )
+            out = buffer.slot(count) if buffer is not None else None
+            if out is None:
+                out = np.empty((size[1], size[0], 3), dtype=np.uint8)
+            future = self._pool.submit(to_display, frame, size, out, self.stats)
+            if buffer is not None:
+                futures.append(future)
+            if not self._put(seq, future):
+                break
+            seq += 1
+            count += 1
+
+        if count == 0 and not self._stop.is_set():
+            self.error = "Không đọc được frame nào trong đoạn loop."
+            return None
+        if buffer is not None:
+            if not self._stop.is_set():
+                wait(futures)
+                buffer.finish(count)
+            else:
+                # Lượt dở dang: không dùng làm cache
+                self.cache.discard(self.key)
+        return None if self._stop.is_set() else seq
+
+    # --- Consumer (luồng của schedule) ---
+
+    def _ready(self, item):
+        payload = item[1]
+        return not isinstance(payload, Future) or payload.done()
+
+    def _tick(self):
+        if self._stop.is_set():
+            return
+        if self.error is not None and self._pending is None and self._frames.empty():
+            # Producer đã dừng vì lỗi và không còn frame nào để hiển thị
+            self._stop.set()
+            if self.on_error:
+                self.on_error(self.error)
+            return
+        now = self.clock()
+        due = None
+        while True:
+            if self._pending is None:
+                try:
+                    self._pending = self._frames.get_nowait()
+                except queue.Empty:
+                    break
+            if self._t0 is None:
+                if not self._ready(self._pending):
+                    break
+                self._t0 = now - self._pending[0] / self.fps
+            if self._deadline(self._pending[0]) > now or not self._ready(self._pending):
+                break
+            if due is not None:
+                self.dropped += 1
+                self.stats.count("preview.dropped")
+            due = self._pending
+            self._pending = None
+
+        if due is not None:
+            payload = due[1]
+            if self.stats.enabled:
+                # Trễ so với deadline lúc bắt đầu hiển thị, và số frame đang chờ trong queue
+                self.stats.record("preview.late", max(0.0, now - self._deadline(due[0])) * 1000.0)
+                self.stats.gauge("preview.queue", self._frames.qsize())
+            with self.stats.stage("preview.display"):
+                self.display(payload.result() if isinstance(payload, Future) else payload)
+            self.shown += 1
+            self.stats.tick("preview.fps")
+
+        if self._pending is not None and self._t0 is not None and self._ready(self._pending):
+            delay = self._deadline(self._pending[0]) - self.clock()
+        else:
+            # Chưa có frame kế tiếp: thử lại sau nửa chu kỳ frame
+            delay = 0.5 / self.fps
+        self.schedule(max(1, int(delay * 1000)), self._tick)
@@ -0,0 +1,265 @@
+"""Chế độ mã hóa lại song song: chỉ mã hóa một đơn vị lặp, chia thành nhiều chunk.
+
+Video đầu ra lặp lại nên chỉ cần mã hóa nội dung của một lượt. Lượt đó được
+chia theo keyframe thành các chunk, mỗi chunk là một tiến trình ffmpeg riêng
+chạy song song; audio được mã hóa một lần cho cả lượt. Đơn vị đã mã hóa được
+lưu trong cache (theo file nguồn + đoạn + thông số) để lần export sau dùng lại,
+rồi được lặp bằng -stream_loop -c copy.
+"""
+import bisect
+import hashlib
+import os
+import shutil
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from ffmpeg_utils import FFmpegProgress, parse_rate, probe_duration, probe_streams, run_ffmpeg
+from media_index import source_key
+
+DEFAULT_CACHE_DIR = os.environ.get(
+    "VIDEOLOOP_UNIT_CACHE",
+    os.path.join(os.path.expanduser("~"), ".cache", "videoloop", "units")
+)
+# Giới hạn dung lượng cache đơn vị; vượt quá thì xóa đơn vị ít dùng nhất
+DEFAULT_CACHE_MAX_BYTES = int(float(os.environ.get("VIDEOLOOP_UNIT_CACHE_GB", "20")) * 1024 ** 3)
+
+
+def prune_cache(cache_dir, max_bytes, keep=(), suffix=".mp4"):
+    """Xóa file *suffix cũ nhất tới khi tổng dung lượng không vượt max_bytes.
+
+    Thứ tự theo mtime (cache hit cập nhật mtime nên đây là LRU); các đường
+    dẫn trong keep không bị xóa. Trả về số byte đã giải phóng.
+    """
+    keep = {os.path.abspath(path) for path in keep}
+    entries = []
+    try:
+        scan = list(os.scandir(cache_dir))
+    except OSError:
+        return 0
+    for entry in scan:
+        if entry.is_file() and entry.name.endswith(suffix) and ".part" not in entry.name:
+            try:
+                st = entry.stat()
+            except OSError:
+                continue
+            entries.append((st.st_mtime, st.st_size, os.path.abspath(entry.path)))
+    total = sum(size for _, size, _ in entries)
+    freed = 0
+    for _, size, path in sorted(entries):
+        if total <= max_bytes:
+            break
+        if path in keep:
+            continue
+        try:
+            os.remove(path)
+        except OSError:
+            continue
+        total -= size
+        freed += size
+    return freed
+
+
+class EncodeProfile:
+    """Thông số đầu ra khi mã hóa lại (độ phân giải, codec, bitrate...)"""
+
+    def __init__(self, width=None, height=None, vcodec="libx264", bitrate=None, crf=None,
+                 preset="medium", fps=None, pix_fmt="yuv420p", acodec="aac",
+                 audio_bitrate="192k"):
+        self.width = width
+        self.height = height
+        self.vcodec = vcodec
+        self.bitrate = bitrate
+        self.crf = crf
+        self.preset = preset
+        self.fps = fps
+        self.pix_fmt = pix_fmt
+        self.acodec = acodec
+        self.audio_bitrate = audio_bitrate
+
+    @classmethod
+    def parse_size(cls, value):
+        """"1920x1080" → (1920, 1080)"""
+        width, _, height = value.lower().partition("x")
+        return int(width), int(height)
+
+    def key(self):
+        return (f"{self.width}x{self.height}|{self.vcodec}|{self.bitrate}|{self.crf}|"
+                f"{self.preset}|{self.fps}|{self.pix_fmt}|{self.acodec}|{self.audio_bitrate}")
+
+    def video_filter(self, fps):
+        filters = []
+        if self.width and self.height:
+            # Giữ tỉ lệ, thêm viền đen nếu khác khung hình đích
+            filters.append(
+                f"scale={self.width}:{self.height}:force_original_aspect_ratio=decrease,"
+                f"pad={self.width}:{self.height}:(ow-iw)/2:(oh-ih)/2,setsar=1"
+            )
+        filters.append(f"fps={fps}")
+        filters.append(f"format={self.pix_fmt}")
+        return ",".join(filters)
+
+    def video_args(self, fps, threads=None):
+        args = ["-vf", self.video_filter(fps), "-c:v", self.vcodec]
+        if self.vcodec in ("libx264", "libx265"):
+            args += ["-preset", self.preset]
+        if self.bitrate:
+            args += ["-b:v", self.bitrate, "-maxrate", self.bitrate, "-bufsize", self.bitrate]
+        elif self.crf is not None:
+            args += ["-crf", str(self.crf)]
+        if threads:
+            args += ["-threads", str(threads)]
+        return args
+
+    def audio_args(self):
+        return ["-c:a", self.acodec, "-b:a", self.audio_bitrate]
+
+
+class ReencodeStats:
+    def __init__(self, unit_path, unit_seconds, encode_seconds, chunks, workers, cache_hit):
+        self.unit_path = unit_path
+        self.unit_seconds = unit_seconds
+        self.encode_seconds = encode_seconds
+        self.chunks = chunks
+        self.workers = workers
+        self.cache_hit = cache_hit
+
+    def describe(self):
+        if self.cache_hit:
+            return f"dùng lại đơn vị đã mã hóa ({self.unit_seconds:.2f}s)"
+        return (f"mã hóa {self.unit_seconds:.2f}s trong {self.encode_seconds:.1f}s "
+                f"({self.chunks} chunk, {self.workers} worker)")
+
+
+def split_chunks(start, end, chunks, keyframes=None, fps=30.0):
+    """Chia [start, end) thành tối đa `chunks` đoạn, biên đặt tại keyframe gần nhất nếu có"""
+    bounds = [start]
+    for k in range(1, chunks):
+        t = start + (end - start) * k / chunks
+        if keyframes:
+            i = bisect.bisect_left(keyframes, t)
+            near = [kf for kf in keyframes[max(0, i - 1):i + 1] if start < kf < end]
+            if near:
+                t = min(near, key=lambda kf: abs(kf - t))
+        # Đặt biên đúng lưới frame để các chunk ghép lại không thừa/thiếu frame
+        t = round(t * fps) / fps
+        if t > bounds[-1]:
+            bounds.append(t)
+    bounds.append(end)
+    return [(a, b) for a, b in zip(bounds, bounds[1:]) if b > a]
+
+
+def _encode_video_chunk(video_path, start, end, fps, profile, threads, out_path, cancel=None,
+                        on_progress=None):
+    frames = int(round(end * fps)) - int(round(start * fps))
+    run_ffmpeg([
+        "-ss", f"{start:.6f}", "-i", video_path,
+        "-map", "0:v:0", "-an",
+        "-frames:v", str(frames),
+    ] + profile.video_args(fps, threads) + [out_path], duration=end - start,
+        on_progress=on_progress, cancel=cancel)
+
+
+def unit_cache_path(video_path, loop_range, profile, cache_dir=DEFAULT_CACHE_DIR):
+    key = f"{source_key(video_path)}|{loop_range[0]:.6f}-{loop_range[1]:.6f}|{profile.key()}"
+    return os.path.join(cache_dir, hashlib.sha1(key.encode("utf-8")).hexdigest() + ".mp4")
+
+
+def build_reencoded_unit(video_path, loop_range, profile, keyframes=None, workers=None,
+                         cache_dir=DEFAULT_CACHE_DIR, streams=None, cancel=None, on_progress=None):
+    """Mã hóa một lượt loop_range theo profile, song song theo chunk; trả về ReencodeStats.
+
+    on_progress nhận FFmpegProgress gộp của tất cả chunk video (tính trên thời lượng một lượt).
+    """
+    if streams is None:
+        streams = probe_streams(video_path)
+    if streams["video"] is None:
+        raise ValueError(f"Không có luồng video: {video_path}")
+    if loop_range is None:
+        loop_range = (0.0, streams["duration"] or probe_duration(video_path))
+
+    cached = unit_cache_path(video_path, loop_range, profile, cache_dir)
+    if os.path.exists(cached):
+        # Đánh dấu vừa dùng để prune_cache giữ lại
+        os.utime(cached)
+        return ReencodeStats(cached, probe_duration(cached), 0.0, 0, 0, True)
+
+    fps = profile.fps or parse_rate(streams["video"].get("r_frame_rate")) or 30.0
+    cpus = os.cpu_count() or 1
+    workers = workers or cpus
+    start, end = loop_range
+    # Chunk ngắn quá thì chi phí khởi động ffmpeg lớn hơn lợi ích
+    chunks = split_chunks(start, end, max(1, min(workers, int((end - start) // 2) or 1)), keyframes, fps)
+    threads = max(1, cpus // len(chunks))
+
+    os.makedirs(cache_dir, exist_ok=True)
+    work_dir = tempfile.mkdtemp(prefix="reencode_", dir=cache_dir)
+    begin = time.perf_counter()
+    # Số giây đã mã hóa của từng chunk; list cố định nên cộng dồn an toàn giữa các luồng
+    encoded = [0.0] * len(chunks)
+
+    def track(i):
+        if on_progress is None:
+            return None
+
+        def update(info):
+            length = chunks[i][1] - chunks[i][0]
+            encoded[i] = length if info.done else min(info.out_time, length)
+            on_progress(FFmpegProgress(
+                out_time=sum(encoded), duration=end - start,
+                elapsed=time.perf_counter() - begin
+            ))
+
+        return update
+
+    try:
+        chunk_paths = [os.path.join(work_dir, f"chunk_{i:04d}.mkv") for i in range(len(chunks))]
+        with ThreadPoolExecutor(max_workers=min(workers, len(chunks))) as pool:
+            # Mỗi chunk là một tiến trình ffmpeg; luồng ở đây chỉ chờ tiến trình
+            futures = [
+                pool.submit(_encode_video_chunk, video_path, a, b, fps, profile, threads, path,
+                            cancel, track(i))
+                for i, ((a, b), path) in enumerate(zip(chunks, chunk_paths))
+            ]
+            audio_path = None
+            if streams["audio"] is not None:
+                audio_path = os.path.join(work_dir, "audio.mka")
+                futures.append(pool.submit(run_ffmpeg, [
+                    "-ss", f"{start:.6f}", "-i", video_path, "-t", f"{end - start:.6f}",
+                    "-map", "0:a:0", "-vn",
+                ] + profile.audio_args() + [audio_path], cancel=cancel))
+            for future in futures:
+                future.result()
+
+        list_path = os.path.join(work_dir, "chunks.txt")
+        with open(list_path, "w") as f:
+            for path in chunk_paths:
+                f.write(f"file '{path}'\n")
+        args = ["-f", "concat", "-safe", "0", "-i", list_path]
+        if audio_path:
+            args += ["-i", audio_path, "-map", "0:v:0", "-map", "1:a:0"]
+        partial = os.path.join(work_dir, "unit.mp4")
+        run_ffmpeg(args + ["-c", "copy", "-movflags", "+faststart", partial], cancel=cancel)
+        # Chỉ đưa vào cache khi đã hoàn chỉnh
+        os.replace(partial, cached)
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+    prune_cache(cache_dir, DEFAULT_CACHE_MAX_BYTES, keep=[cached])
+    return ReencodeStats(
+        cached, probe_duration(cached), time.perf_counter() - begin,
+        len(chunks), min(workers, len(chunks)), False
+    )
+
+
+def export_naive_reencode(video_path, target_seconds, save_path, profile, streams=None):
+    """Mã hóa lại toàn bộ đầu ra bằng một tiến trình ffmpeg (mốc so sánh cho benchmark)"""
+    if streams is None:
+        streams = probe_streams(video_path)
+    fps = profile.fps or parse_rate(streams["video"].get("r_frame_rate")) or 30.0
+    args = [
+        "-stream_loop", "-1", "-i", video_path,
+        "-t", f"{target_seconds:.6f}",
+    ] + profile.video_args(fps)
+    if streams["audio"] is not None:
+        args += profile.audio_args()
+    run_ffmpeg(args + [save_path])
@@ -0,0 +1,884 @@
+"""Chế độ service: hàng đợi job export chạy nền, nhận job qua HTTP cục bộ, Unix socket hoặc thư mục theo dõi.
+
+    python service.py serve --workers 2 --min-free-gb 20
+    python service.py serve --socket /tmp/videoloop.sock --watch /srv/drop --watch-minutes 60
+    python service.py submit clip.mp4 60 --out ~/Videos/clip_loop.mp4 --wait
+    python service.py status [JOB_ID]
+    python service.py queue
+    python service.py cancel JOB_ID
+
+API (JSON):
+    POST   /jobs        {"input", "minutes", "output"?, "mode"?, "find_loop"?, "fade"?, "verify"?,
+                         "scale"?, "vcodec"?, "bitrate"?, "crf"?, "preset"?, "fps"?}
+    GET    /jobs        danh sách job          GET /jobs/<id>   trạng thái một job
+    DELETE /jobs/<id>   hủy job                GET /queue       hàng đợi, dung lượng đĩa, cache
+
+Mỗi yêu cầu được quy về một khóa (hash nội dung file nguồn + thông số). Kết
+quả nằm trong cache theo khóa đó: yêu cầu giống hệt một job đang chờ/chạy được
+gộp vào job đó, yêu cầu giống một kết quả đã có thì xong ngay (đầu ra được tạo
+bằng hard link nếu cùng ổ đĩa). Job ghi đầu ra trong thư mục work/ và chỉ được
+chuyển vào cache khi export (và kiểm tra) thành công. Số job chạy đồng thời bị
+giới hạn bởi số worker; job chỉ được bắt đầu khi dung lượng trống trừ phần đã
+giữ cho các job đang chạy vẫn còn trên mức tối thiểu, nếu không thì chờ theo
+thứ tự hàng đợi. Hàng đợi chỉ nằm trong bộ nhớ; job bị dừng giữa chừng được
+tiếp tục từ manifest khi gửi lại, và thư mục theo dõi được quét lại khi service
+khởi động.
+
+POST/DELETE phải có Content-Type application/json (trang web lạ không gửi được
+request như vậy tới 127.0.0.1 mà không qua preflight CORS), và nếu đặt token
+(--token hoặc VIDEOLOOP_SERVICE_TOKEN) thì mọi request phải kèm header
+X-VideoLoop-Token. Đầu ra chỉ được ghi trong các thư mục --output-root (mặc định
+~/Videos) và thư mục đầu ra của thư mục theo dõi.
+"""
+import argparse
+import hmac
+import http.client
+import json
+import os
+import shutil
+import signal
+import socket
+import socketserver
+import sys
+import threading
+import time
+import uuid
+from collections import deque
+from hashlib import sha256
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlparse
+
+from ffmpeg_utils import FFmpegError, format_seconds
+from loop_engine import DEFAULT_FADE_SECONDS, EXPORT_MODES, LoopJob, run_job
+from media_index import load_index
+from playlist import content_hash
+from reencode import EncodeProfile, prune_cache
+
+DEFAULT_RESULT_CACHE = os.environ.get(
+    "VIDEOLOOP_RESULT_CACHE",
+    os.path.join(os.path.expanduser("~"), ".cache", "videoloop", "results")
+)
+# Đầu ra của job chỉ được ghi bên trong các thư mục gốc này (thêm bằng --output-root)
+DEFAULT_OUTPUT_ROOT = os.environ.get(
+    "VIDEOLOOP_OUTPUT_ROOT", os.path.join(os.path.expanduser("~"), "Videos")
+)
+# Token dùng chung: khi đặt, mọi request phải gửi kèm header TOKEN_HEADER
+DEFAULT_TOKEN = os.environ.get("VIDEOLOOP_SERVICE_TOKEN") or None
+TOKEN_HEADER = "X-VideoLoop-Token"
+DEFAULT_HOST = "127.0.0.1"
+DEFAULT_PORT = 8765
+VIDEO_EXTENSIONS = (".mp4", ".avi", ".mov", ".mkv")
+# Giữ lại chừng này job đã kết thúc để tra trạng thái
+MAX_FINISHED_JOBS = 1000
+# Dự phòng cho chunk dùng chung và file .part khi ghép
+SIZE_MARGIN = 1.1
+FINISHED_STATES = ("done", "failed", "cancelled")
+
+
+class ServiceError(Exception):
+    def __init__(self, message, status=400):
+        super().__init__(message)
+        self.status = status
+
+
+def _format_bytes(n):
+    if n >= 1024 ** 3:
+        return f"{n / (1024 ** 3):.1f} GB"
+    return f"{n / (1024 ** 2):.1f} MB"
+
+
+def parse_request(data):
+    """Kiểm tra và chuẩn hóa yêu cầu job (dict từ JSON)"""
+    if not isinstance(data, dict):
+        raise ServiceError("Yêu cầu phải là một object JSON.")
+    if not data.get("input"):
+        raise ServiceError("Thiếu trường input.")
+    for name in ("input", "output", "mode", "scale", "vcodec", "bitrate", "preset"):
+        if data.get(name) is not None and not isinstance(data[name], str):
+            raise ServiceError(f"{name} phải là chuỗi.")
+    input_path = os.path.abspath(data["input"])
+    if not os.path.isfile(input_path):
+        raise ServiceError(f"File không tồn tại: {input_path}")
+    try:
+        minutes = float(data.get("minutes", 0))
+    except (TypeError, ValueError):
+        raise ServiceError("minutes phải là số.")
+    if minutes <= 0:
+        raise ServiceError("minutes phải lớn hơn 0.")
+    mode = data.get("mode", "stream_loop")
+    if mode not in EXPORT_MODES:
+        raise ServiceError(f"mode không hợp lệ: {mode}")
+    try:
+        fade = float(data.get("fade", DEFAULT_FADE_SECONDS))
+    except (TypeError, ValueError):
+        raise ServiceError("fade phải là số.")
+    request = {
+        "input": input_path,
+        "minutes": minutes,
+        "mode": mode,
+        "find_loop": bool(data.get("find_loop", False)),
+        "verify": bool(data.get("verify", False)),
+        "fade": fade,
+        "output": os.path.abspath(data["output"]) if data.get("output") else None,
+    }
+    if mode == "reencode":
+        try:
+            width, height = EncodeProfile.parse_size(data["scale"]) if data.get("scale") else (None, None)
+            request["profile"] = EncodeProfile(
+                width=width, height=height, vcodec=data.get("vcodec", "libx264"),
+                bitrate=data.get("bitrate"),
+                crf=int(data["crf"]) if data.get("crf") is not None else None,
+                preset=data.get("preset", "medium"),
+                fps=float(data["fps"]) if data.get("fps") else None
+            )
+        except (TypeError, ValueError):
+            raise ServiceError("Thông số mã hóa không hợp lệ.")
+    return request
+
+
+def request_key(request):
+    """Khóa của kết quả: cùng nội dung nguồn + cùng thông số ảnh hưởng đầu ra → cùng file"""
+    parts = {
+        "source": content_hash(request["input"]),
+        "minutes": request["minutes"],
+        "mode": request["mode"],
+        "find_loop": request["find_loop"],
+        # Kết quả chưa kiểm tra không được dùng để trả lời yêu cầu có verify
+        "verify": request["verify"],
+    }
+    if request["mode"] == "crossfade":
+        parts["fade"] = request["fade"]
+    if request.get("profile") is not None:
+        parts["profile"] = request["profile"].key()
+    return sha256(json.dumps(parts, sort_keys=True).encode("utf-8")).hexdigest()[:32]
+
+
+def resolve_output(path, roots):
+    """Đường dẫn thật của đầu ra; từ chối nếu nằm ngoài mọi thư mục gốc cho phép"""
+    real = os.path.realpath(path)
+    for root in roots:
+        root = os.path.realpath(root)
+        if real != root and os.path.commonpath([real, root]) == root:
+            return real
+    raise ServiceError(f"Đầu ra phải nằm trong {', '.join(roots)}: {path}", status=403)
+
+
+def estimate_output_bytes(input_path, minutes):
+    """Ước lượng dung lượng cần cho đầu ra theo bitrate trung bình của nguồn"""
+    duration = max(load_index(input_path).duration, 1e-3)
+    return int(os.path.getsize(input_path) / duration * minutes * 60 * SIZE_MARGIN)
+
+
+def deliver(result_path, dest):
+    """Tạo dest từ file kết quả: hard link nếu được, không thì copy; ghi đè nguyên tử"""
+    if os.path.abspath(dest) == os.path.abspath(result_path):
+        return
+    os.makedirs(os.path.dirname(os.path.abspath(dest)), exist_ok=True)
+    partial = f"{dest}.{os.getpid()}.{threading.get_ident()}.part"
+    try:
+        try:
+            os.link(result_path, partial)
+        except OSError:
+            shutil.copyfile(result_path, partial)
+        os.replace(partial, dest)
+    finally:
+        if os.path.exists(partial):
+            os.remove(partial)
+
+
+class ServiceJob:
+    def __init__(self, job_id, request, key):
+        self.id = job_id
+        self.request = request
+        self.key = key
+        self.outputs = [request["output"]] if request["output"] else []
+        self.state = "queued"
+        self.created = time.time()
+        self.started = None
+        self.finished = None
+        self.percent = 0.0
+        self.progress = None
+        self.error = None
+        self.cached = False
+        self.duplicates = 0
+        self.result_path = None
+        self.reserved_bytes = 0
+        self.cancel = threading.Event()
+
+    def on_progress(self, info):
+        self.percent = info.percent
+        self.progress = info.describe()
+
+    def to_dict(self):
+        end = self.finished or time.time()
+        return {
+            "id": self.id,
+            "state": self.state,
+            "input": self.request["input"],
+            "minutes": self.request["minutes"],
+            "mode": self.request["mode"],
+            "outputs": list(self.outputs),
+            "result": self.result_path,
+            "cached": self.cached,
+            "duplicates": self.duplicates,
+            "percent": self.percent,
+            "progress": self.progress,
+            "error": self.error,
+            "reserved_bytes": self.reserved_bytes,
+            "created": self.created,
+            "started": self.started,
+            "finished": self.finished,
+            "elapsed": (end - self.started) if self.started else 0.0,
+        }
+
+
+class LoopService:
+    """Hàng đợi job với giới hạn số job đồng thời và dung lượng đĩa tối thiểu"""
+
+    def __init__(self, workers=1, result_dir=DEFAULT_RESULT_CACHE, min_free_bytes=0,
+                 cache_max_bytes=None, poll_seconds=1.0, output_roots=None):
+        self.workers = max(1, workers)
+        self.result_dir = result_dir
+        self.output_roots = list(output_roots or [DEFAULT_OUTPUT_ROOT])
+        self.min_free_bytes = min_free_bytes
+        self.cache_max_bytes = cache_max_bytes
+        self.poll_seconds = poll_seconds
+        os.makedirs(result_dir, exist_ok=True)
+        self.jobs = {}
+        self._queue = deque()
+        self._running = {}
+        self._inflight = {}
+        self._cond = threading.Condition()
+        self._threads = []
+        self._stopping = False
+        self.started = time.time()
+
+    def start(self):
+        for i in range(self.workers):
+            thread = threading.Thread(target=self._worker, name=f"loop-worker-{i}", daemon=True)
+            thread.start()
+            self._threads.append(thread)
+        return self
+
+    def stop(self, timeout=10.0):
+        """Dừng worker; job đang chạy bị hủy và sẽ được tiếp tục khi gửi lại"""
+        with self._cond:
+            self._stopping = True
+            for job in self._running.values():
+                job.cancel.set()
+            self._cond.notify_all()
+        for thread in self._threads:
+            thread.join(timeout)
+
+    def result_path(self, key):
+        return os.path.join(self.result_dir, f"{key}.mp4")
+
+    def scratch_path(self, key):
+        # Job ghi ở đây; chỉ file đã export và kiểm tra xong mới được chuyển vào cache
+        return os.path.join(self.result_dir, "work", f"{key}.mp4")
+
+    # --- Nhận job ---
+
+    def submit(self, data):
+        """Thêm job, trả về (ServiceJob, đã gộp vào job có sẵn hay chưa)"""
+        request = parse_request(data)
+        if request["output"]:
+            request["output"] = resolve_output(request["output"], self.output_roots)
+        try:
+            key = request_key(request)
+            reserved = estimate_output_bytes(request["input"], request["minutes"])
+        except (FFmpegError, OSError, ValueError) as e:
+            raise ServiceError(f"Không đọc được video nguồn: {e}")
+
+        with self._cond:
+            if self._stopping:
+                raise ServiceError("Service đang dừng.", status=503)
+            existing = self._inflight.get(key)
+            if existing is not None:
+                existing.duplicates += 1
+                if request["output"] and request["output"] not in existing.outputs:
+                    existing.outputs.append(request["output"])
+                return existing, True
+
+            job = ServiceJob(uuid.uuid4().hex[:12], request, key)
+            self._remember(job)
+            path = self.result_path(key)
+            if os.path.exists(path):
+                # Đã có kết quả: chỉ cần tạo file đầu ra, không chiếm worker
+                job.cached = True
+                job.result_path = path
+                job.state = "running"
+                job.started = time.time()
+                threading.Thread(target=self._finish_cached, args=(job,), daemon=True).start()
+                return job, False
+
+            job.reserved_bytes = reserved
+            self._inflight[key] = job
+            self._queue.append(job)
+            self._cond.notify()
+        return job, False
+
+    def cancel(self, job_id):
+        with self._cond:
+            job = self.get(job_id)
+            if job.state == "queued":
+                self._queue.remove(job)
+                self._inflight.pop(job.key, None)
+                self._finish(job, "cancelled", "Đã hủy trước khi chạy.")
+            elif job.state == "running":
+                job.cancel.set()
+            return job
+
+    def get(self, job_id):
+        job = self.jobs.get(job_id)
+        if job is None:
+            raise ServiceError(f"Không có job {job_id}", status=404)
+        return job
+
+    def _remember(self, job):
+        self.jobs[job.id] = job
+        if len(self.jobs) > MAX_FINISHED_JOBS + len(self._queue) + len(self._running):
+            finished = [j for j in self.jobs.values() if j.state in FINISHED_STATES]
+            finished.sort(key=lambda j: j.finished)
+            for old in finished[:len(finished) - MAX_FINISHED_JOBS]:
+                del self.jobs[old.id]
+
+    # --- Trạng thái ---
+
+    def free_bytes(self):
+        return shutil.disk_usage(self.result_dir).free
+
+    def cache_bytes(self):
+        total = 0
+        for entry in os.scandir(self.result_dir):
+            if entry.is_file() and entry.name.endswith(".mp4"):
+                total += entry.stat().st_size
+        return total
+
+    def status(self):
+        with self._cond:
+            states = {}
+            for job in self.jobs.values():
+                states[job.state] = states.get(job.state, 0) + 1
+            return {
+                "workers": self.workers,
+                "queued": [job.id for job in self._queue],
+                "running": list(self._running),
+                "states": states,
+                "reserved_bytes": sum(job.reserved_bytes for job in self._running.values()),
+                "free_bytes": self.free_bytes(),
+                "min_free_bytes": self.min_free_bytes,
+                "result_cache": self.result_dir,
+                "cache_bytes": self.cache_bytes(),
+                "cache_max_bytes": self.cache_max_bytes,
+                "uptime": time.time() - self.started,
+            }
+
+    def job_list(self):
+        with self._cond:
+            return [job.to_dict() for job in sorted(self.jobs.values(), key=lambda j: j.created)]
+
+    # --- Lập lịch ---
+
+    def _take_next(self):
+        """Job đầu hàng đợi nếu đủ dung lượng (gọi khi đang giữ _cond)"""
+        while self._queue:
+            job = self._queue[0]
+            reserved = sum(j.reserved_bytes for j in self._running.values())
+            available = self.free_bytes() - reserved - self.min_free_bytes
+            if job.reserved_bytes <= available:
+                self._queue.popleft()
+                job.state = "running"
+                job.started = time.time()
+                self._running[job.id] = job
+                return job
+            if self._running:
+                # Chờ job khác xong giải phóng phần đã giữ; giữ thứ tự để job lớn không bị bỏ đói
+                return None
+            self._queue.popleft()
+            self._inflight.pop(job.key, None)
+            self._finish(job, "failed", (
+                f"Không đủ dung lượng đĩa: cần {_format_bytes(job.reserved_bytes)}, "
+                f"còn {_format_bytes(max(0, available))} trên mức tối thiểu"
+            ))
+        return None
+
+    def _worker(self):
+        while True:
+            with self._cond:
+                job = None
+                while job is None:
+                    if self._stopping:
+                        return
+                    job = self._take_next()
+                    if job is None:
+                        # Có hạn chờ để nhận ra khi dung lượng trống thay đổi từ bên ngoài
+                        self._cond.wait(self.poll_seconds)
+            self._execute(job)
+
+    def _execute(self, job):
+        state, error = "failed", None
+        try:
+            state, error = self._run(job)
+        except Exception as e:
+            # Lỗi ngoài dự kiến (vd. thiếu OpenCV khi find_loop) không được làm chết worker
+            error = f"Lỗi không mong đợi: {type(e).__name__}: {e}"
+        finally:
+            # Luôn trả slot, phần dung lượng đã giữ và khóa gộp, kể cả khi lỗi
+            with self._cond:
+                self._inflight.pop(job.key, None)
+                self._running.pop(job.id, None)
+                self._finish(job, state, error)
+                self._cond.notify_all()
+        if state == "done" and self.cache_max_bytes is not None:
+            self.prune_cache(self.cache_max_bytes)
+
+    def _run(self, job):
+        """Chạy export của job, trả về (trạng thái, lỗi)"""
+        request = job.request
+        path = self.result_path(job.key)
+        scratch = self.scratch_path(job.key)
+        os.makedirs(os.path.dirname(scratch), exist_ok=True)
+        loop_job = LoopJob(
+            request["input"], request["minutes"], scratch, mode=request["mode"],
+            find_loop=request["find_loop"], fade_seconds=request["fade"],
+            verify=request["verify"], profile=request.get("profile")
+        )
+        result = None
+        try:
+            result = run_job(loop_job, on_progress=job.on_progress, cancel=job.cancel)
+            if result.ok:
+                os.replace(scratch, path)
+        finally:
+            # Đầu ra lỗi, chưa kiểm tra hay dở dang không bao giờ thành cache hit
+            if os.path.exists(scratch):
+                os.remove(scratch)
+            if not job.cancel.is_set() and not (result and result.ok):
+                # Chỉ giữ thư mục job (để tiếp tục) khi bị hủy
+                shutil.rmtree(scratch + ".loopjob", ignore_errors=True)
+        with self._cond:
+            # Từ đây yêu cầu giống hệt sẽ dùng file trong cache, danh sách đầu ra không đổi nữa
+            self._inflight.pop(job.key, None)
+        if result.ok:
+            job.result_path = path
+            try:
+                for dest in job.outputs:
+                    deliver(path, dest)
+            except OSError as e:
+                return "failed", f"Không tạo được file đầu ra: {e}"
+            return "done", None
+        if job.cancel.is_set():
+            return "cancelled", "Đã hủy; gửi lại cùng yêu cầu sẽ tiếp tục phần đã xong."
+        return "failed", result.error
+
+    def _finish_cached(self, job):
+        state, error = "done", None
+        try:
+            # Đánh dấu vừa dùng để prune_cache giữ lại
+            os.utime(job.result_path)
+            for dest in job.outputs:
+                deliver(job.result_path, dest)
+        except OSError as e:
+            state, error = "failed", f"Không tạo được file đầu ra: {e}"
+        with self._cond:
+            self._finish(job, state, error)
+
+    def _finish(self, job, state, error=None):
+        job.state = state
+        job.error = error
+        job.finished = time.time()
+        if state == "done":
+            job.percent = 100.0
+
+    def prune_cache(self, max_bytes):
+        """Xóa kết quả ít dùng nhất cho tới khi cache không vượt max_bytes.
+
+        Job đang chạy ghi vào thư mục work/ nên không bị động tới.
+        """
+        return prune_cache(self.result_dir, max_bytes)
+
+
+class WatchFolder:
+    """Quét thư mục, gửi job cho mỗi video mới khi kích thước đã ổn định.
+
+    File cạnh video tên <video>.json (vd. {"minutes": 30, "mode": "crossfade"})
+    ghi đè thông số mặc định (trừ input/output); đầu ra là <output_dir>/<tên>_loop.mp4.
+    """
+
+    def __init__(self, service, path, minutes, mode="stream_loop", output_dir=None, interval=2.0):
+        self.service = service
+        self.path = path
+        self.minutes = minutes
+        self.mode = mode
+        self.output_dir = output_dir or os.path.join(path, "done")
+        self.interval = interval
+        if self.output_dir not in service.output_roots:
+            service.output_roots.append(self.output_dir)
+        self._pending = {}
+        self._seen = set()
+        self._stop = threading.Event()
+
+    def start(self):
+        threading.Thread(target=self._run, name="watch-folder", daemon=True).start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+
+    def _run(self):
+        while not self._stop.is_set():
+            try:
+                self.scan()
+            except Exception as e:
+                print(f"⚠️ Không quét được {self.path}: {e}", file=sys.stderr, flush=True)
+            self._stop.wait(self.interval)
+
+    def _request_for(self, path):
+        data = {"input": path, "minutes": self.minutes, "mode": self.mode}
+        sidecar = path + ".json"
+        if os.path.exists(sidecar):
+            with open(sidecar, encoding="utf-8") as f:
+                options = json.load(f)
+            if not isinstance(options, dict):
+                raise ServiceError(f"{os.path.basename(sidecar)} phải là một object JSON.")
+            # Sidecar chỉ đổi thông số, không đổi file nguồn hay nơi ghi đầu ra
+            options.pop("input", None)
+            options.pop("output", None)
+            data.update(options)
+        stem = os.path.splitext(os.path.basename(path))[0]
+        data["output"] = os.path.join(self.output_dir, f"{stem}_loop.mp4")
+        return data
+
+    def scan(self):
+        """Một lượt quét; trả về danh sách job đã gửi"""
+        submitted = []
+        for entry in os.scandir(self.path):
+            if not entry.is_file() or not entry.name.lower().endswith(VIDEO_EXTENSIONS):
+                continue
+            st = entry.stat()
+            signature = (entry.path, st.st_size, st.st_mtime_ns)
+            if signature in self._seen:
+                continue
+            # File còn đang được chép vào: đợi tới khi hai lượt quét liên tiếp thấy giống nhau
+            if self._pending.get(entry.path) != signature:
+                self._pending[entry.path] = signature
+                continue
+            del self._pending[entry.path]
+            self._seen.add(signature)
+            try:
+                job, _ = self.service.submit(self._request_for(entry.path))
+                submitted.append(job)
+                print(f"📥 {entry.name} → job {job.id}", flush=True)
+            except Exception as e:
+                # Một file hỏng không được làm dừng luồng theo dõi
+                print(f"❌ {entry.name}: {e}", file=sys.stderr, flush=True)
+        return submitted
+
+
+class _Handler(BaseHTTPRequestHandler):
+    service = None
+    token = None
+    verbose = False
+
+    def log_message(self, format, *args):
+        if self.verbose:
+            sys.stderr.write(f"[{self.log_date_time_string()}] {format % args}\n")
+
+    def _send(self, status, data):
+        body = json.dumps(data, ensure_ascii=False).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _authorize(self, method):
+        # Trình duyệt gửi được POST "đơn giản" (text/plain) tới 127.0.0.1 không qua preflight
+        # CORS; yêu cầu application/json buộc phải preflight nên trang web lạ không gửi được
+        if method != "GET" and self.headers.get_content_type() != "application/json":
+            raise ServiceError("Content-Type phải là application/json.", status=415)
+        if self.token and not hmac.compare_digest(
+                self.headers.get(TOKEN_HEADER, "").encode("utf-8"), self.token.encode("utf-8")):
+            raise ServiceError("Thiếu hoặc sai token.", status=401)
+
+    def _route(self, method):
+        parts = [p for p in urlparse(self.path).path.split("/") if p]
+        try:
+            self._authorize(method)
+            if method == "GET" and parts == ["queue"]:
+                return self._send(200, self.service.status())
+            if method == "GET" and parts == ["jobs"]:
+                return self._send(200, {"jobs": self.service.job_list()})
+            if method == "GET" and len(parts) == 2 and parts[0] == "jobs":
+                return self._send(200, self.service.get(parts[1]).to_dict())
+            if method == "DELETE" and len(parts) == 2 and parts[0] == "jobs":
+                return self._send(200, self.service.cancel(parts[1]).to_dict())
+            if method == "POST" and parts == ["jobs"]:
+                length = int(self.headers.get("Content-Length") or 0)
+                try:
+                    data = json.loads(self.rfile.read(length) or b"{}")
+                except ValueError:
+                    raise ServiceError("Nội dung không phải JSON hợp lệ.")
+                job, deduplicated = self.service.submit(data)
+                result = job.to_dict()
+                result["deduplicated"] = deduplicated
+                return self._send(202 if job.state != "done" else 200, result)
+            raise ServiceError(f"Không có {method} {self.path}", status=404)
+        except ServiceError as e:
+            self._send(e.status, {"error": str(e)})
+        except Exception as e:
+            # Không để kết nối bị đóng ngang: client luôn nhận được JSON lỗi
+            self._send(500, {"error": f"Lỗi nội bộ: {type(e).__name__}: {e}"})
+
+    def do_GET(self):
+        self._route("GET")
+
+    def do_POST(self):
+        self._route("POST")
+
+    def do_DELETE(self):
+        self._route("DELETE")
+
+
+class UnixHTTPServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    daemon_threads = True
+
+    def server_bind(self):
+        if os.path.exists(self.server_address):
+            os.remove(self.server_address)
+        super().server_bind()
+        os.chmod(self.server_address, 0o600)
+
+    def server_close(self):
+        super().server_close()
+        if os.path.exists(self.server_address):
+            os.remove(self.server_address)
+
+
+def start_server(service, host=DEFAULT_HOST, port=DEFAULT_PORT, socket_path=None, verbose=False,
+                 token=DEFAULT_TOKEN):
+    """Chạy API trên luồng nền; trả về (server, địa chỉ cho ServiceClient)"""
+    handler = type("Handler", (_Handler,), {"service": service, "verbose": verbose, "token": token})
+    if socket_path:
+        server = UnixHTTPServer(socket_path, handler)
+        address = {"socket_path": socket_path}
+    else:
+        server = ThreadingHTTPServer((host, port), handler)
+        server.daemon_threads = True
+        address = {"url": f"http://{host}:{server.server_address[1]}"}
+    threading.Thread(target=server.serve_forever, name="service-api", daemon=True).start()
+    return server, address
+
+
+class _UnixHTTPConnection(http.client.HTTPConnection):
+    def __init__(self, socket_path, timeout):
+        super().__init__("localhost", timeout=timeout)
+        self.socket_path = socket_path
+
+    def connect(self):
+        self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self.sock.settimeout(self.timeout)
+        self.sock.connect(self.socket_path)
+
+
+class ServiceClient:
+    """Client cho API của service (HTTP cục bộ hoặc Unix socket)"""
+
+    def __init__(self, url=None, socket_path=None, timeout=30.0, token=DEFAULT_TOKEN):
+        self.url = url or f"http://{DEFAULT_HOST}:{DEFAULT_PORT}"
+        self.socket_path = socket_path
+        self.timeout = timeout
+        self.token = token
+
+    def _connection(self):
+        if self.socket_path:
+            return _UnixHTTPConnection(self.socket_path, self.timeout)
+        parsed = urlparse(self.url)
+        return http.client.HTTPConnection(parsed.hostname, parsed.port or 80, timeout=self.timeout)
+
+    def _request(self, method, path, data=None):
+        conn = self._connection()
+        try:
+            body = json.dumps(data).encode("utf-8") if data is not None else None
+            headers = {"Content-Type": "application/json"} if method != "GET" else {}
+            if self.token:
+                headers[TOKEN_HEADER] = self.token
+            conn.request(method, path, body=body, headers=headers)
+            response = conn.getresponse()
+            result = json.loads(response.read() or b"{}")
+        finally:
+            conn.close()
+        if response.status >= 400:
+            raise ServiceError(result.get("error", f"HTTP {response.status}"), status=response.status)
+        return result
+
+    def submit(self, input_path, minutes, output=None, **options):
+        data = dict(options, input=os.path.abspath(input_path), minutes=minutes)
+        if output:
+            data["output"] = os.path.abspath(output)
+        return self._request("POST", "/jobs", data)
+
+    def job(self, job_id):
+        return self._request("GET", f"/jobs/{job_id}")
+
+    def jobs(self):
+        return self._request("GET", "/jobs")["jobs"]
+
+    def queue(self):
+        return self._request("GET", "/queue")
+
+    def cancel(self, job_id):
+        return self._request("DELETE", f"/jobs/{job_id}")
+
+    def wait(self, job_id, poll=0.5, timeout=None, on_update=None):
+        """Chờ tới khi job kết thúc, trả về trạng thái cuối"""
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while True:
+            info = self.job(job_id)
+            if on_update:
+                on_update(info)
+            if info["state"] in FINISHED_STATES:
+                return info
+            if deadline is not None and time.monotonic() > deadline:
+                raise ServiceError(f"Hết thời gian chờ job {job_id}", status=504)
+            time.sleep(poll)
+
+
+def _print_job(info):
+    line = f"{info['id']}  {info['state']:<9} {info['percent']:5.1f}%  {os.path.basename(info['input'])}"
+    line += f"  {format_seconds(info['minutes'] * 60)}"
+    if info["cached"]:
+        line += "  (cache)"
+    if info["duplicates"]:
+        line += f"  (+{info['duplicates']} trùng)"
+    if info["progress"] and info["state"] == "running":
+        line += f"  {info['progress']}"
+    if info["error"]:
+        line += f"  — {info['error']}"
+    print(line)
+
+
+def serve(args):
+    service = LoopService(
+        workers=args.workers, result_dir=args.result_cache,
+        min_free_bytes=int(args.min_free_gb * 1024 ** 3),
+        cache_max_bytes=int(args.cache_max_gb * 1024 ** 3) if args.cache_max_gb else None,
+        output_roots=args.output_root
+    ).start()
+    server, address = start_server(service, args.host, args.port, args.socket, args.verbose,
+                                   args.token)
+    watch = None
+    if args.watch:
+        os.makedirs(args.watch, exist_ok=True)
+        watch = WatchFolder(service, args.watch, args.watch_minutes, args.mode,
+                            args.watch_output, args.watch_interval).start()
+    print(f"✅ Service chạy tại {address.get('url') or address['socket_path']}, "
+          f"{service.workers} worker, cache {service.result_dir}", flush=True)
+    if watch:
+        print(f"👀 Theo dõi {watch.path} → {watch.output_dir}", flush=True)
+
+    stopped = threading.Event()
+    signal.signal(signal.SIGTERM, lambda *_: stopped.set())
+    try:
+        while not stopped.wait(0.5):
+            pass
+    except KeyboardInterrupt:
+        pass
+    print("⏹️ Đang dừng service...", flush=True)
+    if watch:
+        watch.stop()
+    server.shutdown()
+    server.server_close()
+    service.stop()
+    return 0
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Service hàng đợi export video loop")
+    parser.add_argument("--url", default=f"http://{DEFAULT_HOST}:{DEFAULT_PORT}",
+                        help="Địa chỉ API (cho các lệnh client)")
+    parser.add_argument("--socket", help="Unix socket thay cho HTTP")
+    parser.add_argument("--token", default=DEFAULT_TOKEN,
+                        help="Token dùng chung giữa service và client (mặc định VIDEOLOOP_SERVICE_TOKEN)")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    p = commands.add_parser("serve", help="Chạy service")
+    p.add_argument("--host", default=DEFAULT_HOST)
+    p.add_argument("--port", type=int, default=DEFAULT_PORT)
+    p.add_argument("--workers", type=int, default=1, help="Số job chạy đồng thời trên máy này")
+    p.add_argument("--min-free-gb", type=float, default=5.0,
+                   help="Dung lượng trống tối thiểu phải còn sau khi trừ phần job cần")
+    p.add_argument("--result-cache", default=DEFAULT_RESULT_CACHE, help="Thư mục cache kết quả")
+    p.add_argument("--output-root", action="append",
+                   help=f"Thư mục được phép ghi đầu ra, lặp lại được (mặc định {DEFAULT_OUTPUT_ROOT})")
+    p.add_argument("--cache-max-gb", type=float, help="Giới hạn cache kết quả (xóa kết quả cũ nhất)")
+    p.add_argument("--watch", help="Thư mục theo dõi: video mới được tự động export")
+    p.add_argument("--watch-minutes", type=float, default=60, help="Thời gian lặp mặc định (phút)")
+    p.add_argument("--watch-output", help="Thư mục đầu ra (mặc định <watch>/done)")
+    p.add_argument("--watch-interval", type=float, default=2.0)
+    p.add_argument("--mode", choices=EXPORT_MODES, default="stream_loop",
+                   help="Mode mặc định cho job từ thư mục theo dõi")
+    p.add_argument("--verbose", action="store_true", help="In log từng request")
+
+    p = commands.add_parser("submit", help="Gửi một job")
+    p.add_argument("input")
+    p.add_argument("minutes", type=float)
+    p.add_argument("--out", help="File đầu ra (mặc định chỉ giữ trong cache)")
+    p.add_argument("--mode", choices=EXPORT_MODES, default="stream_loop")
+    p.add_argument("--find-loop", action="store_true")
+    p.add_argument("--fade", type=float, default=DEFAULT_FADE_SECONDS)
+    p.add_argument("--verify", action="store_true")
+    p.add_argument("--scale")
+    p.add_argument("--bitrate")
+    p.add_argument("--crf", type=int)
+    p.add_argument("--wait", action="store_true", help="Chờ job xong")
+
+    p = commands.add_parser("status", help="Trạng thái job")
+    p.add_argument("job_id", nargs="?")
+    commands.add_parser("queue", help="Trạng thái hàng đợi")
+    p = commands.add_parser("cancel", help="Hủy job")
+    p.add_argument("job_id")
+    args = parser.parse_args(argv)
+
+    if args.command == "serve":
+        return serve(args)
+
+    client = ServiceClient(args.url, args.socket, token=args.token)
+    try:
+        if args.command == "submit":
+            options = {"mode": args.mode, "find_loop": args.find_loop, "fade": args.fade,
+                       "verify": args.verify}
+            for name in ("scale", "bitrate", "crf"):
+                if getattr(args, name) is not None:
+                    options[name] = getattr(args, name)
+            info = client.submit(args.input, args.minutes, args.out, **options)
+            _print_job(info)
+            if args.wait:
+                info = client.wait(info["id"])
+                _print_job(info)
+            return 0 if info["state"] != "failed" else 1
+        if args.command == "status":
+            for info in ([client.job(args.job_id)] if args.job_id else client.jobs()):
+                _print_job(info)
+        elif args.command == "queue":
+            status = client.queue()
+            print(f"Worker: {status['workers']}, đang chạy {len(status['running'])}, "
+                  f"chờ {len(status['queued'])}")
+            print(f"Đĩa trống: {_format_bytes(status['free_bytes'])}, tối thiểu "
+                  f"{_format_bytes(status['min_free_bytes'])}, đang giữ "
+                  f"{_format_bytes(status['reserved_bytes'])}")
+            print(f"Cache: {status['result_cache']} ({_format_bytes(status['cache_bytes'])})")
+            print(" • ".join(f"{k} {v}" for k, v in sorted(status["states"].items())))
+        elif args.command == "cancel":
+            _print_job(client.cancel(args.job_id))
+    except ServiceError as e:
+        print(f"❌ {e}")
+        return 1
+    except OSError as e:
+        print(f"❌ Không kết nối được service: {e}")
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
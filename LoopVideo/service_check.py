@@ -0,0 +1,179 @@
+"""Kiểm tra service hàng đợi hoàn toàn offline: clip tổng hợp, service chạy tại chỗ, client cục bộ.
+
+    python service_check.py
+    python service_check.py --workers 2 --json service_check.json
+
+Dựng service trên Unix socket (HTTP 127.0.0.1 với cổng ngẫu nhiên nếu không có
+AF_UNIX) với cache kết quả và thư mục theo dõi tạm, rồi kiểm tra: yêu cầu
+trùng được gộp vào một job, gửi lại yêu cầu đã xong thì lấy từ cache, job chạy
+không quá số worker, hủy được job đang chạy, job bị từ chối khi không đủ dung
+lượng đĩa, đầu ra ngoài thư mục cho phép và request không phải JSON bị từ chối,
+và video thả vào thư mục theo dõi được tự động export.
+"""
+import argparse
+import json
+import os
+import shutil
+import socket
+import sys
+import tempfile
+import threading
+import time
+
+from ffmpeg_utils import probe_duration
+from service import LoopService, ServiceClient, ServiceError, WatchFolder, start_server
+from synthetic import make_test_clip
+
+
+class _Check:
+    def __init__(self):
+        self.results = []
+
+    def expect(self, name, ok, detail=""):
+        self.results.append({"name": name, "ok": bool(ok), "detail": detail})
+        print(f"{'✅' if ok else '❌'} {name}" + (f": {detail}" if detail else ""), flush=True)
+        return ok
+
+
+def _watch_running(client, stop, state):
+    # Lấy mẫu số job chạy đồng thời để so với số worker
+    while not stop.is_set():
+        try:
+            state["max_running"] = max(state["max_running"], len(client.queue()["running"]))
+        except OSError:
+            pass
+        time.sleep(0.05)
+
+
+def _start(service, work_dir):
+    if hasattr(socket, "AF_UNIX"):
+        return start_server(service, socket_path=os.path.join(work_dir, "service.sock"))
+    return start_server(service, port=0)
+
+
+def run_checks(work_dir, workers=2, clip_seconds=2.0, minutes=0.5, timeout=300):
+    check = _Check()
+    clips = [
+        make_test_clip(os.path.join(work_dir, f"clip{i}.mp4"), duration=clip_seconds,
+                       size=size, gop=30)
+        for i, size in enumerate(("640x360", "320x240", "480x270"))
+    ]
+    out_dir = os.path.join(work_dir, "out")
+    service = LoopService(workers=workers, result_dir=os.path.join(work_dir, "results"),
+                          poll_seconds=0.2, output_roots=[out_dir]).start()
+    server, address = _start(service, work_dir)
+    client = ServiceClient(timeout=30, **address)
+    stop_sampler = threading.Event()
+    sampler = {"max_running": 0}
+    threading.Thread(target=_watch_running, args=(client, stop_sampler, sampler), daemon=True).start()
+    try:
+        # Gộp yêu cầu trùng và giới hạn số job đồng thời
+        first = client.submit(clips[0], minutes, os.path.join(out_dir, "a1.mp4"))
+        again = client.submit(clips[0], minutes, os.path.join(out_dir, "a2.mp4"))
+        check.expect("yêu cầu trùng được gộp", again["deduplicated"] and again["id"] == first["id"],
+                     f"{first['id']} / {again['id']}")
+        others = [client.submit(clip, minutes, os.path.join(out_dir, f"b{i}.mp4"))
+                  for i, clip in enumerate(clips[1:])]
+        finals = [client.wait(job["id"], poll=0.1, timeout=timeout) for job in [first] + others]
+        check.expect("các job hoàn thành", all(f["state"] == "done" for f in finals),
+                     ", ".join(f"{f['id']}={f['state']}" for f in finals))
+        check.expect("số job chạy đồng thời không vượt số worker",
+                     sampler["max_running"] <= workers,
+                     f"tối đa {sampler['max_running']}/{workers}")
+        for name in ("a1.mp4", "a2.mp4"):
+            path = os.path.join(out_dir, name)
+            duration = probe_duration(path) if os.path.exists(path) else 0.0
+            check.expect(f"đầu ra {name} đúng thời lượng", abs(duration - minutes * 60) < 0.1,
+                         f"{duration:.3f}s")
+
+        # Đầu ra ngoài thư mục gốc cho phép và request không phải JSON bị từ chối
+        try:
+            client.submit(clips[0], minutes, os.path.join(work_dir, "outside.mp4"))
+            status = 200
+        except ServiceError as e:
+            status = e.status
+        check.expect("từ chối đầu ra ngoài thư mục cho phép", status == 403, str(status))
+        plain = ServiceClient(timeout=30, **address)
+        conn = plain._connection()
+        try:
+            conn.request("POST", "/jobs", body=json.dumps({"input": clips[0], "minutes": minutes}),
+                         headers={"Content-Type": "text/plain"})
+            status = conn.getresponse().status
+        finally:
+            conn.close()
+        check.expect("từ chối POST không phải application/json", status == 415, str(status))
+
+        # Kết quả đã có trong cache
+        start = time.monotonic()
+        cached = client.wait(client.submit(clips[0], minutes, os.path.join(out_dir, "a3.mp4"))["id"],
+                             poll=0.05, timeout=timeout)
+        check.expect("yêu cầu lặp lại lấy từ cache", cached["cached"] and cached["state"] == "done",
+                     f"{time.monotonic() - start:.2f}s")
+
+        # Hủy job đang chạy (job dài để chắc chắn còn đang chạy khi hủy)
+        long_job = client.submit(clips[1], 600)
+        deadline = time.monotonic() + timeout
+        while client.job(long_job["id"])["state"] == "queued" and time.monotonic() < deadline:
+            time.sleep(0.05)
+        client.cancel(long_job["id"])
+        cancelled = client.wait(long_job["id"], poll=0.1, timeout=timeout)
+        check.expect("hủy job đang chạy", cancelled["state"] == "cancelled", cancelled["state"])
+
+        # Giới hạn dung lượng đĩa
+        service.min_free_bytes = service.free_bytes() + 1
+        refused = client.wait(client.submit(clips[2], minutes * 2)["id"], poll=0.1, timeout=timeout)
+        check.expect("từ chối job khi không đủ dung lượng", refused["state"] == "failed",
+                     refused["error"] or refused["state"])
+        service.min_free_bytes = 0
+
+        # Thư mục theo dõi
+        watch_dir = os.path.join(work_dir, "watch")
+        os.makedirs(watch_dir)
+        watch = WatchFolder(service, watch_dir, minutes, interval=0.2).start()
+        shutil.copyfile(clips[2], os.path.join(watch_dir, "dropped.mp4"))
+        target = os.path.join(watch_dir, "done", "dropped_loop.mp4")
+        deadline = time.monotonic() + timeout
+        while not os.path.exists(target) and time.monotonic() < deadline:
+            time.sleep(0.1)
+        watch.stop()
+        check.expect("video thả vào thư mục theo dõi được export", os.path.exists(target), target)
+
+        status = client.queue()
+        check.expect("hàng đợi trống sau khi xong", not status["queued"] and not status["running"],
+                     " • ".join(f"{k} {v}" for k, v in sorted(status["states"].items())))
+    finally:
+        stop_sampler.set()
+        server.shutdown()
+        server.server_close()
+        service.stop()
+    return check.results
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Kiểm tra service hàng đợi (offline)")
+    parser.add_argument("--workers", type=int, default=2)
+    parser.add_argument("--clip-seconds", type=float, default=2.0)
+    parser.add_argument("--minutes", type=float, default=0.5, help="Thời lượng mỗi job (phút)")
+    parser.add_argument("--timeout", type=float, default=300, help="Thời gian chờ tối đa mỗi bước (giây)")
+    parser.add_argument("--keep", action="store_true", help="Giữ thư mục làm việc")
+    parser.add_argument("--json", help="Ghi kết quả ra file JSON")
+    args = parser.parse_args(argv)
+
+    work_dir = tempfile.mkdtemp(prefix="videoloop_servicecheck_")
+    try:
+        results = run_checks(work_dir, args.workers, args.clip_seconds, args.minutes, args.timeout)
+    finally:
+        if args.keep:
+            print(f"Thư mục làm việc: {work_dir}")
+        else:
+            shutil.rmtree(work_dir, ignore_errors=True)
+    ok = all(r["ok"] for r in results)
+    print(f"{sum(r['ok'] for r in results)}/{len(results)} kiểm tra đạt")
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump({"ok": ok, "checks": results}, f, indent=2, ensure_ascii=False)
+    return 0 if ok else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
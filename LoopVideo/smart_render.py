@@ -0,0 +1,257 @@
+"""Smart render cho mối nối crossfade: chỉ mã hóa lại đoạn quanh mối nối, phần còn lại -c copy.
+
+Với đoạn loop [in, out] và độ dài fade F, một đơn vị lặp gồm:
+
+    body = [kf_a, kf_b)           copy nguyên, kf_a/kf_b là keyframe trong đoạn
+    seam = xfade([kf_b, out], [in, kf_a], F)   mã hóa một lần, cùng thông số codec
+
+body kết thúc ở kf_b, seam nối tiếp từ kf_b và hòa dần sang đầu đoạn, kết thúc
+ở kf_a, đúng nơi body của lượt sau bắt đầu. Đơn vị (body + seam) được lặp
+bằng -stream_loop nên chi phí gần bằng chế độ copy thuần.
+"""
+import bisect
+import os
+
+from ffmpeg_utils import (
+    FFmpegError, parse_rate, probe_duration, probe_streams, run_ffmpeg, run_ffprobe
+)
+
+VIDEO_ENCODERS = {
+    "h264": "libx264",
+    "hevc": "libx265",
+    "mpeg4": "mpeg4",
+    "mpeg2video": "mpeg2video",
+    "vp9": "libvpx-vp9",
+}
+AUDIO_ENCODERS = {
+    "aac": "aac",
+    "mp3": "libmp3lame",
+    "opus": "libopus",
+    "ac3": "ac3",
+}
+H264_PROFILES = {
+    "Constrained Baseline": "baseline",
+    "Baseline": "baseline",
+    "Main": "main",
+    "High": "high",
+    "High 10": "high10",
+    "High 4:2:2": "high422",
+    "High 4:4:4 Predictive": "high444",
+}
+
+
+def piece_extension(video_path):
+    # Giữ MP4/MOV để mux lại không phải đổi timebase, còn lại dùng MKV cho an toàn
+    ext = os.path.splitext(video_path)[1].lower()
+    return ext if ext in (".mp4", ".mov", ".m4v") else ".mkv"
+
+
+def matching_video_args(stream, ext):
+    """Tham số encoder để đoạn mã hóa lại ghép -c copy được với video gốc"""
+    codec = stream.get("codec_name")
+    encoder = VIDEO_ENCODERS.get(codec)
+    if encoder is None:
+        raise ValueError(f"Chưa hỗ trợ mã hóa lại codec video: {codec}")
+    args = ["-c:v", encoder]
+    if stream.get("pix_fmt"):
+        args += ["-pix_fmt", stream["pix_fmt"]]
+    if codec == "h264":
+        profile = H264_PROFILES.get(stream.get("profile"))
+        if profile:
+            args += ["-profile:v", profile]
+        level = stream.get("level")
+        if isinstance(level, int) and level > 0:
+            args += ["-level:v", f"{level / 10:.1f}"]
+        # SPS/PPS nằm trong luồng để decoder đổi tham số được khi qua mối nối
+        args += ["-crf", "16", "-x264-params", "repeat-headers=1"]
+    elif codec == "hevc":
+        args += ["-crf", "18", "-x265-params", "repeat-headers=1:log-level=error"]
+        if stream.get("codec_tag_string") == "hvc1":
+            args += ["-tag:v", "hvc1"]
+    elif stream.get("bit_rate"):
+        args += ["-b:v", str(int(int(stream["bit_rate"]) * 1.5))]
+    if ext in (".mp4", ".mov", ".m4v"):
+        timescale = str(stream.get("time_base", "")).partition("/")[2]
+        if timescale.isdigit():
+            args += ["-video_track_timescale", timescale]
+    return args
+
+
+def matching_audio_args(stream):
+    codec = stream.get("codec_name")
+    encoder = AUDIO_ENCODERS.get(codec)
+    if encoder is None:
+        raise ValueError(f"Chưa hỗ trợ mã hóa lại codec audio: {codec}")
+    args = ["-c:a", encoder]
+    if stream.get("sample_rate"):
+        args += ["-ar", str(stream["sample_rate"])]
+    if stream.get("channels"):
+        args += ["-ac", str(stream["channels"])]
+    if stream.get("bit_rate"):
+        args += ["-b:a", str(stream["bit_rate"])]
+    return args
+
+
+def plan_seam(loop_range, keyframes, fade_seconds):
+    """Chọn (kf_a, kf_b) cho phần copy; None nếu không có keyframe phù hợp.
+
+    kf_a là keyframe đầu tiên sau in + F, kf_b là keyframe cuối cùng trước
+    out - F, để hai phía mối nối đều đủ dài cho fade.
+    """
+    start, end = loop_range
+    i = bisect.bisect_left(keyframes, start + fade_seconds)
+    j = bisect.bisect_right(keyframes, end - fade_seconds) - 1
+    if i >= len(keyframes) or j < 0 or keyframes[i] >= keyframes[j]:
+        return None
+    return keyframes[i], keyframes[j]
+
+
+def _copy_body(video_path, start, end, video_stream, out_path, cancel=None):
+    args = [
+        "-ss", f"{start:.6f}", "-i", video_path,
+        "-t", f"{end - start:.6f}",
+        "-map", "0:v:0", "-map", "0:a:0?",
+        "-c", "copy", "-avoid_negative_ts", "make_zero",
+    ]
+    if video_stream.get("codec_name") in ("h264", "hevc"):
+        # Chèn SPS/PPS gốc vào mỗi keyframe, cặp với repeat-headers của đoạn seam
+        args += ["-bsf:v", "dump_extra=freq=keyframe"]
+    run_ffmpeg(args + [out_path], cancel=cancel)
+
+
+def _encode_seam(video_path, tail, head, fade, streams, out_path, ext, cancel=None,
+                 on_progress=None):
+    video = streams["video"]
+    audio = streams["audio"]
+    fps = video.get("r_frame_rate") or "30"
+    tail_len = tail[1] - tail[0]
+    head_len = head[1] - head[0]
+
+    filters = [
+        f"[0:v]fps={fps},setpts=PTS-STARTPTS[v0]",
+        f"[1:v]fps={fps},setpts=PTS-STARTPTS[v1]",
+        f"[v0][v1]xfade=transition=fade:duration={fade:.6f}:offset={tail_len - fade:.6f}[v]",
+    ]
+    maps = ["-map", "[v]"]
+    if audio is not None:
+        filters += [
+            "[0:a]asetpts=PTS-STARTPTS[a0]",
+            "[1:a]asetpts=PTS-STARTPTS[a1]",
+            f"[a0][a1]acrossfade=d={fade:.6f}[a]",
+        ]
+        maps += ["-map", "[a]"]
+
+    args = [
+        "-ss", f"{tail[0]:.6f}", "-t", f"{tail_len:.6f}", "-i", video_path,
+        "-ss", f"{head[0]:.6f}", "-t", f"{head_len:.6f}", "-i", video_path,
+        "-filter_complex", ";".join(filters),
+    ] + maps + matching_video_args(video, ext)
+    if audio is not None:
+        args += matching_audio_args(audio)
+    run_ffmpeg(args + [out_path], duration=tail_len + head_len - fade,
+               on_progress=on_progress, cancel=cancel)
+
+
+def _concat_copy(paths, list_path, out_path, cancel=None):
+    with open(list_path, "w") as f:
+        for path in paths:
+            f.write(f"file '{path}'\n")
+    run_ffmpeg([
+        "-f", "concat", "-safe", "0", "-i", list_path,
+        "-map", "0", "-c", "copy", out_path
+    ], cancel=cancel)
+
+
+def build_crossfade_unit(video_path, loop_range, fade_seconds, temp_dir, keyframes,
+                         streams=None, cancel=None, on_progress=None):
+    """Tạo đơn vị lặp (body copy + seam crossfade), trả về (đường dẫn, thời lượng).
+
+    on_progress nhận tiến trình của bước mã hóa (seam, hoặc cả đơn vị khi không có keyframe).
+    """
+    if streams is None:
+        streams = probe_streams(video_path)
+    if streams["video"] is None:
+        raise ValueError(f"Không có luồng video: {video_path}")
+    start, end = loop_range
+    fade = min(fade_seconds, (end - start) / 2)
+    if fade <= 0:
+        raise ValueError("Độ dài crossfade không hợp lệ.")
+
+    ext = piece_extension(video_path)
+    unit_path = os.path.join(temp_dir, "crossfade_unit" + ext)
+    seam_path = os.path.join(temp_dir, "seam" + ext)
+    plan = plan_seam(loop_range, keyframes or [], fade)
+
+    if plan is None:
+        # Không có keyframe phù hợp trong đoạn: mã hóa cả đơn vị một lần
+        middle = start + (end - start) / 2
+        _encode_seam(video_path, (middle, end), (start, middle), fade, streams, unit_path, ext,
+                     cancel, on_progress)
+        return unit_path, probe_duration(unit_path)
+
+    kf_a, kf_b = plan
+    body_path = os.path.join(temp_dir, "body" + ext)
+    _copy_body(video_path, kf_a, kf_b, streams["video"], body_path, cancel)
+    _encode_seam(video_path, (kf_b, end), (start, kf_a), fade, streams, seam_path, ext,
+                 cancel, on_progress)
+    _concat_copy([body_path, seam_path], os.path.join(temp_dir, "unit_list.txt"), unit_path,
+                 cancel)
+    return unit_path, probe_duration(unit_path)
+
+
+class VerifyReport:
+    def __init__(self, ok, problems, video_seconds, audio_seconds, frames, expected_frames):
+        self.ok = ok
+        self.problems = problems
+        self.video_seconds = video_seconds
+        self.audio_seconds = audio_seconds
+        self.frames = frames
+        self.expected_frames = expected_frames
+
+    def describe(self):
+        text = f"video {self.video_seconds:.3f}s, {self.frames}/{self.expected_frames} frame"
+        if self.audio_seconds is not None:
+            text += f", audio {self.audio_seconds:.3f}s"
+        if self.problems:
+            text += " — " + "; ".join(self.problems)
+        return text
+
+
+def verify_output(path, expected_seconds, max_av_drift=0.05):
+    """Kiểm tra file đầu ra đúng số frame (±1) và audio không lệch video quá max_av_drift giây"""
+    streams = probe_streams(path)
+    video = streams["video"]
+    if video is None:
+        return VerifyReport(False, ["không có luồng video"], 0.0, None, 0, 0)
+
+    counted = _count_video_frames(path)
+    fps = parse_rate(video.get("avg_frame_rate")) or parse_rate(video.get("r_frame_rate"))
+    expected_frames = int(round(expected_seconds * fps)) if fps else counted
+    video_seconds = counted / fps if fps else float(video.get("duration") or 0)
+    problems = []
+    if abs(counted - expected_frames) > 1:
+        problems.append(f"lệch {counted - expected_frames} frame")
+
+    audio_seconds = None
+    if streams["audio"] is not None:
+        try:
+            audio_seconds = float(streams["audio"]["duration"])
+        except (KeyError, TypeError, ValueError):
+            audio_seconds = streams["duration"]
+        if audio_seconds is not None:
+            drift = audio_seconds - video_seconds
+            frame_time = 1 / fps if fps else 0
+            if abs(drift) > max(max_av_drift, frame_time):
+                problems.append(f"audio lệch {drift * 1000:+.0f} ms")
+    return VerifyReport(not problems, problems, video_seconds, audio_seconds, counted, expected_frames)
+
+
+def _count_video_frames(path):
+    data = run_ffprobe([
+        "-select_streams", "v:0", "-count_packets",
+        "-show_entries", "stream=nb_read_packets", path
+    ])
+    try:
+        return int(data["streams"][0]["nb_read_packets"])
+    except (KeyError, IndexError, TypeError, ValueError):
+        raise FFmpegError(f"Không đếm được frame: {path}")
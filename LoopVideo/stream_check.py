@@ -0,0 +1,162 @@
+"""Kiểm tra export dạng luồng phát được ngay trong lúc còn đang ghi.
+
+    python stream_check.py --format mp4 --seconds 120
+    python stream_check.py --format mpegts --input my_clip.mp4 --json check.json
+
+Tạo một clip tổng hợp (hoặc dùng --input), chạy stream_export ghi vào một pipe
+và cho một ffmpeg khác giải mã đầu kia của pipe như một trình phát. Đạt khi:
+đã giải mã được frame trong lúc bên ghi chưa xong, bên đọc kết thúc không lỗi,
+thời lượng giải mã được khớp thời lượng yêu cầu, và không có file tạm nào lớn
+hơn file nguồn.
+"""
+import argparse
+import json
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+from ffmpeg_utils import FFMPEG, FFmpegError
+from loop_engine import LoopExportError
+from streaming import STREAM_FORMATS, stream_export
+from synthetic import make_test_clip
+
+
+def _decoder(read_fd):
+    """ffmpeg giải mã từ pipe như trình phát, báo tiến trình ra stdout"""
+    return subprocess.Popen(
+        [FFMPEG, "-hide_banner", "-v", "error", "-nostdin", "-i", "pipe:0",
+         "-f", "null", "-", "-progress", "pipe:1", "-nostats"],
+        stdin=read_fd, stdout=subprocess.PIPE, stderr=subprocess.PIPE
+    )
+
+
+def _largest_file(path):
+    largest = 0
+    for root, _, files in os.walk(path):
+        for name in files:
+            try:
+                largest = max(largest, os.path.getsize(os.path.join(root, name)))
+            except OSError:
+                pass
+    return largest
+
+
+def check_stream(clip, seconds, fmt, loop_range=None, tolerance=0.1):
+    """Chạy kiểm tra, trả về dict kết quả (khóa "ok" cho biết đạt hay không)"""
+    read_fd, write_fd = os.pipe()
+    decoder = _decoder(read_fd)
+    os.close(read_fd)
+    writer = os.fdopen(write_fd, "wb")
+
+    state = {"error": None, "done_at": None, "largest_temp": 0}
+    temp_root = tempfile.gettempdir()
+    before = set(os.listdir(temp_root))
+
+    def produce():
+        try:
+            stream_export(clip, seconds, writer, fmt=fmt, loop_range=loop_range)
+        except (LoopExportError, FFmpegError, OSError) as e:
+            state["error"] = str(e)
+        finally:
+            state["done_at"] = time.monotonic()
+            writer.close()
+
+    def watch_temp():
+        # Thư mục tạm mới xuất hiện trong lúc ghi (đơn vị loop của --loop/crossfade)
+        while state["done_at"] is None:
+            for name in set(os.listdir(temp_root)) - before:
+                state["largest_temp"] = max(state["largest_temp"],
+                                            _largest_file(os.path.join(temp_root, name)))
+            time.sleep(0.05)
+
+    start = time.monotonic()
+    producer = threading.Thread(target=produce, daemon=True)
+    producer.start()
+    threading.Thread(target=watch_temp, daemon=True).start()
+
+    first_frame_at = None
+    frames_while_writing = 0
+    frames = 0
+    out_time = 0.0
+    for raw in decoder.stdout:
+        key, _, value = raw.decode("utf-8", errors="replace").strip().partition("=")
+        if key == "frame" and value.isdigit():
+            frames = int(value)
+            if frames and first_frame_at is None:
+                first_frame_at = time.monotonic()
+            if state["done_at"] is None:
+                frames_while_writing = frames
+        elif key == "out_time_us" and value.lstrip("-").isdigit():
+            out_time = max(0, int(value)) / 1_000_000
+    decoder.wait()
+    producer.join()
+    decode_errors = decoder.stderr.read().decode("utf-8", errors="replace").strip()
+
+    problems = []
+    if state["error"]:
+        problems.append(f"bên ghi lỗi: {state['error']}")
+    if decoder.returncode != 0 or decode_errors:
+        problems.append(f"bên đọc lỗi: {decode_errors.splitlines()[-1] if decode_errors else decoder.returncode}")
+    if frames_while_writing == 0:
+        problems.append("không giải mã được frame nào trước khi ghi xong")
+    if abs(out_time - seconds) > tolerance:
+        problems.append(f"thời lượng giải mã {out_time:.3f}s, cần {seconds:.3f}s")
+    source_size = os.path.getsize(clip)
+    if state["largest_temp"] > source_size:
+        problems.append(f"có file tạm {state['largest_temp']} byte, lớn hơn file nguồn")
+
+    return {
+        "ok": not problems,
+        "problems": problems,
+        "format": fmt,
+        "seconds": seconds,
+        "first_frame_seconds": (first_frame_at - start) if first_frame_at else None,
+        "write_seconds": (state["done_at"] - start) if state["done_at"] else None,
+        "frames": frames,
+        "frames_while_writing": frames_while_writing,
+        "decoded_seconds": out_time,
+        "largest_temp_bytes": state["largest_temp"],
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Kiểm tra luồng export phát được khi đang ghi")
+    parser.add_argument("--format", choices=sorted(STREAM_FORMATS), default="mp4")
+    parser.add_argument("--seconds", type=float, default=60.0, help="Thời lượng luồng (giây)")
+    parser.add_argument("--input", help="Clip nguồn (mặc định tạo clip tổng hợp)")
+    parser.add_argument("--clip-seconds", type=float, default=3.0)
+    parser.add_argument("--loop", nargs=2, type=float, metavar=("START", "END"))
+    parser.add_argument("--json", help="Ghi kết quả ra file JSON")
+    args = parser.parse_args(argv)
+
+    work_dir = tempfile.mkdtemp(prefix="videoloop_streamcheck_")
+    try:
+        clip = args.input or make_test_clip(
+            os.path.join(work_dir, "clip.mp4"), duration=args.clip_seconds, gop=30
+        )
+        result = check_stream(clip, args.seconds, args.format,
+                              tuple(args.loop) if args.loop else None)
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+    first = result["first_frame_seconds"]
+    print(f"Định dạng: {result['format']}, {result['seconds']:g}s")
+    print(f"Frame đầu tiên sau: {first:.2f}s" if first is not None else "Frame đầu tiên: không có")
+    print(f"Giải mã trong lúc ghi: {result['frames_while_writing']}/{result['frames']} frame")
+    print(f"Thời lượng giải mã: {result['decoded_seconds']:.3f}s")
+    for problem in result["problems"]:
+        print(f"❌ {problem}")
+    if result["ok"]:
+        print("✅ Luồng phát được trong lúc đang ghi")
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(result, f, indent=2, ensure_ascii=False)
+    return 0 if result["ok"] else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
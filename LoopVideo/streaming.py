@@ -0,0 +1,117 @@
+"""Export dạng luồng: ghi MP4 phân mảnh hoặc MPEG-TS thẳng ra stdout, named pipe hay socket.
+
+    python streaming.py input.mp4 600 - --format mpegts | ffplay -
+    python streaming.py input.mp4 600 /tmp/loop.fifo
+    python streaming.py input.mp4 600 "tcp://127.0.0.1:9000?listen=1" --realtime
+
+Không tạo file đầu ra đầy đủ: ffmpeg lặp đơn vị bằng -stream_loop và ghi
+từng phân mảnh ngay khi có. Khi đích đọc chậm, pipe đầy và ffmpeg tự chờ,
+nên bộ nhớ giới hạn trong một phân mảnh. Chỉ các mode cần đơn vị riêng (đoạn
+loop, crossfade) mới tạo file tạm, và chỉ dài đúng một lượt lặp.
+"""
+import argparse
+import shutil
+import sys
+import tempfile
+
+from ffmpeg_utils import FFmpegError, format_seconds, run_ffmpeg
+from loop_engine import DEFAULT_FADE_SECONDS, EXPORT_MODES, LoopExportError, prepare_unit
+
+# MP4 phân mảnh: moov rỗng ở đầu, mỗi keyframe (hoặc tối đa 2 giây) là một phân mảnh
+STREAM_FORMATS = {
+    "mp4": ["-f", "mp4", "-movflags", "+frag_keyframe+empty_moov+default_base_moof",
+            "-frag_duration", "2000000"],
+    "mpegts": ["-f", "mpegts"],
+}
+
+
+def resolve_sink(sink):
+    """Đích ghi → (tham số output cho ffmpeg, stdout cho tiến trình ffmpeg hoặc None).
+
+    "-" là stdout của tiến trình này; đối tượng có fileno() (file, pipe, socket
+    đã mở) nhận dữ liệu qua pipe:1; URL (tcp://, udp://, unix://...) và đường
+    dẫn (kể cả named pipe) được chuyển thẳng cho ffmpeg.
+    """
+    if sink == "-":
+        return "pipe:1", sys.stdout.buffer
+    if hasattr(sink, "fileno"):
+        return "pipe:1", sink
+    return sink, None
+
+
+def stream_export(video_path, target_seconds, sink, fmt="mp4", mode="stream_loop",
+                  loop_range=None, keyframes=None, fade_seconds=DEFAULT_FADE_SECONDS,
+                  profile=None, encode_workers=None, realtime=False,
+                  on_progress=None, cancel=None):
+    """Lặp video tới đúng target_seconds và ghi dạng luồng vào sink (xem resolve_sink)"""
+    if fmt not in STREAM_FORMATS:
+        raise LoopExportError(f"Định dạng luồng không hỗ trợ: {fmt}")
+    # concat chỉ khác ở cách ghép file, với luồng thì dùng như stream_loop
+    mode = "stream_loop" if mode == "concat" else mode
+    temp_dir = None
+    if loop_range is not None or mode == "crossfade":
+        temp_dir = tempfile.mkdtemp(prefix="videoloop_stream_")
+    try:
+        unit_path, _, _ = prepare_unit(
+            video_path, mode, temp_dir, loop_range, keyframes,
+            fade_seconds, profile, encode_workers, cancel
+        )
+        target, stdout = resolve_sink(sink)
+        args = ["-re"] if realtime else []
+        args += [
+            "-stream_loop", "-1", "-i", unit_path,
+            "-t", f"{target_seconds:.6f}",
+            "-map", "0:v:0", "-map", "0:a?",
+            "-c", "copy", "-flush_packets", "1",
+        ] + STREAM_FORMATS[fmt]
+        run_ffmpeg(args + [target], duration=target_seconds, on_progress=on_progress,
+                   cancel=cancel, stdout=stdout)
+    finally:
+        if temp_dir is not None:
+            shutil.rmtree(temp_dir, ignore_errors=True)
+
+
+def _stderr_logger(step=10):
+    # Đầu ra media có thể đang đi qua stdout, nên tiến trình in ra stderr
+    state = {"next": step}
+
+    def log(info):
+        if info.percent >= state["next"] or (info.done and state["next"] <= 100):
+            state["next"] = (int(info.percent) // step + 1) * step
+            print(f"… {info.describe()}", file=sys.stderr, flush=True)
+
+    return log
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Export loop dạng luồng (không ghi file đầy đủ)")
+    parser.add_argument("input")
+    parser.add_argument("seconds", type=float, help="Thời lượng đầu ra (giây)")
+    parser.add_argument("sink", help='"-" (stdout), đường dẫn/named pipe, hoặc URL như tcp://host:port?listen=1')
+    parser.add_argument("--format", choices=sorted(STREAM_FORMATS), default="mp4")
+    parser.add_argument("--mode", choices=EXPORT_MODES, default="stream_loop")
+    parser.add_argument("--loop", nargs=2, type=float, metavar=("START", "END"),
+                        help="Chỉ lặp đoạn [START, END) giây")
+    parser.add_argument("--fade", type=float, default=DEFAULT_FADE_SECONDS)
+    parser.add_argument("--realtime", action="store_true",
+                        help="Phát đúng tốc độ thực (-re), dùng khi đích là trình phát")
+    parser.add_argument("--progress", action="store_true", help="In tiến trình ra stderr")
+    args = parser.parse_args(argv)
+
+    try:
+        stream_export(
+            args.input, args.seconds, args.sink, fmt=args.format, mode=args.mode,
+            loop_range=tuple(args.loop) if args.loop else None, fade_seconds=args.fade,
+            realtime=args.realtime, on_progress=_stderr_logger() if args.progress else None
+        )
+    except (LoopExportError, FFmpegError, OSError) as e:
+        print(f"❌ {e}", file=sys.stderr)
+        return 1
+    except KeyboardInterrupt:
+        return 130
+    print(f"✅ Đã ghi {format_seconds(args.seconds)} vào {args.sink}", file=sys.stderr)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
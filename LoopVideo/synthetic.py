@@ -0,0 +1,27 @@
+"""Tạo video tổng hợp (testsrc + sine) bằng ffmpeg để benchmark mà không cần file mẫu"""
+import os
+
+from ffmpeg_utils import run_ffmpeg
+
+
+def make_test_clip(path, duration=3.0, size="640x360", fps=30, vcodec="libx264",
+                   audio=True, gop=None):
+    if os.path.exists(path):
+        return path
+    args = [
+        "-f", "lavfi",
+        "-i", f"testsrc=size={size}:rate={fps}:duration={duration}",
+    ]
+    if audio:
+        args += [
+            "-f", "lavfi",
+            "-i", f"sine=frequency=440:sample_rate=48000:duration={duration}",
+        ]
+    args += ["-c:v", vcodec, "-pix_fmt", "yuv420p"]
+    if gop:
+        args += ["-g", str(gop)]
+    if audio:
+        args += ["-c:a", "aac", "-shortest"]
+    args.append(path)
+    run_ffmpeg(args)
+    return path
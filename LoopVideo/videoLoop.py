@@ -1,15 +1,32 @@
 import tkinter as tk
 from tkinter import filedialog, messagebox, ttk, simpledialog
-import cv2
-from PIL import Image, ImageTk
 import threading
 import os
-import time
-import subprocess
-import tempfile
-import shutil
+import queue
 from tkinter.font import Font
-from moviepy.editor import VideoFileClip, concatenate_videoclips
+from ffmpeg_utils import FFmpegCancelled, FFmpegError
+from loop_engine import LoopExportError, plan_target
+from export_job import ExportJob
+from media_index import load_index
+from instrument import Instrument
+
+# Chu kỳ (ms) luồng Tk đọc sự kiện từ các luồng nền (export, phân tích)
+EXPORT_POLL_MS = 100
+# Sau bao lâu (ms) kể từ khi dựng cửa sổ thì nạp sẵn numpy và backend giải mã cho preview
+PRELOAD_DELAY_MS = int(os.environ.get("VIDEOLOOP_PRELOAD_MS", "1500"))
+# Chu kỳ (ms) cập nhật overlay thống kê
+STATS_REFRESH_MS = 500
+
+
+def _parse_loop_window(text):
+    """"2-10" → (2.0, 10.0), "1-" → (1.0, None); ném ValueError nếu không hợp lệ"""
+    low, _, high = text.strip().partition("-")
+    min_length = float(low) if low.strip() else 1.0
+    max_length = float(high) if high.strip() else None
+    if min_length <= 0 or (max_length is not None and max_length < min_length):
+        raise ValueError(text)
+    return min_length, max_length
+
 
 class VideoLooperApp:
     def __init__(self, root):
@@ -27,14 +44,24 @@ class VideoLooperApp:
         self.accent_color = '#1976d2'
 
         self.video_path = None
-        self.cap = None
+        self.media = None
         self.frame_rate = 30
         self.frame_count = 0
         self.is_playing = False
-        self.play_thread = None
+        self.preview = None
+        # Tạo khi preview lần đầu, cùng lúc nạp numpy và backend giải mã
+        self.frame_cache = None
         self.exporting = False
-        self.export_progress_thread = None
-        self.export_stop_flag = False
+        self.export_queue = queue.Queue()
+        self.export_cancel = threading.Event()
+        self.loop_range = None
+        self.keyframes = None
+        self.analyzing = False
+        self.analysis_queue = queue.Queue()
+        self.probe_queue = queue.Queue()
+        # Đo đạc preview/export: tắt mặc định (VIDEOLOOP_STATS=1 để bật), F3 bật overlay, F4 lưu trace
+        self.stats = Instrument(trace=True)
+        self.stats_overlay = None
 
         style = ttk.Style()
         style.configure('Custom.TButton', padding=10, font=self.button_font)
@@ -42,6 +69,62 @@ class VideoLooperApp:
         style.configure('Custom.Horizontal.TProgressbar', background=self.primary_color)
 
         self.setup_ui()
+        self.root.bind("<F3>", lambda event: self.toggle_stats_overlay())
+        self.root.bind("<F4>", lambda event: self.export_stats())
+        if self.stats.enabled:
+            self.toggle_stats_overlay()
+        # Nạp sẵn backend preview trên luồng phụ khi cửa sổ đã hiện và đang rảnh
+        self.root.after(PRELOAD_DELAY_MS, self._preload_backends)
+
+    def toggle_stats_overlay(self):
+        if self.stats_overlay is not None:
+            self.stats_overlay.destroy()
+            self.stats_overlay = None
+            self.stats.enabled = False
+            return
+        self.stats.enabled = True
+        self.stats_overlay = tk.Label(
+            self.root, text="", justify=tk.LEFT, anchor="nw",
+            font=("Courier", 9), bg='#000000', fg='#00ff66', padx=6, pady=4
+        )
+        self.stats_overlay.place(relx=0.01, rely=0.01, anchor=tk.NW)
+        self._refresh_stats_overlay()
+
+    def _refresh_stats_overlay(self):
+        if self.stats_overlay is None:
+            return
+        self.stats_overlay.config(text=self.stats.describe() or "Chưa có số liệu (F4: lưu trace)")
+        self.root.after(STATS_REFRESH_MS, self._refresh_stats_overlay)
+
+    def export_stats(self):
+        if not self.stats.enabled and not self.stats.stages:
+            messagebox.showinfo("Thông báo", "Chưa bật đo đạc (F3).")
+            return
+        path = filedialog.asksaveasfilename(
+            defaultextension=".json",
+            filetypes=[("JSON", "*.json")],
+            title="Lưu số liệu/trace (mở được bằng Perfetto hoặc chrome://tracing)"
+        )
+        if path:
+            try:
+                self.stats.export(path)
+            except OSError as e:
+                messagebox.showerror("Lỗi", f"Không ghi được file: {e}")
+
+    def _preload_backends(self):
+        def preload():
+            try:
+                import preview  # kéo theo numpy
+                from backends import BackendError, get_backend
+            except ImportError:
+                return
+            try:
+                # Nạp luôn thư viện của backend giải mã mặc định (cv2 nếu có)
+                get_backend().load()
+            except (BackendError, ImportError):
+                pass
+
+        threading.Thread(target=preload, daemon=True).start()
 
     def setup_ui(self):
         main_frame = ttk.Frame(self.root, padding="20", style='Custom.TFrame')
@@ -92,8 +175,11 @@ class VideoLooperApp:
         
         buttons = [
             ("▶️ Xem Loop", self.start_loop),
+            ("🔍 Tìm điểm loop", self.find_loop_points),
             ("⏹️ Dừng", self.stop_loop),
-            ("💾 Export Video", self.export_loop)
+            ("💾 Export Video", self.export_loop),
+            ("🎞️ Export playlist", self.export_playlist),
+            ("⛔ Hủy export", self.cancel_export)
         ]
         
         for text, command in buttons:
@@ -114,80 +200,201 @@ class VideoLooperApp:
 
     def load_video(self):
         self.stop_loop()
-        self.video_path = filedialog.askopenfilename(
+        video_path = filedialog.askopenfilename(
             filetypes=[("Video files", "*.mp4 *.avi *.mov *.mkv *.wmv"), ("All files", "*.*")],
             title="Chọn video"
         )
-        if not self.video_path:
+        # Hủy hộp thoại hoặc chọn file lỗi thì giữ nguyên video đang mở
+        if not video_path:
             messagebox.showinfo("Thông báo", "Không chọn video nào.")
             return
 
-        if not os.path.isfile(self.video_path):
-            messagebox.showerror("Lỗi", f"File không tồn tại: {self.video_path}")
+        if not os.path.isfile(video_path):
+            messagebox.showerror("Lỗi", f"File không tồn tại: {video_path}")
             return
 
-        print(f"Đường dẫn: {self.video_path}")
-        print(f"Các file trong thư mục: {os.listdir(os.path.dirname(self.video_path))}")
-
-        self.label_path.config(text=os.path.basename(self.video_path))
-        self.cap = cv2.VideoCapture(self.video_path)
+        self.video_path = video_path
+        self.media = None
+        self.loop_range = None
+        self.keyframes = None
+        # Lần đầu phải đọc packet bằng ffprobe (chạy nền), các lần sau lấy từ cache chỉ mục
+        self.label_path.config(text=f"{os.path.basename(self.video_path)} • Đang đọc thông tin video...")
+        threading.Thread(target=self._load_index, args=(self.video_path,), daemon=True).start()
+        self.root.after(EXPORT_POLL_MS, self._poll_probe_queue)
+
+    def _load_index(self, video_path):
+        # Chạy trên luồng phụ, kết quả trả về qua probe_queue
+        try:
+            self.probe_queue.put(("done", load_index(video_path)))
+        except (FFmpegError, OSError, ValueError) as e:
+            self.probe_queue.put(("error", (video_path, f"Không mở được video:\n{video_path}\n{e}")))
 
-        if not self.cap.isOpened():
-            messagebox.showerror("Lỗi", f"Không mở được video:\n{self.video_path}")
-            self.cap = None
+    def _poll_probe_queue(self):
+        try:
+            kind, payload = self.probe_queue.get_nowait()
+        except queue.Empty:
+            self.root.after(EXPORT_POLL_MS, self._poll_probe_queue)
             return
 
-        self.frame_rate = self.cap.get(cv2.CAP_PROP_FPS)
-        self.frame_count = int(self.cap.get(cv2.CAP_PROP_FRAME_COUNT))
+        video_path = payload[0] if kind == "error" else payload.path
+        if video_path != self.video_path:
+            # Người dùng đã chọn video khác trong lúc chờ
+            return
+        self.label_path.config(text=os.path.basename(self.video_path))
+        if kind == "error":
+            messagebox.showerror("Lỗi", payload[1])
+            return
 
-        if self.frame_count == 0 or self.frame_rate == 0:
+        index = payload
+        if index.frame_count == 0 or index.fps == 0:
             messagebox.showerror("Lỗi", "Video không hợp lệ hoặc không chứa frame.")
-            self.cap.release()
-            self.cap = None
             return
 
-        duration = self.frame_count / self.frame_rate
-        messagebox.showinfo("Thông tin", f"Video: {os.path.basename(self.video_path)}\nThời lượng: {duration:.2f} giây")
+        self.media = index
+        self.frame_rate = index.fps
+        self.frame_count = index.frame_count
+        self.keyframes = index.keyframes
+        messagebox.showinfo(
+            "Thông tin",
+            f"Video: {os.path.basename(self.video_path)}\n"
+            f"Thời lượng: {index.duration:.2f} giây ({index.frame_count} frame, {index.fps:.3f} fps)\n"
+            f"Độ phân giải: {index.width}x{index.height}"
+        )
 
     def start_loop(self):
-        if self.is_playing or not self.cap:
+        if self.is_playing or not self.media:
             return
 
+        if self.loop_range:
+            self.play_loop(self.loop_range.start_frame, self.loop_range.end_frame)
+        else:
+            self.play_loop(0, self.frame_count - 1)
+
+    def play_loop(self, start_frame, end_frame):
+        # Import muộn: cửa sổ hiện ra không phải chờ nạp numpy và backend giải mã
+        from preview import FrameCache, PreviewPipeline
+
+        if self.frame_cache is None:
+            self.frame_cache = FrameCache()
+        # Giải mã/thu nhỏ chạy nền, hiển thị được lập lịch trên luồng Tk bằng after()
         self.is_playing = True
-        self.play_thread = threading.Thread(
-            target=self.play_loop,
-            args=(0, self.frame_count - 1),
-            daemon=True
+        self.preview = PreviewPipeline(
+            self.video_path, start_frame, end_frame, self.frame_rate,
+            display=self._show_frame,
+            schedule=self.root.after,
+            cache=self.frame_cache,
+            on_error=self._on_preview_error,
+            seek_frame=self.media.seek_frame(start_frame),
+            stats=self.stats
         )
-        self.play_thread.start()
+        self.preview.start()
 
-    def play_loop(self, start_frame, end_frame):
-        while self.is_playing:
-            self.cap.set(cv2.CAP_PROP_POS_FRAMES, start_frame)
-            for i in range(start_frame, end_frame + 1):
-                if not self.is_playing:
-                    break
-                ret, frame = self.cap.read()
-                if not ret:
-                    break
-                rgb = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
-                img = Image.fromarray(rgb)
-                img = img.resize((400, int(400 * frame.shape[0] / frame.shape[1])), Image.Resampling.LANCZOS)
-                photo = ImageTk.PhotoImage(img)
-                self.canvas.config(image=photo)
-                self.canvas.image = photo
-                self.canvas.update()
-                time.sleep(1.0 / self.frame_rate)
+    def _show_frame(self, frame):
+        from PIL import Image, ImageTk
+
+        with self.stats.stage("gui.photo"):
+            photo = ImageTk.PhotoImage(Image.fromarray(frame))
+        with self.stats.stage("gui.canvas"):
+            self.canvas.config(image=photo)
+            self.canvas.image = photo
+
+    def _on_preview_error(self, message):
+        self.stop_loop()
+        messagebox.showerror("Lỗi", message)
+
+    def find_loop_points(self):
+        if not self.media:
+            messagebox.showerror("Lỗi", "Chưa chọn video.")
+            return
+        if self.analyzing:
+            return
+
+        window = simpledialog.askstring(
+            "Độ dài đoạn loop",
+            "Độ dài đoạn loop (giây), dạng tối thiểu-tối đa, ví dụ 2-10\n"
+            "(bỏ trống tối đa nếu không giới hạn):",
+            initialvalue="1-"
+        )
+        if window is None:
+            return
+        try:
+            min_length, max_length = _parse_loop_window(window)
+        except ValueError:
+            messagebox.showerror("Lỗi", "Độ dài không hợp lệ, ví dụ: 2-10 hoặc 1-")
+            return
+
+        self.analyzing = True
+        self.label_path.config(text=f"{os.path.basename(self.video_path)} • Đang tìm điểm loop...")
+        threading.Thread(
+            target=self._analyze_loop, args=(self.video_path, min_length, max_length), daemon=True
+        ).start()
+        self.root.after(EXPORT_POLL_MS, self._poll_analysis_queue)
+
+    def _analyze_loop(self, video_path, min_length=1.0, max_length=None):
+        # Chạy trên luồng phụ, kết quả trả về qua analysis_queue
+        try:
+            from loop_finder import analyze
+
+            try:
+                index = load_index(video_path)
+                keyframes, fps = index.keyframes, index.fps
+            except (FFmpegError, OSError, ValueError):
+                keyframes = fps = None
+            best, candidates, _ = analyze(video_path, keyframes, min_length=min_length,
+                                          max_length=max_length, fps=fps)
+            self.analysis_queue.put(("done", (video_path, best, candidates, keyframes)))
+        except Exception as e:
+            self.analysis_queue.put(("error", f"Lỗi khi tìm điểm loop: {str(e)}"))
+
+    def _poll_analysis_queue(self):
+        try:
+            kind, payload = self.analysis_queue.get_nowait()
+        except queue.Empty:
+            self.root.after(EXPORT_POLL_MS, self._poll_analysis_queue)
+            return
+
+        self.analyzing = False
+        if self.video_path:
+            self.label_path.config(text=os.path.basename(self.video_path))
+        if kind == "error":
+            messagebox.showerror("Lỗi", payload)
+            return
+
+        video_path, best, candidates, keyframes = payload
+        if video_path != self.video_path:
+            return
+        if best is None:
+            messagebox.showinfo("Thông báo", "Không tìm được điểm loop phù hợp.")
+            return
+
+        self.loop_range = best
+        self.keyframes = keyframes
+        lines = [
+            f"{c.start_seconds:.2f}s → {c.end_seconds:.2f}s (độ lệch {c.score:.3f})"
+            for c in candidates
+        ]
+        messagebox.showinfo(
+            "Điểm loop",
+            f"Đã chọn: {best.start_seconds:.2f}s → {best.end_seconds:.2f}s "
+            f"({best.duration:.2f} giây, độ lệch {best.score:.3f})\n\n"
+            "Các ứng viên:\n" + "\n".join(lines)
+        )
+
+        # Xem lại ngay đoạn loop vừa chọn
+        if self.is_playing:
+            self.stop_loop()
+            self.start_loop()
 
     def stop_loop(self):
         self.is_playing = False
-        if self.play_thread:
-            self.play_thread.join()
+        if self.preview:
+            self.preview.stop()
+            self.preview = None
         self.canvas.config(image='')
         self.canvas.image = None
 
     def export_loop(self):
-        if not self.cap:
+        if not self.media:
             messagebox.showerror("Lỗi", "Chưa chọn video.")
             return
 
@@ -203,12 +410,22 @@ class VideoLooperApp:
         if not loop_minutes:
             return
 
-        loop_duration = self.frame_count / self.frame_rate
-        total_loops = int((loop_minutes * 60) / loop_duration)
-        if total_loops < 1:
-            messagebox.showerror("Lỗi", "Thời gian quá ngắn để lặp.")
+        if self.loop_range:
+            loop_duration = self.loop_range.duration
+        else:
+            loop_duration = self.media.duration
+        try:
+            target_seconds, total_loops = plan_target(loop_duration, loop_minutes)
+        except LoopExportError as e:
+            messagebox.showerror("Lỗi", str(e))
             return
 
+        # Crossfade chỉ mã hóa lại đoạn quanh mối nối, phần còn lại vẫn copy
+        mode = "crossfade" if messagebox.askyesno(
+            "Mối nối",
+            "Hòa dần (crossfade) ở mối nối loop?\n(Không: nối thẳng, nhanh nhất)"
+        ) else "stream_loop"
+
         save_path = filedialog.asksaveasfilename(
             defaultextension=".mp4",
             filetypes=[("MP4 files", "*.mp4")],
@@ -217,14 +434,27 @@ class VideoLooperApp:
         if not save_path:
             return
 
-        # Tạo thư mục tạm
-        temp_dir = tempfile.mkdtemp()
-        
+        loop_range = None
+        if self.loop_range:
+            loop_range = (self.loop_range.start_seconds, self.loop_range.end_seconds)
+        job = ExportJob(
+            self.video_path, target_seconds, save_path,
+            mode=mode, loop_range=loop_range, keyframes=self.keyframes
+        )
+        if job.resumable and not messagebox.askyesno(
+            "Export dở dang",
+            "Có một lần export chưa xong với cùng thông số.\nTiếp tục từ phần đã xong?"
+        ):
+            job.discard()
+
+        self._start_export(self._export_loop_ffmpeg, (job, total_loops))
+
+    def _start_export(self, worker, args):
         # Hiển thị thông tin export
         self.exporting = True
-        self.export_stop_flag = False
+        self.export_cancel.clear()
         self.root.title("🎞️ Video Looper - Đang export...")
-        
+
         # Hiển thị label thông tin export
         self.export_info_label = tk.Label(
             self.root,
@@ -237,170 +467,149 @@ class VideoLooperApp:
             relief=tk.RIDGE
         )
         self.export_info_label.place(relx=0.5, rely=0.9, anchor=tk.CENTER)
-        
-        # Cập nhật giao diện
+
+        # Thiết lập thanh tiến trình
         self.progress['value'] = 0
-        self.root.update()
-        
-        # Bắt đầu luồng export
-        threading.Thread(
-            target=self._export_loop_ffmpeg,
-            args=(total_loops, save_path, temp_dir),
-            daemon=True
-        ).start()
+        self.progress['maximum'] = 100
+
+        # Bắt đầu luồng export, kết quả trả về qua export_queue
+        threading.Thread(target=worker, args=args, daemon=True).start()
+        self.root.after(EXPORT_POLL_MS, self._poll_export_queue)
+
+    def export_playlist(self):
+        if self.exporting:
+            messagebox.showinfo("Thông báo", "Đang export, vui lòng chờ.")
+            return
+
+        clips = filedialog.askopenfilenames(
+            title="Chọn các clip (theo thứ tự phát)",
+            filetypes=[("Video files", "*.mp4 *.avi *.mov *.mkv")]
+        )
+        if not clips:
+            return
+
+        loop_minutes = simpledialog.askfloat(
+            "Thời gian lặp",
+            "Nhập thời gian lặp cả playlist (phút):",
+            minvalue=0.1
+        )
+        if not loop_minutes:
+            return
+
+        save_path = filedialog.asksaveasfilename(
+            defaultextension=".mp4",
+            filetypes=[("MP4 files", "*.mp4")],
+            title="Lưu video playlist"
+        )
+        if not save_path:
+            return
+
+        self._start_export(self._export_playlist_ffmpeg, (list(clips), loop_minutes * 60, save_path))
+
+    def _export_playlist_ffmpeg(self, clips, target_seconds, save_path):
+        # Chạy trên luồng phụ; clip đã chuẩn hóa nằm trong cache nên lần sau nhanh hơn
+        from playlist import export_playlist
 
-    def _export_loop_ffmpeg(self, total_loops, save_path, temp_dir):
         try:
-            # Tạo danh sách tệp tạm
-            temp_files = []
-            
-            # Cập nhật label
-            if hasattr(self, 'export_info_label'):
-                self.export_info_label.config(text="Đang tạo file tạm...")
-                self.root.update_idletasks()
-            
-            # Tạo file tạm để nối
-            temp_list_file = os.path.join(temp_dir, "file_list.txt")
-            with open(temp_list_file, "w") as f:
-                for i in range(total_loops):
-                    f.write(f"file '{self.video_path}'\n")
-            
-            # Cập nhật label
-            if hasattr(self, 'export_info_label'):
-                self.export_info_label.config(text="Đang export video...")
-                self.root.update_idletasks()
-            
-            # Thiết lập thanh tiến trình
-            self.progress['value'] = 0
-            self.progress['maximum'] = 100
-            
-            # Bắt đầu luồng theo dõi tiến trình
-            self.export_progress_thread = threading.Thread(
-                target=self._monitor_ffmpeg_progress,
-                args=(save_path,),
-                daemon=True
+            reel = export_playlist(
+                clips, target_seconds, save_path,
+                on_progress=lambda info: self.export_queue.put(("progress", info)),
+                cancel=self.export_cancel,
+                stats=self.stats
             )
-            self.export_progress_thread.start()
-            
-            # Chạy ffmpeg để nối video
-            cmd = [
-                "ffmpeg", "-y", "-f", "concat", "-safe", "0", 
-                "-i", temp_list_file, "-c", "copy", save_path
-            ]
-            
-            process = subprocess.Popen(
-                cmd, 
-                stdout=subprocess.PIPE, 
-                stderr=subprocess.PIPE
+            self.export_queue.put((
+                "done",
+                f"Đã xuất playlist ({reel.describe()}) dài {target_seconds / 60:g} phút tại:\n{save_path}"
+            ))
+        except FFmpegCancelled:
+            self.export_queue.put((
+                "cancelled",
+                "Đã hủy export.\nCác clip đã chuẩn hóa được giữ lại cho lần sau."
+            ))
+        except FFmpegError as e:
+            self.export_queue.put(("error", f"Lỗi khi export playlist với ffmpeg\n{e}"))
+        except Exception as e:
+            self.export_queue.put(("error", f"Lỗi khi export playlist: {str(e)}"))
+
+    def _export_loop_ffmpeg(self, job, total_loops):
+        # Chạy trên luồng phụ: không gọi Tk trực tiếp, chỉ đẩy sự kiện vào queue
+        try:
+            job.run(
+                on_progress=lambda info: self.export_queue.put(("progress", info)),
+                cancel=self.export_cancel,
+                stats=self.stats
             )
-            
-            # Đợi quá trình hoàn thành
-            process.communicate()
-            
-            # Đánh dấu kết thúc
-            self.export_stop_flag = True
-            if self.export_progress_thread:
-                self.export_progress_thread.join(timeout=1.0)
-            
-            # Kiểm tra kết quả
-            if process.returncode != 0:
-                messagebox.showerror("Lỗi", "Lỗi khi export video với ffmpeg")
-                if os.path.exists(save_path):
-                    os.remove(save_path)
-            else:
-                # Cập nhật tiến trình hoàn thành
-                self.progress['value'] = 100
-                if hasattr(self, 'export_info_label'):
-                    self.export_info_label.config(text="Hoàn thành export video!")
-                    self.root.update_idletasks()
-                
-                # Hiển thị thông báo thành công
-                messagebox.showinfo("✅ Thành công", f"Đã xuất video loop {total_loops} lần tại:\n{save_path}")
-        
+            self.export_queue.put((
+                "done",
+                f"Đã xuất video loop {total_loops:.1f} lần ({job.target_seconds / 60:g} phút) tại:\n{job.save_path}"
+            ))
+        except FFmpegCancelled:
+            self.export_queue.put((
+                "cancelled",
+                "Đã hủy export.\nLần export sau với cùng thông số sẽ tiếp tục từ phần đã xong."
+            ))
+        except FFmpegError as e:
+            self.export_queue.put(("error", f"Lỗi khi export video với ffmpeg\n{e}"))
         except Exception as e:
-            messagebox.showerror("Lỗi", f"Lỗi khi export: {str(e)}")
-        
-        finally:
-            # Dọn dẹp
-            self.export_stop_flag = True
-            self.exporting = False
-            self.root.title("🎞️ Video Looper")
-            
-            # Xóa label thông tin
+            self.export_queue.put(("error", f"Lỗi khi export: {str(e)}"))
+
+    def cancel_export(self):
+        if self.exporting:
+            self.export_cancel.set()
             if hasattr(self, 'export_info_label'):
-                self.export_info_label.destroy()
-            
-            # Xóa thư mục tạm
-            try:
-                shutil.rmtree(temp_dir)
-            except:
-                pass
-            
-            # Reset thanh tiến trình
-            self.progress['value'] = 0
+                self.export_info_label.config(text="Đang hủy export...")
 
-    def _monitor_ffmpeg_progress(self, output_file):
-        """Theo dõi tiến trình ffmpeg bằng cách kiểm tra kích thước file đầu ra"""
-        if not os.path.exists(os.path.dirname(output_file)):
-            return
-            
-        # Lấy kích thước video gốc
-        original_size = os.path.getsize(self.video_path)
-        expected_size = original_size * 0.95  # Dự đoán kích thước
-        
-        # Đợi cho file đầu ra được tạo
-        start_time = time.time()
-        while not os.path.exists(output_file) and time.time() - start_time < 5:
-            time.sleep(0.5)
-            
-        if not os.path.exists(output_file):
+    def _poll_export_queue(self):
+        """Nhận sự kiện từ luồng export và cập nhật giao diện trên luồng Tk"""
+        latest = None
+        finished = None
+        try:
+            while True:
+                kind, payload = self.export_queue.get_nowait()
+                if kind == "progress":
+                    latest = payload
+                else:
+                    finished = (kind, payload)
+        except queue.Empty:
+            pass
+
+        if latest is not None:
+            self.progress['value'] = latest.percent
+            self.root.title(f"🎞️ Video Looper - Đang export... {latest.percent:.0f}%")
+            if hasattr(self, 'export_info_label'):
+                self.export_info_label.config(text=f"Đang export video... {latest.describe()}")
+
+        if finished is None:
+            if self.exporting:
+                self.root.after(EXPORT_POLL_MS, self._poll_export_queue)
             return
-            
-        # Theo dõi kích thước file
-        last_size = 0
-        stalled_count = 0
-        
-        while not self.export_stop_flag:
-            try:
-                if os.path.exists(output_file):
-                    current_size = os.path.getsize(output_file)
-                    
-                    # Tính phần trăm tiến trình
-                    progress = min(99, int((current_size / expected_size) * 100))
-                    
-                    # Kiểm tra nếu kích thước không thay đổi
-                    if current_size == last_size:
-                        stalled_count += 1
-                    else:
-                        stalled_count = 0
-                        last_size = current_size
-                    
-                    # Nếu kích thước không thay đổi trong 10 lần kiểm tra, tăng tiến trình
-                    if stalled_count > 10:
-                        progress = min(99, progress + 1)
-                        stalled_count = 0
-                    
-                    # Cập nhật thanh tiến trình
-                    self.progress['value'] = progress
-                    
-                    # Cập nhật tiêu đề và label thông tin
-                    self.root.title(f"🎞️ Video Looper - Đang export... {progress}%")
-                    if hasattr(self, 'export_info_label'):
-                        self.export_info_label.config(text=f"Đang export video... {progress}%")
-                    
-                    self.root.update_idletasks()
-            except:
-                pass
-                
-            time.sleep(0.5)
+
+        kind, message = finished
+        if kind == "done":
+            self.progress['value'] = 100
+            if hasattr(self, 'export_info_label'):
+                self.export_info_label.config(text="Hoàn thành export video!")
+            messagebox.showinfo("✅ Thành công", message)
+        elif kind == "cancelled":
+            messagebox.showinfo("Thông báo", message)
+        else:
+            messagebox.showerror("Lỗi", message)
+
+        # Dọn dẹp
+        self.exporting = False
+        self.root.title("🎞️ Video Looper")
+        if hasattr(self, 'export_info_label'):
+            self.export_info_label.destroy()
+            del self.export_info_label
+        self.progress['value'] = 0
 
     def stop(self):
         self.is_playing = False
         self.exporting = False
-        if self.play_thread:
-            self.play_thread.join()
-        if self.cap:
-            self.cap.release()
+        # Dừng ffmpeg đang chạy; job giữ nguyên để lần sau tiếp tục
+        self.export_cancel.set()
+        if self.preview:
+            self.preview.stop()
         self.root.destroy()
 
 if __name__ == "__main__":